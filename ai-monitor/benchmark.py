@@ -0,0 +1,478 @@
+"""
+Offline benchmark for AiMonitor.run_once.
+
+Starts local stand-ins for Prometheus (HTTP), the Docker Engine API (Unix socket) and the
+HTTP check targets, then runs the monitor against them in a child process so its CPU and
+memory are measured in isolation. The LLM is replaced by an in-process stub with a fixed
+latency. Results for every (containers, http_checks, scenario) case are written as JSON.
+
+    python benchmark.py                                   # full matrix -> benchmark-results.json
+    python benchmark.py --containers 10,100 --http-checks 1 --cycles 3 --output /tmp/quick.json
+
+Scenarios:
+    healthy  every container running (half with a passing healthcheck), all targets up
+    storm    each cycle a rotating 20% of containers is unhealthy or exited, 3 Prometheus
+             targets are down and 20% of HTTP checks fail
+"""
+
+import argparse
+import json
+import os
+import platform
+import re
+import resource
+import socketserver
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+STORM_FRACTION = 5  # 1 in 5 containers fails per cycle in the storm scenario
+API_VERSION = "1.43"
+
+
+def _rfc3339(ts: float) -> str:
+    return datetime.fromtimestamp(ts, timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f000Z")
+
+
+class _QuietHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    def _send(self, status: int, body: bytes = b"", content_type: str = "application/json") -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+    def _send_json(self, payload: Any, status: int = 200) -> None:
+        self._send(status, json.dumps(payload).encode())
+
+
+# ------------------------------- Prometheus ------------------------------------
+class FakePrometheus:
+    """/api/v1/query and /api/v1/query_range with a fixed latency and series count."""
+
+    def __init__(self, latency_seconds: float, series: int, storm: bool) -> None:
+        fake = self
+
+        class Handler(_QuietHandler):
+            def do_GET(self) -> None:
+                url = urlparse(self.path)
+                query = (parse_qs(url.query).get("query") or [""])[0]
+                time.sleep(fake.latency_seconds)
+                if url.path == "/api/v1/query":
+                    self._send_json(fake.vector(query))
+                elif url.path == "/api/v1/query_range":
+                    self._send_json(fake.matrix(query))
+                else:
+                    self._send(404)
+
+        self.latency_seconds = latency_seconds
+        self.series = series
+        self.storm = storm
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def _labels(self, i: int) -> Dict[str, str]:
+        return {"name": f"bench-{i:04d}", "job": "cadvisor", "instance": f"node-{i % 4}:8080"}
+
+    def vector(self, query: str) -> Dict[str, Any]:
+        now = time.time()
+        if query.startswith("up == 0"):
+            down = 3 if self.storm else 0
+            result = [{"metric": {"__name__": "up", "job": f"job-{i}", "instance": f"host-{i}:9100"}, "value": [now, "0"]}
+                      for i in range(down)]
+        else:
+            result = [{"metric": self._labels(i), "value": [now, str(1_000_000 * (i + 1))]} for i in range(self.series)]
+        return {"status": "success", "data": {"resultType": "vector", "result": result}}
+
+    def matrix(self, query: str) -> Dict[str, Any]:
+        now = time.time()
+        result = [
+            {"metric": self._labels(i), "values": [[now - 300 * k, str(1_000_000 * (i + 1) + k)] for k in range(12, 0, -1)]}
+            for i in range(self.series)
+        ]
+        return {"status": "success", "data": {"resultType": "matrix", "result": result}}
+
+    def start(self) -> None:
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+# --------------------------------- Docker --------------------------------------
+class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class FakeDocker:
+    """
+    The subset of the Engine API the monitor uses, served on a Unix socket. Every
+    unfiltered container listing advances the script by one cycle, which is what rotates
+    the failing containers in the storm scenario.
+    """
+
+    def __init__(self, socket_path: str, containers: int, storm: bool) -> None:
+        fake = self
+
+        class Handler(_QuietHandler):
+            def address_string(self) -> str:
+                return "docker.sock"
+
+            def do_GET(self) -> None:
+                fake.handle_get(self)
+
+            def do_POST(self) -> None:
+                length = int(self.headers.get("Content-Length") or 0)
+                if length:
+                    self.rfile.read(length)
+                fake.handle_post(self)
+
+        self.containers = containers
+        self.storm = storm
+        self.cycle = 0
+        self._lock = threading.Lock()
+        self.socket_path = socket_path
+        self.server = _UnixHTTPServer(socket_path, Handler)
+
+    def _state(self, i: int) -> Dict[str, Any]:
+        if self.storm and i % STORM_FRACTION == self.cycle % STORM_FRACTION:
+            if i % 2:
+                return {"Status": "exited", "ExitCode": 137}
+            return {"Status": "running", "ExitCode": 0, "Health": {"Status": "unhealthy"}}
+        state: Dict[str, Any] = {"Status": "running", "ExitCode": 0}
+        if i % 2 == 0:
+            state["Health"] = {"Status": "healthy"}
+        return state
+
+    def _index(self, ident: str) -> Optional[int]:
+        match = re.fullmatch(r"bench-(\d+)", ident)
+        if not match or int(match.group(1)) >= self.containers:
+            return None
+        return int(match.group(1))
+
+    def _summary(self, i: int) -> Dict[str, Any]:
+        state = self._state(i)
+        health = (state.get("Health") or {}).get("Status")
+        if state["Status"] == "exited":
+            status = f"Exited ({state['ExitCode']}) 1 minute ago"
+        else:
+            status = "Up 2 hours" + (f" ({health})" if health else "")
+        return {
+            "Id": f"bench-{i:04d}",
+            "Names": [f"/bench-{i:04d}"],
+            "Image": "bench:latest",
+            "State": state["Status"],
+            "Status": status,
+            "Labels": {"com.docker.compose.project": "bench", "com.docker.compose.service": f"svc-{i:04d}"},
+        }
+
+    def handle_get(self, req: _QuietHandler) -> None:
+        url = urlparse(req.path)
+        path = re.sub(r"^/v[\d.]+", "", url.path)
+        params = parse_qs(url.query)
+        if path == "/_ping":
+            req._send(200, b"OK", "text/plain")
+        elif path == "/version":
+            req._send_json({"ApiVersion": API_VERSION, "MinAPIVersion": "1.24", "Version": "24.0.0"})
+        elif path == "/containers/json":
+            filters = json.loads((params.get("filters") or ["{}"])[0])
+            if not filters:
+                with self._lock:
+                    self.cycle += 1
+            rows = [self._summary(i) for i in range(self.containers)]
+            if "health" in filters:
+                rows = [r for r in rows if r["Status"].endswith(f"({filters['health'][0]})")]
+            if "status" in filters:
+                rows = [r for r in rows if r["State"] in filters["status"]]
+            req._send_json(rows)
+        elif path.startswith("/containers/") and path.endswith("/json"):
+            i = self._index(path.split("/")[2])
+            if i is None:
+                req._send_json({"message": "No such container"}, 404)
+                return
+            req._send_json({
+                "Id": f"bench-{i:04d}",
+                "Name": f"/bench-{i:04d}",
+                "State": self._state(i),
+                "Config": {"Tty": False, "Labels": self._summary(i)["Labels"]},
+            })
+        elif path.startswith("/containers/") and path.endswith("/logs"):
+            now = time.time()
+            lines = [
+                f"{_rfc3339(now - 3)} level=info msg=\"request served\"",
+                f"{_rfc3339(now - 2)} level=error msg=\"upstream connection refused\"",
+                f"{_rfc3339(now - 1)} level=info msg=\"retrying\"",
+            ]
+            body = b"".join(self._frame(line + "\n") for line in lines)
+            req._send(200, body, "application/vnd.docker.raw-stream")
+        else:
+            req._send_json({"message": "not implemented"}, 404)
+
+    def handle_post(self, req: _QuietHandler) -> None:
+        path = re.sub(r"^/v[\d.]+", "", urlparse(req.path).path)
+        if path.startswith("/containers/") and path.endswith("/restart"):
+            req._send(204)
+        else:
+            req._send_json({"message": "not implemented"}, 404)
+
+    @staticmethod
+    def _frame(text: str) -> bytes:
+        # Multiplexed stdout frame: stream type, 3 padding bytes, big-endian payload size
+        payload = text.encode()
+        return bytes([1, 0, 0, 0]) + len(payload).to_bytes(4, "big") + payload
+
+    def start(self) -> None:
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+# ------------------------------ HTTP targets -----------------------------------
+class FakeTargets:
+    """HTTP check targets: /ok answers 200, /fail answers 503, both after a fixed latency."""
+
+    def __init__(self, latency_seconds: float) -> None:
+        fake = self
+
+        class Handler(_QuietHandler):
+            def do_GET(self) -> None:
+                time.sleep(fake.latency_seconds)
+                if self.path.startswith("/ok"):
+                    self._send(200, b"ok", "text/plain")
+                else:
+                    self._send(503, b"unavailable", "text/plain")
+
+        self.latency_seconds = latency_seconds
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def checks(self, count: int, storm: bool) -> str:
+        entries = []
+        for i in range(count):
+            path = "fail" if storm and i % STORM_FRACTION == 0 else "ok"
+            entries.append(f"{self.url}/{path}/{i}|200")
+        return ";".join(entries)
+
+    def start(self) -> None:
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+# --------------------------------- Child ---------------------------------------
+def _rss_bytes() -> int:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def run_case(cycles: int, warmup: int, llm_latency_seconds: float, triage_wait_seconds: float) -> Dict[str, Any]:
+    """Runs inside the child process; the environment already points at the stand-ins."""
+    import monitor
+    from prometheus_client import REGISTRY
+
+    m = monitor.AiMonitor()
+    llm_calls = 0
+
+    def stub_llm(snapshot: Dict[str, Any]) -> monitor.Triage:
+        nonlocal llm_calls
+        llm_calls += 1
+        m._build_triage_prompt(snapshot, "stub")  # compaction cost is part of a real call
+        time.sleep(llm_latency_seconds)
+        return monitor.Triage(summary="benchmark stub", severity="medium", confidence=0.9)
+
+    m.ask_llm_for_triage = stub_llm
+    upstream: List[Dict[str, int]] = []
+    publish = m._publish_task_calls
+
+    def capture_calls(task: str, calls: Dict[str, int]) -> Dict[str, int]:
+        upstream.append(publish(task, calls))
+        return calls
+
+    m._publish_task_calls = capture_calls
+    m._triage_worker.start()  # as in run_forever: triage never blocks the cycle
+
+    for _ in range(warmup):
+        m.run_once()
+    upstream.clear()
+
+    durations: List[float] = []
+    cpu_started = time.process_time()
+    for _ in range(cycles):
+        started = time.perf_counter()
+        m.run_once()
+        durations.append(time.perf_counter() - started)
+    cpu_seconds = time.process_time() - cpu_started
+    rss = _rss_bytes()
+    drained = m._triage_worker.join(triage_wait_seconds)
+
+    sources = sorted({s for calls in upstream for s in calls})
+    return {
+        "cycles": cycles,
+        "cycle_ms": {
+            "min": round(min(durations) * 1000, 2),
+            "p50": round(statistics.median(durations) * 1000, 2),
+            "p95": round(_percentile(durations, 95) * 1000, 2),
+            "max": round(max(durations) * 1000, 2),
+            "mean": round(statistics.fmean(durations) * 1000, 2),
+        },
+        "cpu_ms_per_cycle": round(cpu_seconds / cycles * 1000, 2),
+        "rss_mb": round(rss / 2**20, 1),
+        # ru_maxrss is KiB on Linux
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "upstream_calls_per_cycle": {
+            s: round(sum(calls.get(s, 0) for calls in upstream) / max(1, len(upstream)), 1) for s in sources
+        },
+        "triage": {
+            "llm_calls": llm_calls,
+            "cache_hits": int(REGISTRY.get_sample_value(
+                "ai_monitor_triage_cache_requests_total", {"result": "hit"}) or 0),
+            "dropped": int(sum(
+                REGISTRY.get_sample_value("ai_monitor_triage_requests_dropped_total", {"reason": r}) or 0
+                for r in ("replaced", "overflow")
+            )),
+            "drained": drained,
+        },
+    }
+
+
+# --------------------------------- Parent --------------------------------------
+def bench(containers: int, http_checks: int, scenario: str, args: argparse.Namespace) -> Dict[str, Any]:
+    storm = scenario == "storm"
+    with tempfile.TemporaryDirectory(prefix="ai-monitor-bench-") as tmp:
+        prom = FakePrometheus(args.prom_latency_ms / 1000, args.prom_series, storm)
+        dockerd = FakeDocker(os.path.join(tmp, "docker.sock"), containers, storm)
+        targets = FakeTargets(args.http_latency_ms / 1000)
+        for fake in (prom, dockerd, targets):
+            fake.start()
+        env = {
+            **os.environ,
+            "PROMETHEUS_URL": prom.url,
+            "AI_MONITOR_DOCKER_HOST": f"unix://{dockerd.socket_path}",
+            "AI_MONITOR_HTTP_CHECKS": targets.checks(http_checks, storm),
+            "AI_MONITOR_DOCKER_EVENTS_ENABLED": "false",
+            "AI_MONITOR_EXECUTE": "false",
+            "AI_MONITOR_PREDICTIVE_ENABLED": "false",
+            "AI_MONITOR_INCIDENT_REPORTS_ENABLED": "false",
+            "AI_MONITOR_STATE_FILE": "",
+            "AI_MONITOR_PROM_CACHE_TTL_SECONDS": "0",
+            "AI_MONITOR_LOG_LEVEL": "error",
+            "CLAUDE_API_KEY": "",
+            "GEMINI_API_KEY": "",
+        }
+        out_path = os.path.join(tmp, "result.json")
+        child = [
+            sys.executable, os.path.abspath(__file__), "--child", out_path,
+            "--cycles", str(args.cycles), "--warmup", str(args.warmup),
+            "--llm-latency-ms", str(args.llm_latency_ms),
+        ]
+        try:
+            proc = subprocess.run(child, env=env, capture_output=True, text=True, timeout=args.case_timeout)
+            if proc.returncode != 0:
+                raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "child failed")
+            with open(out_path) as f:
+                result = json.load(f)
+        finally:
+            for fake in (prom, dockerd, targets):
+                fake.stop()
+    return {"containers": containers, "http_checks": http_checks, "scenario": scenario, **result}
+
+
+def _int_list(value: str) -> List[int]:
+    return [int(v) for v in value.split(",") if v.strip()]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Offline AiMonitor.run_once benchmark")
+    parser.add_argument("--containers", type=_int_list, default=[10, 100, 1000])
+    parser.add_argument("--http-checks", type=_int_list, default=[1, 10, 100])
+    parser.add_argument("--scenarios", default="healthy,storm")
+    parser.add_argument("--cycles", type=int, default=5)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--prom-latency-ms", type=float, default=20.0)
+    parser.add_argument("--prom-series", type=int, default=50)
+    parser.add_argument("--http-latency-ms", type=float, default=5.0)
+    parser.add_argument("--llm-latency-ms", type=float, default=500.0)
+    parser.add_argument("--case-timeout", type=float, default=600.0)
+    parser.add_argument("--label", default="", help="free-form tag, e.g. a git revision")
+    parser.add_argument("--output", default="benchmark-results.json")
+    parser.add_argument("--child", metavar="RESULT_PATH", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        result = run_case(args.cycles, args.warmup, args.llm_latency_ms / 1000, triage_wait_seconds=60.0)
+        with open(args.child, "w") as f:
+            json.dump(result, f)
+        return
+
+    results: List[Dict[str, Any]] = []
+    for scenario in [s.strip() for s in args.scenarios.split(",") if s.strip()]:
+        for containers in args.containers:
+            for http_checks in args.http_checks:
+                try:
+                    result = bench(containers, http_checks, scenario, args)
+                except Exception as e:
+                    result = {"containers": containers, "http_checks": http_checks, "scenario": scenario, "error": str(e)}
+                results.append(result)
+                summary = result.get("cycle_ms", {})
+                print(
+                    f"{scenario:8s} containers={containers:<5d} http_checks={http_checks:<4d} "
+                    f"p50={summary.get('p50', '-')}ms p95={summary.get('p95', '-')}ms "
+                    f"cpu={result.get('cpu_ms_per_cycle', '-')}ms rss={result.get('rss_mb', '-')}MB"
+                    + (f" error={result['error']}" if "error" in result else ""),
+                    file=sys.stderr,
+                )
+
+    report = {
+        "label": args.label,
+        "created": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "config": {
+            "cycles": args.cycles,
+            "warmup": args.warmup,
+            "prom_latency_ms": args.prom_latency_ms,
+            "prom_series": args.prom_series,
+            "http_latency_ms": args.http_latency_ms,
+            "llm_latency_ms": args.llm_latency_ms,
+        },
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {len(results)} results to {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,38 @@
+import atexit
+import bisect
+import contextvars
+import hashlib
+import hmac
 import json
+import math
 import os
+import random
+import re
+import signal
+import socket
+import sqlite3
+import sys
+import threading
 import time
-from dataclasses import dataclass
+from abc import ABC, abstractmethod
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from dataclasses import asdict, dataclass
 from datetime import datetime, timezone
-from typing import Any, Dict, List, Optional
-from threading import Thread
+from socketserver import ThreadingMixIn
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+from threading import Event, Lock, Thread
+from urllib.parse import parse_qs, urlparse
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
 
 import docker
 import requests
 from pydantic import BaseModel, Field
-from prometheus_client import Counter, Gauge, start_http_server
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.util.retry import Retry
+from prometheus_client import Counter, Gauge, Histogram, make_wsgi_app
 
 try:
     from anthropic import Anthropic
@@ -23,6 +46,25 @@ try:
 except ImportError:
     GEMINI_AVAILABLE = False
 
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+try:
+    import paho.mqtt.client as mqtt
+    PAHO_AVAILABLE = True
+except ImportError:
+    PAHO_AVAILABLE = False
+
+try:
+    import psycopg2
+    import psycopg2.pool
+    PSYCOPG2_AVAILABLE = True
+except ImportError:
+    PSYCOPG2_AVAILABLE = False
+
 
 def _env_bool(name: str, default: bool = False) -> bool:
     value = os.getenv(name)
@@ -51,20 +93,212 @@ def _env_float(name: str, default: float) -> float:
         return default
 
 
+class JsonLogger:
+    """
+    One JSON object per line on stdout, built for a loop that logs the same things every cycle.
+
+    - The level threshold is resolved once (set_level() changes it at runtime).
+    - Static fields (AI_MONITOR_LOG_FIELDS) and each level's prefix are serialized once;
+      the ISO timestamp is formatted once per second.
+    - Lines go to a bounded buffer drained by a writer thread, so callers never block
+      on stdout; when the buffer is full lines are dropped and the drop count logged.
+    - An identical line (same level, message and fields) repeated within
+      repeat_window_seconds is suppressed; the next different line for that message, or
+      the end of the window, emits it once more with "repeated": N.
+    - sample_rates maps a message to a fraction of its debug/info lines to keep.
+    """
+
+    LEVELS = {"debug": 10, "info": 20, "warn": 30, "warning": 30, "error": 40}
+
+    def __init__(
+        self,
+        level: str = "info",
+        static_fields: Optional[Dict[str, Any]] = None,
+        repeat_window_seconds: float = 300.0,
+        sample_rates: Optional[Dict[str, float]] = None,
+        max_buffer_lines: int = 10000,
+        buffered: bool = True,
+        stream: Any = None,
+    ) -> None:
+        self.threshold = 20
+        self.level = "info"
+        self.set_level(level)
+        self.repeat_window_seconds = repeat_window_seconds
+        self.sample_rates = {msg: max(0.0, min(1.0, rate)) for msg, rate in (sample_rates or {}).items()}
+        self.max_buffer_lines = max_buffer_lines
+        self.buffered = buffered
+        self._stream = stream
+        self._static = "".join(
+            f", {json.dumps(str(k), ensure_ascii=False)}: {json.dumps(v, ensure_ascii=False, default=str)}"
+            for k, v in (static_fields or {}).items()
+        )
+        self._prefixes = {name: f'", "level": "{name}", "msg": ' for name in self.LEVELS}
+        self._second_text: Tuple[int, str] = (-1, "")  # replaced as a whole, so threads never see it torn
+        self._lock = Lock()
+        self._write_lock = Lock()
+        self._buffer: List[str] = []
+        self._dropped = 0
+        self._repeats: Dict[Tuple[str, str], List[Any]] = {}  # (level, msg) -> [fields, first ts, count]
+        self._sampled: Dict[str, int] = {}
+        self._wake = Event()
+        self._writer: Optional[Thread] = None
+
+    @classmethod
+    def from_env(cls) -> "JsonLogger":
+        static_fields = {}
+        for item in os.getenv("AI_MONITOR_LOG_FIELDS", "").split(","):
+            key, sep, value = item.partition("=")
+            if sep and key.strip():
+                static_fields[key.strip()] = value.strip()
+        sample_rates = {}
+        for item in os.getenv("AI_MONITOR_LOG_SAMPLE", "").split(";"):
+            msg, sep, rate = item.rpartition("=")
+            try:
+                if sep and msg.strip():
+                    sample_rates[msg.strip()] = float(rate)
+            except ValueError:
+                pass
+        return cls(
+            level=os.getenv("AI_MONITOR_LOG_LEVEL", "info"),
+            static_fields=static_fields,
+            repeat_window_seconds=_env_float("AI_MONITOR_LOG_REPEAT_WINDOW_SECONDS", 300.0),
+            sample_rates=sample_rates,
+            max_buffer_lines=_env_int("AI_MONITOR_LOG_BUFFER_LINES", 10000),
+            buffered=_env_bool("AI_MONITOR_LOG_BUFFERED", True),
+        )
+
+    def set_level(self, level: str) -> None:
+        level = level.strip().lower()
+        if level not in self.LEVELS:
+            raise ValueError(f"unknown log level: {level}")
+        self.level = "warn" if level == "warning" else level
+        self.threshold = self.LEVELS[level]
+
+    def log(self, level: str, msg: str, fields: Dict[str, Any]) -> None:
+        severity = self.LEVELS.get(level, 20)
+        if severity < self.threshold:
+            return
+        rate = self.sample_rates.get(msg) if severity < 30 else None
+        if rate is not None:
+            # Deterministic 1-in-N: keeps the first line and an even spread after it
+            every = max(1, round(1 / rate)) if rate > 0 else 0
+            with self._lock:
+                n = self._sampled.get(msg, 0)
+                self._sampled[msg] = n + 1
+            if not every or n % every:
+                return
+            fields = {**fields, "sample_rate": rate}
+
+        now = time.time()
+        body = json.dumps(fields, ensure_ascii=False, default=str)[1:-1] if fields else ""
+        summary: Optional[str] = None
+        if self.repeat_window_seconds > 0:
+            key = (level, msg)
+            with self._lock:
+                last = self._repeats.get(key)
+                if last is not None and last[0] == body and now - last[1] < self.repeat_window_seconds:
+                    last[2] += 1
+                    return
+                if last is not None and last[2]:
+                    summary = self._format(now, level, msg, last[0], repeated=last[2])
+                self._repeats[key] = [body, now, 0]
+        if summary is not None:
+            self._emit(summary)
+        self._emit(self._format(now, level, msg, body))
+
+    def _format(self, ts: float, level: str, msg: str, body: str, repeated: int = 0) -> str:
+        second = int(ts)
+        cached = self._second_text
+        if cached[0] != second:
+            cached = self._second_text = (
+                second, datetime.fromtimestamp(second, timezone.utc).strftime("%Y-%m-%dT%H:%M:%S")
+            )
+        prefix = self._prefixes.get(level) or f'", "level": {json.dumps(level)}, "msg": '
+        line = (
+            f'{{"ts": "{cached[1]}.{int((ts - second) * 1e6):06d}+00:00{prefix}'
+            + json.dumps(msg, ensure_ascii=False) + self._static
+        )
+        if body:
+            line += ", " + body
+        if repeated:
+            line += f', "repeated": {repeated}'
+        return line + "}"
+
+    def _emit(self, line: str) -> None:
+        if not self.buffered:
+            with self._write_lock:
+                self._write([line])
+            return
+        with self._lock:
+            if len(self._buffer) >= self.max_buffer_lines:
+                self._dropped += 1
+                return
+            self._buffer.append(line)
+            if self._writer is None:
+                self._writer = Thread(target=self._run, name="log-writer", daemon=True)
+                self._writer.start()
+                atexit.register(self.flush)
+        self._wake.set()
+
+    def _write(self, lines: List[str]) -> None:
+        stream = self._stream or sys.stdout
+        try:
+            stream.write("\n".join(lines) + "\n")
+            stream.flush()
+        except Exception:
+            pass  # a closed stdout must not take the monitor down
+
+    def flush(self, expire_repeats: bool = False) -> None:
+        """Write buffered lines now; with expire_repeats, summarize suppression windows that ended."""
+        summaries: List[str] = []
+        now = time.time()
+        with self._lock:
+            if expire_repeats:
+                for (level, msg), last in self._repeats.items():
+                    if last[2] and now - last[1] >= self.repeat_window_seconds:
+                        summaries.append(self._format(now, level, msg, last[0], repeated=last[2]))
+                        last[2] = 0
+                        last[1] = now
+            lines, self._buffer = self._buffer + summaries, []
+            dropped, self._dropped = self._dropped, 0
+        if dropped:
+            lines.append(self._format(now, "warn", "Log buffer full; lines dropped", f'"dropped": {dropped}'))
+        if lines:
+            with self._write_lock:
+                self._write(lines)
+
+    def _run(self) -> None:
+        while True:
+            self._wake.wait(1.0)
+            self._wake.clear()
+            self.flush(expire_repeats=True)
+
+
+_LOGGER = JsonLogger.from_env()
+
+
 def _log(level: str, msg: str, **fields: Any) -> None:
-    log_level = os.getenv("AI_MONITOR_LOG_LEVEL", "info").strip().lower()
-    allowed = {"debug": 10, "info": 20, "warn": 30, "error": 40}
-    if allowed.get(level, 20) < allowed.get(log_level, 20):
-        return
-
-    payload: Dict[str, Any] = {
-        "ts": datetime.now(timezone.utc).isoformat(),
-        "level": level,
-        "msg": msg,
-    }
-    if fields:
-        payload.update(fields)
-    print(json.dumps(payload, ensure_ascii=False))
+    _LOGGER.log(level, msg, fields)
+
+
+# Health and exit code as rendered in the sparse listing's Status, e.g. "Up 2 hours (unhealthy)", "Exited (137) 3 minutes ago"
+_STATUS_HEALTH_RE = re.compile(r"\((healthy|unhealthy|health: starting)\)")
+_STATUS_EXIT_CODE_RE = re.compile(r"^Exited \((-?\d+)\)")
+
+
+def _is_timeout(exc: BaseException) -> bool:
+    """True for timeouts raised by requests, the Anthropic SDK or Google API clients."""
+    if isinstance(exc, (requests.exceptions.Timeout, TimeoutError)):
+        return True
+    name = type(exc).__name__
+    return "Timeout" in name or name == "DeadlineExceeded"
+
+
+def _is_failing(c: Dict[str, Any]) -> bool:
+    """True if a container snapshot entry is unhealthy, exited or dead."""
+    health = (c.get("health") or "").lower() if isinstance(c.get("health"), str) else ""
+    status = (c.get("status") or "").lower() if isinstance(c.get("status"), str) else ""
+    return health == "unhealthy" or status in {"exited", "dead"}
 
 
 @dataclass
@@ -74,6 +308,107 @@ class PromQuery:
     description: str
 
 
+@dataclass
+class CollectionSource:
+    """One independently-fetched piece of the snapshot (a query, the Docker listing, an HTTP check)."""
+    name: str
+    fetch: Callable[[], Any]
+    deadline_seconds: float
+    on_timeout: Callable[[str], Any]  # builds a placeholder result from an error message
+    executor: Optional[ThreadPoolExecutor] = None  # defaults to the shared collector pool
+
+
+# --------------------------- HTTP phase timing --------------------------------
+# urllib3 connections record DNS/connect/TLS time into a per-thread dict set by the
+# caller; each HTTP check runs on its own worker thread, so a thread-local is enough.
+_HTTP_PHASES = threading.local()
+
+# Upstream call tally of the task running in this context. Work fanned out to a pool is
+# submitted through contextvars.copy_context().run, so it counts toward the same task;
+# background work (triage, restart plans, event re-syncs) runs outside any task.
+_CALL_SCOPE: "contextvars.ContextVar[Optional[Dict[str, int]]]" = contextvars.ContextVar(
+    "ai_monitor_call_scope", default=None
+)
+
+
+class _TimedConnectionMixin:
+    def _new_conn(self):  # type: ignore[no-untyped-def]
+        phases = getattr(_HTTP_PHASES, "current", None)
+        if phases is None:
+            return super()._new_conn()
+        host = self._dns_host
+        start = time.perf_counter()
+        try:
+            address = socket.getaddrinfo(host, self.port, 0, socket.SOCK_STREAM)[0][4][0]
+        except OSError:
+            return super()._new_conn()  # let urllib3 raise its usual resolution error
+        resolved = time.perf_counter()
+        # Connect to the resolved address so the connect phase excludes a second lookup.
+        # Only swapped for the socket connect; SNI/Host still use the original name.
+        self._dns_host = address
+        try:
+            sock = super()._new_conn()
+        finally:
+            self._dns_host = host
+        phases["dns"] = resolved - start
+        phases["connect"] = time.perf_counter() - resolved
+        return sock
+
+    def connect(self) -> None:
+        phases = getattr(_HTTP_PHASES, "current", None)
+        start = time.perf_counter()
+        super().connect()
+        if phases is not None and isinstance(self, HTTPSConnection):
+            tcp = phases.get("dns", 0.0) + phases.get("connect", 0.0)
+            phases["tls"] = max(0.0, time.perf_counter() - start - tcp)
+
+
+class _TimedHTTPConnection(_TimedConnectionMixin, HTTPConnection):
+    pass
+
+
+class _TimedHTTPSConnection(_TimedConnectionMixin, HTTPSConnection):
+    pass
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+class TimedHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter whose pooled connections report DNS, connect and TLS phase timings."""
+
+    def init_poolmanager(self, *args: Any, **kwargs: Any) -> None:
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _TimedHTTPConnectionPool,
+            "https": _TimedHTTPSConnectionPool,
+        }
+
+
+SNAPSHOT_QUERIES = [
+    PromQuery(
+        name="down_targets",
+        query='up == 0',
+        description="Any Prometheus scrape targets currently down",
+    ),
+    PromQuery(
+        name="container_mem_top",
+        query='topk(5, docker_container_mem_usage)',
+        description="Top container memory usage (bytes) if available",
+    ),
+    PromQuery(
+        name="container_cpu_top",
+        query='topk(5, rate(container_cpu_usage_seconds_total[5m]))',
+        description="Top container CPU usage (cores) if available",
+    ),
+]
+
+
 class Action(BaseModel):
     type: str = Field(..., description="e.g. restart_container | alert | none")
     target: Optional[str] = Field(None, description="container name, if applicable")
@@ -92,7 +427,7 @@ class Triage(BaseModel):
 RESTARTS_TOTAL = Counter(
     "ai_monitor_restarts_total",
     "Total container restarts performed by ai-monitor",
-    ["container"],
+    ["host", "container"],
 )
 TRIAGE_CALLS_TOTAL = Counter(
     "ai_monitor_triage_calls_total",
@@ -102,23 +437,32 @@ TRIAGE_CALLS_TOTAL = Counter(
 HEALTHY_CONTAINERS = Gauge(
     "ai_monitor_healthy_containers",
     "Number of healthy containers in allowlist",
+    ["host"],
 )
 UNHEALTHY_CONTAINERS = Gauge(
     "ai_monitor_unhealthy_containers",
     "Number of unhealthy/exited containers in allowlist",
+    ["host"],
 )
 UNHEALTHY_BY_CONTAINER = Gauge(
     "ai_monitor_unhealthy_container",
     "Unhealthy or exited container indicator (1 if unhealthy/exited else 0)",
-    ["container"],
+    ["host", "container"],
 )
 TOTAL_HEALTHY_CONTAINERS = Gauge(
     "ai_monitor_total_healthy_containers",
     "Number of healthy containers (all containers, not just allowlist)",
+    ["host"],
 )
 TOTAL_UNHEALTHY_CONTAINERS = Gauge(
     "ai_monitor_total_unhealthy_containers",
     "Number of unhealthy/exited containers (all containers, not just allowlist)",
+    ["host"],
+)
+DOCKER_HOST_UP = Gauge(
+    "ai_monitor_docker_host_up",
+    "Whether the last container listing from this Docker host succeeded (1) or failed (0)",
+    ["host"],
 )
 LAST_RUN_TIMESTAMP = Gauge(
     "ai_monitor_last_run_timestamp",
@@ -134,232 +478,3946 @@ HTTP_CHECK_LATENCY = Gauge(
     "HTTP check latency in milliseconds",
     ["target"],
 )
+HTTP_CHECK_PHASE = Gauge(
+    "ai_http_check_phase_ms",
+    "HTTP check phase duration in milliseconds (dns/connect/tls are 0 on a reused pooled connection)",
+    ["target", "phase"],  # phase: dns|connect|tls|ttfb
+)
+UPSTREAM_CALLS_TOTAL = Counter(
+    "ai_monitor_upstream_calls_total",
+    "Total calls made to upstream systems",
+    ["source"],  # prometheus|docker_list|docker_inspect|docker_logs|docker_restart|http_check
+)
+CYCLE_UPSTREAM_CALLS = Gauge(
+    "ai_monitor_cycle_upstream_calls",
+    "Upstream calls made by the last run of each scheduled task (task=cycle for run_once)",
+    ["task", "source"],
+)
 
+PROM_QUERY_DURATION = Histogram(
+    "ai_monitor_prom_query_duration_seconds",
+    "Prometheus API request latency (cache misses only, including retries)",
+    ["query", "outcome"],  # query: PromQuery name or "adhoc"; outcome: success|error
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+PROM_CACHE_REQUESTS_TOTAL = Counter(
+    "ai_monitor_prom_cache_requests_total",
+    "Prometheus client result cache lookups",
+    ["result"],  # hit|miss
+)
 
-class AiMonitor:
-    def __init__(self) -> None:
-        self.prometheus_url = os.getenv("PROMETHEUS_URL", "http://prometheus:9090").rstrip("/")
-        self.interval_seconds = _env_int("AI_MONITOR_INTERVAL_SECONDS", 60)
-        self.execute = _env_bool("AI_MONITOR_EXECUTE", False)
-        self.self_heal_docker_health = _env_bool("AI_MONITOR_SELF_HEAL_DOCKER_HEALTH", True)
-        self.max_restarts_per_run = _env_int("AI_MONITOR_MAX_RESTARTS_PER_RUN", 2)
-        self.restart_unhealthy = _env_bool("AI_MONITOR_RESTART_UNHEALTHY", True)
-        self.restart_exited = _env_bool("AI_MONITOR_RESTART_EXITED", True)
-        self.llm_enabled = _env_bool("AI_MONITOR_LLM_ENABLED", True)
-        self.prom_timeout_seconds = _env_int("AI_MONITOR_PROM_TIMEOUT_SECONDS", 5)
-        self.allowed_containers = {
-            c.strip() for c in os.getenv("AI_MONITOR_ALLOWED_CONTAINERS", "").split(",") if c.strip()
+FORECAST_EXHAUSTION_SECONDS = Gauge(
+    "ai_monitor_forecast_exhaustion_seconds",
+    "Predicted seconds until the resource is exhausted at the current trend (+Inf if not trending toward exhaustion)",
+    ["kind", "entity"],  # kind: memory|disk
+)
+FORECAST_SLOPE = Gauge(
+    "ai_monitor_forecast_slope_per_hour",
+    "Fitted trend per hour (bytes/h for memory and disk, flaps/h change for restarts)",
+    ["kind", "entity"],
+)
+FORECAST_FINDINGS = Gauge(
+    "ai_monitor_forecast_findings",
+    "Number of concerning trends found by the last forecast run",
+)
+CONTAINER_RESOURCE_BASELINE = Gauge(
+    "ai_monitor_container_resource_baseline",
+    "Learned per-container resource baseline from Docker stats (ewma, stddev, mean, p95)",
+    ["host", "container", "resource", "stat"],
+)
+CONTAINER_RESOURCE_ZSCORE = Gauge(
+    "ai_monitor_container_resource_zscore",
+    "Deviation of the latest Docker stats sample from the container's EWMA baseline, in standard deviations",
+    ["host", "container", "resource"],
+)
+CONTAINER_RESOURCE_ANOMALIES_TOTAL = Counter(
+    "ai_monitor_container_resource_anomalies_total",
+    "Resource anomalies flagged against a container's own baseline (onsets)",
+    ["resource"],
+)
+
+TRIAGE_CACHE_REQUESTS_TOTAL = Counter(
+    "ai_monitor_triage_cache_requests_total",
+    "Triage cache lookups by incident fingerprint",
+    ["result"],  # hit|miss
+)
+LLM_CALLS_AVOIDED_TOTAL = Counter(
+    "ai_monitor_llm_calls_avoided_total",
+    "LLM triage calls skipped because the same incident was triaged within the cache TTL",
+)
+
+LLM_PROMPT_BYTES = Gauge(
+    "ai_monitor_llm_prompt_bytes",
+    "Size of the last triage prompt in bytes",
+    ["backend"],
+)
+LLM_PROMPT_TOKENS = Gauge(
+    "ai_monitor_llm_prompt_tokens_estimate",
+    "Estimated tokens of the last triage prompt (bytes / 4)",
+    ["backend"],
+)
+LLM_PROMPT_TOKENS_TOTAL = Counter(
+    "ai_monitor_llm_estimated_prompt_tokens_total",
+    "Estimated prompt tokens sent across all triage calls",
+    ["backend"],
+)
+
+LOG_LINES_CLASSIFIED_TOTAL = Counter(
+    "ai_monitor_log_lines_classified_total",
+    "Container log lines read by the log pipeline, by classification",
+    ["kind"],  # traceback|panic|oom|error|other
+)
+
+TRIAGE_QUEUE_DEPTH = Gauge(
+    "ai_monitor_triage_queue_depth",
+    "Triage requests waiting for the background worker",
+)
+TRIAGE_QUEUE_WAIT_SECONDS = Histogram(
+    "ai_monitor_triage_queue_wait_seconds",
+    "Time a triage request spent queued before the worker picked it up",
+    buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300),
+)
+TRIAGE_REQUESTS_DROPPED_TOTAL = Counter(
+    "ai_monitor_triage_requests_dropped_total",
+    "Queued triage requests discarded before being processed",
+    ["reason"],  # replaced|overflow
+)
+LLM_CALL_DURATION_SECONDS = Histogram(
+    "ai_monitor_llm_call_duration_seconds",
+    "Wall time of triage LLM calls",
+    ["backend"],
+    buckets=(0.5, 1, 2.5, 5, 10, 20, 30, 60, 120),
+)
+
+RESTART_DURATION_SECONDS = Histogram(
+    "ai_monitor_restart_duration_seconds",
+    "Container restart plus health verification time, by outcome",
+    ["host", "outcome"],  # outcome: healthy|running|timeout|exited|failed
+    buckets=(1, 2.5, 5, 10, 20, 30, 60, 120, 300),
+)
+
+RESTART_BUDGET_TOKENS = Gauge(
+    "ai_monitor_restart_budget_tokens",
+    "Restart tokens left in each container's bucket",
+    ["host", "container"],
+)
+RESTART_GLOBAL_BUDGET_TOKENS = Gauge(
+    "ai_monitor_restart_global_budget_tokens",
+    "Restart tokens left in the fleet-wide bucket",
+)
+RESTART_BACKOFF_SECONDS = Gauge(
+    "ai_monitor_restart_backoff_seconds",
+    "Current minimum delay before a container may be restarted again",
+    ["host", "container"],
+)
+RESTART_BREAKER_STATE = Gauge(
+    "ai_monitor_restart_breaker_state",
+    "Restart circuit breaker per container: 0 closed, 1 open (auto-restart stopped), 2 half-open",
+    ["host", "container"],
+)
+RESTARTS_DENIED_TOTAL = Counter(
+    "ai_monitor_restarts_denied_total",
+    "Restart requests refused by the restart governor",
+    ["reason"],  # backoff|budget|global_budget|circuit_open
+)
+
+SCHEDULER_TASK_DURATION_SECONDS = Histogram(
+    "ai_monitor_scheduler_task_duration_seconds",
+    "Run time of scheduled probe tasks",
+    ["task"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+SCHEDULER_OVERRUNS_TOTAL = Counter(
+    "ai_monitor_scheduler_overruns_total",
+    "Scheduled task runs that exceeded their deadline",
+    ["task"],
+)
+SCHEDULER_SKIPPED_TICKS_TOTAL = Counter(
+    "ai_monitor_scheduler_skipped_ticks_total",
+    "Scheduled ticks skipped because the previous run was still going or the scheduler fell behind",
+    ["task"],
+)
+
+PHASE_DURATION_SECONDS = Histogram(
+    "ai_monitor_phase_duration_seconds",
+    "Duration of each upstream phase of a cycle",
+    # phase: prometheus|docker_list|docker_logs|http_check|llm|restart|incident_write|influxdb3|timescaledb
+    # target holds configured names only (query, docker host, HTTP check, LLM backend, database),
+    # never containers, so the series count is fixed by configuration and no lifecycle sweeps it
+    ["phase", "target", "outcome"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120),
+)
+RUN_ONCE_DURATION_SECONDS = Histogram(
+    "ai_monitor_run_once_duration_seconds",
+    "Wall time of a full run_once cycle",
+    ["outcome"],  # ok|error
+    buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 15, 30, 60),
+)
+LLM_RESPONSE_BYTES = Gauge(
+    "ai_monitor_llm_response_bytes",
+    "Size of the last LLM triage response",
+    ["backend"],
+)
+
+INCIDENTS_RECORDED_TOTAL = Counter(
+    "ai_monitor_incidents_recorded_total",
+    "Incidents written to the incident store (new rows, not repeat occurrences)",
+    ["severity"],
+)
+INCIDENT_STORE_BYTES = Gauge(
+    "ai_monitor_incident_store_bytes",
+    "Size of the incident store database including its write-ahead log",
+)
+
+STATE_CHECKPOINT_TIMESTAMP = Gauge(
+    "ai_monitor_state_checkpoint_timestamp",
+    "When the monitor state file was last written",
+)
+
+MQTT_CONNECTED = Gauge(
+    "ai_monitor_mqtt_connected",
+    "1 while the heartbeat tracker is connected to the MQTT broker",
+)
+MQTT_MESSAGES_TOTAL = Counter(
+    "ai_monitor_mqtt_messages_total",
+    "MQTT messages counted by the heartbeat tracker",
+    ["stream"],
+)
+MQTT_DEVICE_STALENESS_SECONDS = Gauge(
+    "ai_monitor_mqtt_device_staleness_seconds",
+    "Seconds since the device last published on the stream",
+    ["stream", "device"],
+)
+MQTT_DEVICE_MESSAGE_RATE = Gauge(
+    "ai_monitor_mqtt_device_message_rate",
+    "Smoothed messages per second published by the device on the stream",
+    ["stream", "device"],
+)
+MQTT_SILENT_DEVICES = Gauge(
+    "ai_monitor_mqtt_silent_devices",
+    "Devices silent for longer than their stream's staleness threshold",
+    ["stream"],
+)
+
+ALERTS_RECEIVED_TOTAL = Counter(
+    "ai_monitor_alerts_received_total",
+    "Alerts received on the Alertmanager webhook",
+    ["result"],
+)
+ALERTS_FIRING = Gauge(
+    "ai_monitor_alerts_firing",
+    "Firing alerts currently known from the Alertmanager webhook",
+)
+ALERT_TRIAGE_REQUESTS_TOTAL = Counter(
+    "ai_monitor_alert_triage_requests_total",
+    "Alert-triggered triage attempts",
+    ["result"],
+)
+ALERT_TO_TRIAGE_SECONDS = Histogram(
+    "ai_monitor_alert_to_triage_seconds",
+    "Time from webhook receipt to the triage request, including the targeted snapshot",
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+
+DATA_FRESHNESS_LAG_SECONDS = Gauge(
+    "ai_monitor_data_freshness_lag_seconds",
+    "Seconds since the newest row of each measurement/hypertable",
+    ["store", "database", "series"],
+)
+DATA_FRESHNESS_STALE_SERIES = Gauge(
+    "ai_monitor_data_freshness_stale_series",
+    "Series whose newest row is older than their staleness threshold",
+    ["store"],
+)
+DATA_FRESHNESS_PROBE_ERRORS_TOTAL = Counter(
+    "ai_monitor_data_freshness_probe_errors_total",
+    "Failed freshness queries",
+    ["store", "database"],
+)
+
+METRIC_SERIES = Gauge(
+    "ai_monitor_metric_series",
+    "Label children currently exported by each per-entity metric",
+    ["metric"],
+)
+LABEL_OVERFLOW_TOTAL = Counter(
+    "ai_monitor_label_overflow_total",
+    "Label values folded into the overflow bucket because the cardinality cap was reached",
+    ["dimension"],
+)
+
+UPSTREAM_SOURCES = (
+    "prometheus", "docker_list", "docker_inspect", "docker_logs", "docker_restart", "docker_stats", "http_check",
+    "influxdb3", "timescaledb",
+)
+
+
+class _PhaseTimer:
+    """
+    Observes PHASE_DURATION_SECONDS for the enclosed block. The outcome is "ok" unless the
+    block raises ("timeout"/"error") or sets timer.outcome itself.
+    """
+
+    __slots__ = ("phase", "target", "outcome", "_started")
+
+    def __init__(self, phase: str, target: str = "") -> None:
+        self.phase = phase
+        self.target = target
+        self.outcome = "ok"
+        self._started = 0.0
+
+    def __enter__(self) -> "_PhaseTimer":
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type: Any, exc: Any, tb: Any) -> bool:
+        if exc is not None and self.outcome == "ok":
+            self.outcome = "timeout" if _is_timeout(exc) else "error"
+        PHASE_DURATION_SECONDS.labels(phase=self.phase, target=self.target, outcome=self.outcome).observe(
+            time.perf_counter() - self._started
+        )
+        return False
+
+
+class LabelLifecycle:
+    """
+    Bounds the label values of one entity dimension (containers, HTTP targets, ...) across
+    every metric that carries it.
+
+    label() returns the value to use and marks it seen; once max_values distinct values are
+    tracked, new ones are reported as OVERFLOW. sweep() runs once per evaluation: values not
+    seen for stale_sweeps consecutive sweeps have their children removed from all tracked
+    metrics, and ai_monitor_metric_series is refreshed. Each lifecycle is swept from exactly
+    one probe, so retention is stale_sweeps runs of that probe.
+    """
+
+    OVERFLOW = "_overflow"
+
+    def __init__(self, dimension: str, max_values: int = 500, stale_sweeps: int = 5) -> None:
+        self.dimension = dimension
+        self.max_values = max_values
+        self.stale_sweeps = stale_sweeps
+        self._metrics: List[Tuple[Any, Tuple[str, ...], str]] = []  # (metric, label names, key label)
+        self._seen: Dict[str, int] = {}  # value -> sweep generation it was last seen in
+        self._generation = 0
+        self._overflow_seen: Optional[int] = None
+        self._lock = Lock()
+
+    def track(self, metric: Any, labelnames: Tuple[str, ...], key: str) -> None:
+        self._metrics.append((metric, labelnames, key))
+
+    def configure(self, max_values: int, stale_sweeps: int) -> None:
+        self.max_values = max(1, max_values)
+        self.stale_sweeps = max(1, stale_sweeps)
+
+    def label(self, value: str) -> str:
+        with self._lock:
+            if value in self._seen or len(self._seen) < self.max_values:
+                self._seen[value] = self._generation
+                return value
+            self._overflow_seen = self._generation
+        LABEL_OVERFLOW_TOTAL.labels(dimension=self.dimension).inc()
+        return self.OVERFLOW
+
+    def mark(self, values: Any) -> None:
+        for value in values:
+            self.label(value)
+
+    def sweep(self) -> List[str]:
+        """Remove values unseen for stale_sweeps sweeps; returns the removed values."""
+        with self._lock:
+            self._generation += 1
+            cutoff = self._generation - self.stale_sweeps
+            stale = [v for v, gen in self._seen.items() if gen < cutoff]
+            for value in stale:
+                del self._seen[value]
+            if self._overflow_seen is not None and self._overflow_seen < cutoff:
+                stale.append(self.OVERFLOW)
+                self._overflow_seen = None
+        stale_set = set(stale)
+        for metric, labelnames, key in self._metrics:
+            position = labelnames.index(key)
+            if stale_set:
+                children = {
+                    tuple(sample.labels.get(name, "") for name in labelnames)
+                    for family in metric.collect()
+                    for sample in family.samples
+                }
+                for labels in children:
+                    if labels[position] in stale_set:
+                        metric.remove(*labels)
+            # Exposed series, i.e. samples (a histogram child contributes one per bucket)
+            families = metric.collect()
+            METRIC_SERIES.labels(metric=families[0].name).set(sum(len(f.samples) for f in families))
+        if stale:
+            _log("debug", "Removed stale metric series", dimension=self.dimension, values=stale)
+        return stale
+
+
+CONTAINER_LABELS = LabelLifecycle("container")
+CONTAINER_LABELS.track(UNHEALTHY_BY_CONTAINER, ("host", "container"), "container")
+CONTAINER_LABELS.track(RESTARTS_TOTAL, ("host", "container"), "container")
+CONTAINER_LABELS.track(RESTART_BUDGET_TOKENS, ("host", "container"), "container")
+CONTAINER_LABELS.track(RESTART_BACKOFF_SECONDS, ("host", "container"), "container")
+CONTAINER_LABELS.track(RESTART_BREAKER_STATE, ("host", "container"), "container")
+CONTAINER_LABELS.track(CONTAINER_RESOURCE_BASELINE, ("host", "container", "resource", "stat"), "container")
+CONTAINER_LABELS.track(CONTAINER_RESOURCE_ZSCORE, ("host", "container", "resource"), "container")
+
+HTTP_TARGET_LABELS = LabelLifecycle("http_target")
+HTTP_TARGET_LABELS.track(HTTP_CHECK_OK, ("target",), "target")
+HTTP_TARGET_LABELS.track(HTTP_CHECK_LATENCY, ("target",), "target")
+HTTP_TARGET_LABELS.track(HTTP_CHECK_PHASE, ("target", "phase"), "target")
+
+FORECAST_ENTITY_LABELS = LabelLifecycle("forecast_entity")
+FORECAST_ENTITY_LABELS.track(FORECAST_SLOPE, ("kind", "entity"), "entity")
+FORECAST_ENTITY_LABELS.track(FORECAST_EXHAUSTION_SECONDS, ("kind", "entity"), "entity")
+
+MQTT_DEVICE_LABELS = LabelLifecycle("mqtt_device")
+MQTT_DEVICE_LABELS.track(MQTT_DEVICE_STALENESS_SECONDS, ("stream", "device"), "device")
+MQTT_DEVICE_LABELS.track(MQTT_DEVICE_MESSAGE_RATE, ("stream", "device"), "device")
+
+
+# ----------------------------- Prompt compaction ------------------------------
+_LOG_SALIENT_RE = re.compile(r"error|exception|fatal|panic|traceback|oom|killed|fail|refused|timeout", re.IGNORECASE)
+_LOG_TIMESTAMP_RE = re.compile(r"^\S*\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2}\S*\s*")
+_TRIAGE_PROMPT = (
+    "You are an SRE assistant for a Raspberry Pi docker-compose stack. "
+    "Given the JSON snapshot, produce a concise triage response. "
+    "Return ONLY valid JSON that matches this schema:\n"
+    '{"summary": string, "severity": "low"|"medium"|"high", '
+    '"suspected_causes": string[], '
+    '"recommended_actions": [{"type": "restart_container"|"alert"|"none", "target": string|null, "reason": string|null}], '
+    '"confidence": number }\n\n'
+    "Constraints:\n"
+    "- Be conservative: prefer alert/none over restarts.\n"
+    "- If you recommend a restart_container, set target to the exact container name "
+    "(host/name when containers carry a host).\n"
+    "- If everything looks fine, severity=low and action=none.\n\n"
+    "SNAPSHOT:\n"
+)
+
+
+def _dedupe_log_lines(lines: List[str]) -> List[str]:
+    counts: Dict[str, int] = {}
+    for line in lines:
+        line = _LOG_TIMESTAMP_RE.sub("", line.strip())
+        if line:
+            counts[line] = counts.get(line, 0) + 1  # dicts keep first-seen order
+    return [f"{line} (x{n})" if n > 1 else line for line, n in counts.items()]
+
+
+def _compact_log_lines(text: str, max_lines: int, salient: Optional[List[str]] = None) -> List[str]:
+    """
+    Dedupe log lines (ignoring timestamps) and keep the salient ones first, then the tail.
+    Salient lines come from the log pipeline when available, else from a keyword match.
+    """
+    if max_lines <= 0:
+        return []
+    lines = _dedupe_log_lines(text.splitlines())
+    if salient is None:
+        salient = [line for line in lines if _LOG_SALIENT_RE.search(line)]
+    else:
+        salient = _dedupe_log_lines(salient)
+    seen = set(salient)
+    rest = [line for line in lines if line not in seen]
+    keep = salient[-max_lines:]
+    if len(keep) < max_lines:
+        keep += rest[-(max_lines - len(keep)):]
+    return [line[:300] for line in keep]
+
+
+def _compact_series(series: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Collapse Prometheus series to {entity: value}, dropping the full label sets."""
+    out: Dict[str, Any] = {}
+    for s in series:
+        try:
+            value: Any = float((s.get("value") or [0, "nan"])[1])
+            value = float(f"{value:.3g}")
+        except (TypeError, ValueError):
+            value = None
+        out[_series_entity(s.get("metric") or {})] = value
+    return out
+
+
+def compact_snapshot(snapshot: Dict[str, Any], budget_bytes: int) -> Dict[str, Any]:
+    """
+    Dense, failure-first view of a snapshot for LLM prompts.
+
+    Healthy containers and passing HTTP checks become counts, series label sets collapse
+    to one entity name, logs are deduplicated with error lines first. If the result is
+    still over budget_bytes, log lines are cut down first, then resource top-lists, then
+    the failing entities beyond the first few.
+    """
+    compact: Dict[str, Any] = {}
+    for q in SNAPSHOT_QUERIES:
+        entry = snapshot.get(q.name)
+        if not isinstance(entry, dict):
+            continue
+        if entry.get("error"):
+            compact.setdefault("query_errors", {})[q.name] = entry["error"][:200]
+        if q.name == "down_targets":
+            compact["down_targets"] = sorted(
+                f"{(s.get('metric') or {}).get('job', '')}/{(s.get('metric') or {}).get('instance', '')}"
+                for s in entry.get("result", [])
+            )
+        elif entry.get("result"):
+            compact[q.name] = _compact_series(entry["result"])
+
+    docker_health = snapshot.get("docker_health") or {}
+    containers = docker_health.get("containers", [])
+    # Host names only matter (and only cost prompt bytes) when several hosts are watched
+    host_keys = ("host",) if len(docker_health.get("hosts") or {}) > 1 else ()
+    failing = [c for c in containers if _is_failing(c)]
+    degraded = [
+        c for c in containers
+        if not _is_failing(c) and ((c.get("status") or "running") != "running" or c.get("health") == "starting")
+    ]
+    compact["containers"] = {
+        "total": len(containers),
+        "healthy": len(containers) - len(failing) - len(degraded),
+        "failing": [
+            {k: c.get(k) for k in host_keys + ("name", "status", "health", "exit_code") if c.get(k) is not None}
+            | ({"logs": c["recent_logs"]} if c.get("recent_logs") or c.get("salient_logs") else {})
+            for c in failing
+        ],
+    }
+    if degraded:
+        compact["containers"]["degraded"] = {
+            (f"{c.get('host')}/{c['name']}" if host_keys else c["name"]): c.get("health") or c.get("status")
+            for c in degraded
         }
-        
-        # LLM backend selection (priority: Claude > Gemini)
-        self.claude_api_key = os.getenv("CLAUDE_API_KEY")
-        self.claude_model = os.getenv("CLAUDE_MODEL", "claude-3-haiku-20240307")
-        self.use_claude = bool(self.claude_api_key and ANTHROPIC_AVAILABLE)
-        if self.use_claude:
-            self._anthropic_client = Anthropic(api_key=self.claude_api_key)
-        
-        self.gemini_api_key = os.getenv("GEMINI_API_KEY")
-        self.gemini_model = os.getenv("GEMINI_MODEL", "gemini-2.0-flash-exp")
-        self.use_gemini = bool(self.gemini_api_key and GEMINI_AVAILABLE and not self.use_claude)
-        if self.use_gemini:
-            genai.configure(api_key=self.gemini_api_key)
-            self._gemini_model = genai.GenerativeModel(self.gemini_model)
+    if docker_health.get("error"):
+        compact["containers"]["error"] = docker_health["error"][:200]
 
-        self._docker_client = docker.DockerClient(base_url="unix://var/run/docker.sock")
-        self._last_restart: Dict[str, float] = {}
-        
-        # Predictive monitoring
-        self.predictive_enabled = _env_bool("AI_MONITOR_PREDICTIVE_ENABLED", False)
-        self.predictive_interval = _env_int("AI_MONITOR_PREDICTIVE_INTERVAL_SECONDS", 86400)  # Daily
-        self._last_predictive_check = 0.0
-        
-        # Incident reports
-        self.incident_reports_enabled = _env_bool("AI_MONITOR_INCIDENT_REPORTS_ENABLED", True)
-        self.incident_reports_dir = os.getenv("AI_MONITOR_INCIDENT_REPORTS_DIR", "/app/incidents")
-        # Incident gating (to avoid false positives)
-        self.incident_min_severity = os.getenv("AI_MONITOR_INCIDENT_MIN_SEVERITY", "medium").strip().lower()
-        self.incident_min_confidence = _env_float("AI_MONITOR_INCIDENT_MIN_CONFIDENCE", 0.5)
-        self.incident_require_evidence = _env_bool("AI_MONITOR_INCIDENT_REQUIRE_EVIDENCE", True)
+    http_checks = snapshot.get("http_checks") or {}
+    http_failures = [r for r in http_checks.values() if not r.get("ok", False)]
+    if http_checks:
+        compact["http_checks"] = {
+            "ok": len(http_checks) - len(http_failures),
+            "failing": [
+                {k: r.get(k) for k in ("target", "status", "expected", "latency_ms") if r.get(k) is not None}
+                | ({"error": r["error"][:200]} if r.get("error") else {})
+                for r in http_failures
+            ],
+        }
+    mqtt_state = snapshot.get("mqtt") or {}
+    if mqtt_state:
+        compact["mqtt"] = {
+            "connected": mqtt_state.get("connected"),
+            "devices": mqtt_state.get("devices", 0),
+            "silent": [dict(d) for d in mqtt_state.get("silent", [])],
+        }
+    freshness = snapshot.get("data_freshness") or {}
+    if freshness.get("stale") or freshness.get("errors"):
+        compact["data_freshness"] = {
+            "stale": [dict(d) for d in freshness.get("stale", [])],
+            "errors": {k: v[:200] for k, v in (freshness.get("errors") or {}).items()},
+        }
+    if snapshot.get("alerts"):
+        compact["alerts"] = {
+            "firing": [
+                {k: a[k] for k in ("alertname", "labels", "summary") if a.get(k)}
+                for a in snapshot["alerts"]
+            ],
+        }
+    if snapshot.get("resource_anomalies"):
+        compact["baselines"] = {"anomalies": [dict(a) for a in snapshot["resource_anomalies"]]}
+        if not host_keys:
+            for a in compact["baselines"]["anomalies"]:
+                a.pop("host", None)
+    for key in ("predictive_trigger", "timed_out_sources"):
+        if snapshot.get(key):
+            compact[key] = snapshot[key]
+    if snapshot.get("predictive_findings"):
+        compact["predictive_findings"] = [
+            {k: f[k] for k in ("kind", "entity", "reason", "seconds_to_exhaustion") if f.get(k) is not None}
+            for f in snapshot["predictive_findings"][:5]
+        ]
 
-        # Predictive memory thresholds (tunable via env)
-        self.mem_growth_bytes = _env_int("AI_MONITOR_MEM_GROWTH_BYTES", 300_000_000)  # 300MB
-        self.mem_growth_window_hours = _env_int("AI_MONITOR_MEM_GROWTH_WINDOW_HOURS", 2)  # 2h
-        
-        # HTTP synthetic checks
-        self.http_checks = self._parse_http_checks(os.getenv("AI_MONITOR_HTTP_CHECKS", ""))
-        self._last_http_check_results: Dict[str, Dict[str, Any]] = {}
+    def size() -> int:
+        return len(json.dumps(compact, separators=(",", ":"), ensure_ascii=False).encode("utf-8"))
 
-    def _parse_http_checks(self, checks_str: str) -> List[Dict[str, Any]]:
-        """Parse AI_MONITOR_HTTP_CHECKS env var. Format: url|expected_status[|header=value] ; url2|expected_status[|header=value]"""
-        checks = []
-        if not checks_str.strip():
-            return checks
-        for check_entry in checks_str.split(";"):
-            parts = [p.strip() for p in check_entry.split("|")]
-            if len(parts) < 2:
-                continue
-            url = parts[0]
-            expected_status = int(parts[1])
-            headers = {}
-            for i in range(2, len(parts)):
-                if "=" in parts[i]:
-                    k, v = parts[i].split("=", 1)
-                    headers[k.strip()] = v.strip()
-            checks.append({"url": url, "expected_status": expected_status, "headers": headers})
-        return checks
+    # By position in failing: the same container name can fail on several hosts
+    raw_logs = {i: c["logs"] or "" for i, c in enumerate(compact["containers"]["failing"]) if "logs" in c}
+    for max_lines in (20, 10, 5, 2, 0):
+        for i, c in enumerate(compact["containers"]["failing"]):
+            if i in raw_logs:
+                c["logs"] = _compact_log_lines(raw_logs[i], max_lines, failing[i].get("salient_logs"))
+                if not c["logs"]:
+                    del c["logs"]
+        if size() <= budget_bytes:
+            return compact
+    for key in ("container_cpu_top", "container_mem_top"):
+        compact.pop(key, None)
+        if size() <= budget_bytes:
+            return compact
+    for section, key in (
+        (compact["containers"], "failing"),
+        (compact.get("http_checks") or {}, "failing"),
+        (compact.get("mqtt") or {}, "silent"),
+        (compact.get("data_freshness") or {}, "stale"),
+        (compact.get("alerts") or {}, "firing"),
+        (compact.get("baselines") or {}, "anomalies"),
+    ):
+        items = section.get(key) or []
+        while len(items) > 3 and size() > budget_bytes:
+            items.pop()
+            section[f"more_{key}"] = section.get(f"more_{key}", 0) + 1
+    return compact
+
+
+class PrometheusClient:
+    """
+    Prometheus HTTP API client shared by snapshot collection and predictive checks.
+
+    Uses one pooled, gzip-enabled session; GETs are retried with backoff on 5xx responses
+    and connection errors. Results are cached for cache_ttl_seconds keyed on the endpoint,
+    query and evaluation time. Instant queries without an explicit time are evaluated at
+    "now" rounded down to the TTL, so identical queries within a window share one result.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        timeout_seconds: float,
+        cache_ttl_seconds: float = 10.0,
+        retries: int = 2,
+        backoff_seconds: float = 0.25,
+        pool_size: int = 4,
+        on_request: Optional[Callable[[], None]] = None,
+    ) -> None:
+        self.base_url = base_url.rstrip("/")
+        self.timeout_seconds = timeout_seconds
+        self.cache_ttl_seconds = cache_ttl_seconds
+        self.max_cache_entries = 256
+        self._on_request = on_request
+        self._cache: Dict[Any, Any] = {}  # key -> (expires_at monotonic, payload)
+        self._cache_lock = Lock()
+
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=0,  # a slow query is not retried; the deadline would just be multiplied
+            status=retries,
+            backoff_factor=backoff_seconds,
+            status_forcelist=(500, 502, 503, 504),
+            allowed_methods=frozenset({"GET"}),
+            raise_on_status=False,
+        )
+        self._session = requests.Session()
+        self._session.headers.update({"Accept-Encoding": "gzip"})
+        adapter = HTTPAdapter(max_retries=retry, pool_connections=1, pool_maxsize=pool_size)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+
+    def query(
+        self,
+        query: str,
+        eval_time: Optional[float] = None,
+        name: str = "adhoc",
+        timeout_seconds: Optional[float] = None,
+    ) -> Dict[str, Any]:
+        if eval_time is None and self.cache_ttl_seconds > 0:
+            eval_time = math.floor(time.time() / self.cache_ttl_seconds) * self.cache_ttl_seconds
+        params: Dict[str, Any] = {"query": query}
+        if eval_time is not None:
+            params["time"] = eval_time
+        return self._get("/api/v1/query", params, name, timeout_seconds)
+
+    def query_range(
+        self,
+        query: str,
+        start: float,
+        end: float,
+        step_seconds: float,
+        name: str = "adhoc",
+        timeout_seconds: Optional[float] = None,
+    ) -> Dict[str, Any]:
+        # Align to the step so repeated calls in the same step hit the cache
+        end = math.floor(end / step_seconds) * step_seconds
+        start = math.floor(start / step_seconds) * step_seconds
+        params = {"query": query, "start": start, "end": end, "step": step_seconds}
+        return self._get("/api/v1/query_range", params, name, timeout_seconds)
+
+    def _get(self, path: str, params: Dict[str, Any], name: str, timeout_seconds: Optional[float]) -> Dict[str, Any]:
+        key = (path, tuple(sorted(params.items())))
+        now = time.monotonic()
+        if self.cache_ttl_seconds > 0:
+            with self._cache_lock:
+                cached = self._cache.get(key)
+            if cached and cached[0] > now:
+                PROM_CACHE_REQUESTS_TOTAL.labels(result="hit").inc()
+                return cached[1]
+            PROM_CACHE_REQUESTS_TOTAL.labels(result="miss").inc()
+
+        if self._on_request is not None:
+            self._on_request()
+        start = time.perf_counter()
+        outcome = "error"
+        try:
+            with _PhaseTimer("prometheus", name):
+                response = self._session.get(
+                    f"{self.base_url}{path}", params=params, timeout=timeout_seconds or self.timeout_seconds
+                )
+                response.raise_for_status()
+                payload = response.json()
+            outcome = "success"
+        finally:
+            PROM_QUERY_DURATION.labels(query=name, outcome=outcome).observe(time.perf_counter() - start)
+
+        if self.cache_ttl_seconds > 0:
+            with self._cache_lock:
+                if len(self._cache) >= self.max_cache_entries:
+                    self._cache = {k: v for k, v in self._cache.items() if v[0] > now}
+                if len(self._cache) < self.max_cache_entries:
+                    self._cache[key] = (time.monotonic() + self.cache_ttl_seconds, payload)
+        return payload
+
+
+@dataclass
+class TrendFinding:
+    kind: str  # memory|disk|restarts
+    entity: str
+    current: float
+    slope_per_hour: float
+    seconds_to_exhaustion: Optional[float]
+    score: float  # ranking key; >= 1.0 means past a threshold or exhausting within the horizon
+    reason: str
+
+
+def _series_entity(metric: Dict[str, str]) -> str:
+    """Readable identity for a series: container/service name, else filesystem, else target."""
+    for label in ("container_name", "com_docker_compose_service", "container_label_com_docker_compose_service", "name"):
+        if metric.get(label):
+            return metric[label]
+    if metric.get("mountpoint"):
+        return f"{metric.get('instance', '')}:{metric['mountpoint']}"
+    return metric.get("instance") or metric.get("job") or "unknown"
+
+
+class TrendForecaster:
+    """
+    Fits trends for every container's memory, every filesystem's free space and every
+    target's flap rate from one query_range per signal, vectorized with NumPy.
+
+    Each signal becomes an (n_series x n_steps) matrix aligned on the step grid (NaN for
+    gaps). A least-squares line (or Holt's linear trend) is fitted per row in one pass and
+    turned into time-to-exhaustion estimates and a ranked list of concerning trends.
+    """
+
+    MEMORY_QUERY = "docker_container_mem_usage"
+    MEMORY_LIMIT_QUERY = "docker_container_mem_limit"
+    DISK_QUERY = 'node_filesystem_avail_bytes{fstype!~"tmpfs|overlay|squashfs|ramfs"}'
+    DISK_SIZE_QUERY = 'node_filesystem_size_bytes{fstype!~"tmpfs|overlay|squashfs|ramfs"}'
+    RESTARTS_QUERY = "changes(up[1h])"
+
+    def __init__(
+        self,
+        prom: PrometheusClient,
+        window_hours: float = 6.0,
+        step_seconds: float = 300.0,
+        horizon_hours: float = 24.0,
+        method: str = "linear",
+        mem_growth_bytes: float = 300e6,
+        mem_growth_window_hours: float = 2.0,
+        disk_min_free_percent: float = 20.0,
+        max_flaps_per_hour: float = 5.0,
+    ) -> None:
+        self._prom = prom
+        self.window_hours = window_hours
+        self.step_seconds = step_seconds
+        self.horizon_seconds = horizon_hours * 3600
+        self.method = method
+        self.mem_growth_bytes = mem_growth_bytes
+        self.mem_growth_window_hours = mem_growth_window_hours
+        self.disk_min_free_percent = disk_min_free_percent
+        self.max_flaps_per_hour = max_flaps_per_hour
+        self.holt_alpha = 0.5
+        self.holt_beta = 0.3
+
+    def run(self) -> List[TrendFinding]:
+        """Fit all signals and return concerning trends, most urgent first."""
+        end = time.time()
+        start = end - self.window_hours * 3600
+        findings: List[TrendFinding] = []
+        findings += self._memory(start, end)
+        findings += self._disk(start, end)
+        findings += self._restarts(start, end)
+        findings.sort(key=lambda f: f.score, reverse=True)
+        FORECAST_FINDINGS.set(len(findings))
+        FORECAST_ENTITY_LABELS.sweep()
+        return findings
+
+    # -- data ------------------------------------------------------------------
+    def _matrix(self, query: str, name: str, start: float, end: float) -> Tuple[List[str], Any]:
+        payload = self._prom.query_range(query, start, end, self.step_seconds, name=name)
+        series = payload.get("data", {}).get("result", [])
+        grid_start = math.floor(start / self.step_seconds) * self.step_seconds
+        n_steps = int(round((end - grid_start) / self.step_seconds)) + 1
+        matrix = np.full((len(series), n_steps), np.nan)
+        entities: List[str] = []
+        for row, s in enumerate(series):
+            entities.append(_series_entity(s.get("metric", {})))
+            values = s.get("values") or []
+            if not values:
+                continue
+            points = np.asarray(values, dtype=float)
+            cols = np.rint((points[:, 0] - grid_start) / self.step_seconds).astype(int)
+            keep = (cols >= 0) & (cols < n_steps)
+            matrix[row, cols[keep]] = points[keep, 1]
+        return entities, matrix
+
+    def _instant(self, query: str, name: str) -> Dict[str, float]:
+        payload = self._prom.query(query, name=name)
+        out: Dict[str, float] = {}
+        for s in payload.get("data", {}).get("result", []):
+            try:
+                out[_series_entity(s.get("metric", {}))] = float(s.get("value", [0, "nan"])[1])
+            except (TypeError, ValueError):
+                continue
+        return out
+
+    # -- fitting ---------------------------------------------------------------
+    def _fit(self, matrix: Any) -> Tuple[Any, Any]:
+        """Return (slope per second, last observed value) for every row."""
+        mask = ~np.isnan(matrix)
+        x = np.arange(matrix.shape[1], dtype=float) * self.step_seconds
+        idx = np.where(mask, np.arange(matrix.shape[1]), -1).max(axis=1)
+        last = np.where(idx >= 0, matrix[np.arange(matrix.shape[0]), np.maximum(idx, 0)], np.nan)
+        if self.method == "holt":
+            return self._fit_holt(matrix, mask), last
+
+        n = mask.sum(axis=1).astype(float)
+        xs = np.where(mask, x, 0.0)
+        ys = np.where(mask, matrix, 0.0)
+        sx, sy = xs.sum(axis=1), ys.sum(axis=1)
+        sxx, sxy = (xs * xs).sum(axis=1), (xs * ys).sum(axis=1)
+        denom = n * sxx - sx * sx
+        with np.errstate(divide="ignore", invalid="ignore"):
+            slope = np.where((n >= 3) & (denom > 0), (n * sxy - sx * sy) / denom, np.nan)
+        return slope, last
+
+    def _fit_holt(self, matrix: Any, mask: Any) -> Any:
+        """Holt's linear trend, iterated over time but vectorized across series."""
+        level = np.full(matrix.shape[0], np.nan)
+        trend = np.zeros(matrix.shape[0])
+        seen = np.zeros(matrix.shape[0], dtype=int)
+        a, b = self.holt_alpha, self.holt_beta
+        for col in range(matrix.shape[1]):
+            y, ok = matrix[:, col], mask[:, col]
+            first = ok & (seen == 0)
+            level = np.where(first, y, level)
+            upd = ok & (seen > 0)
+            new_level = a * y + (1 - a) * (level + trend)
+            new_trend = b * (new_level - level) + (1 - b) * trend
+            level = np.where(upd, new_level, np.where(ok | (seen == 0), level, level + trend))
+            trend = np.where(upd, new_trend, trend)
+            seen += ok
+        return np.where(seen >= 3, trend / self.step_seconds, np.nan)
+
+    def _export(self, kind: str, entities: List[str], slope: Any, tte: Optional[Any] = None) -> None:
+        for i, entity in enumerate(entities):
+            if np.isnan(slope[i]):
+                continue
+            series = FORECAST_ENTITY_LABELS.label(entity)
+            FORECAST_SLOPE.labels(kind=kind, entity=series).set(float(slope[i]) * 3600)
+            if tte is not None:
+                FORECAST_EXHAUSTION_SECONDS.labels(kind=kind, entity=series).set(float(tte[i]))
+
+    # -- signals ---------------------------------------------------------------
+    def _memory(self, start: float, end: float) -> List[TrendFinding]:
+        entities, matrix = self._matrix(self.MEMORY_QUERY, "forecast_memory", start, end)
+        if not entities:
+            return []
+        limits_by_entity = self._instant(self.MEMORY_LIMIT_QUERY, "forecast_memory_limit")
+        slope, last = self._fit(matrix)
+        limits = np.array([limits_by_entity.get(e, np.nan) for e in entities])
+        with np.errstate(divide="ignore", invalid="ignore"):
+            tte = np.where((slope > 0) & (limits > last), (limits - last) / slope, np.inf)
+        self._export("memory", entities, slope, tte)
+
+        growth = slope * self.mem_growth_window_hours * 3600
+        scores = np.fmax(growth / self.mem_growth_bytes, self.horizon_seconds / np.fmax(tte, 1.0))
+        findings = []
+        for i in np.flatnonzero(scores >= 1.0):
+            eta = f", limit in {tte[i] / 3600:.1f}h" if np.isfinite(tte[i]) else ""
+            findings.append(TrendFinding(
+                kind="memory",
+                entity=entities[i],
+                current=float(last[i]),
+                slope_per_hour=float(slope[i] * 3600),
+                seconds_to_exhaustion=float(tte[i]) if np.isfinite(tte[i]) else None,
+                score=float(scores[i]),
+                reason=f"Memory growth: {entities[i]} +{growth[i] / 1e6:.0f}MB/{self.mem_growth_window_hours:g}h{eta}",
+            ))
+        return findings
+
+    def _disk(self, start: float, end: float) -> List[TrendFinding]:
+        entities, matrix = self._matrix(self.DISK_QUERY, "forecast_disk", start, end)
+        if not entities:
+            return []
+        sizes_by_entity = self._instant(self.DISK_SIZE_QUERY, "forecast_disk_size")
+        slope, last = self._fit(matrix)
+        sizes = np.array([sizes_by_entity.get(e, np.nan) for e in entities])
+        with np.errstate(divide="ignore", invalid="ignore"):
+            tte = np.where(slope < 0, last / -slope, np.inf)
+            free_pct = last / sizes * 100
+        self._export("disk", entities, slope, tte)
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            scores = np.fmax(
+                self.horizon_seconds / np.fmax(tte, 1.0),
+                np.where(np.isnan(free_pct), 0.0, self.disk_min_free_percent / np.fmax(free_pct, 0.01)),
+            )
+        findings = []
+        for i in np.flatnonzero(scores >= 1.0):
+            parts = [f"Disk space: {entities[i]}"]
+            if not np.isnan(free_pct[i]):
+                parts.append(f"{free_pct[i]:.0f}% free")
+            if np.isfinite(tte[i]):
+                parts.append(f"full in {tte[i] / 3600:.1f}h")
+            findings.append(TrendFinding(
+                kind="disk",
+                entity=entities[i],
+                current=float(last[i]),
+                slope_per_hour=float(slope[i] * 3600),
+                seconds_to_exhaustion=float(tte[i]) if np.isfinite(tte[i]) else None,
+                score=float(scores[i]),
+                reason=", ".join(parts),
+            ))
+        return findings
+
+    def _restarts(self, start: float, end: float) -> List[TrendFinding]:
+        entities, matrix = self._matrix(self.RESTARTS_QUERY, "forecast_restarts", start, end)
+        if not entities:
+            return []
+        slope, last = self._fit(matrix)
+        self._export("restarts", entities, slope)
+        scores = np.where(np.isnan(last), 0.0, last / self.max_flaps_per_hour)
+        findings = []
+        for i in np.flatnonzero(scores > 1.0):
+            findings.append(TrendFinding(
+                kind="restarts",
+                entity=entities[i],
+                current=float(last[i]),
+                slope_per_hour=float(slope[i] * 3600) if not np.isnan(slope[i]) else 0.0,
+                seconds_to_exhaustion=None,
+                score=float(scores[i]),
+                reason=f"High restart frequency: {entities[i]} {last[i]:.0f} flaps/h",
+            ))
+        return findings
+
+
+class P2Quantile:
+    """
+    P-square streaming quantile estimate (Jain & Chlamtac, 1985): five markers whose
+    heights track the min, p/2, p, (1+p)/2 and max quantiles, in constant memory.
+    """
+
+    __slots__ = ("p", "heights", "positions", "count")
+
+    def __init__(self, p: float, heights: Optional[List[float]] = None,
+                 positions: Optional[List[int]] = None, count: int = 0) -> None:
+        self.p = p
+        self.heights = list(heights or [])
+        self.positions = list(positions or [0, 1, 2, 3, 4])
+        self.count = count
+
+    def add(self, x: float) -> None:
+        self.count += 1
+        q, n = self.heights, self.positions
+        if self.count <= 5:
+            bisect.insort(q, x)
+            return
+        if x < q[0]:
+            q[0] = x
+            k = 0
+        elif x >= q[4]:
+            q[4] = x
+            k = 3
+        else:
+            k = min(3, bisect.bisect_right(q, x) - 1)
+        for i in range(k + 1, 5):
+            n[i] += 1
+        last = self.count - 1
+        desired = (0.0, last * self.p / 2, last * self.p, last * (1 + self.p) / 2, float(last))
+        for i in (1, 2, 3):
+            d = desired[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                step = 1 if d > 0 else -1
+                parabolic = q[i] + step / (n[i + 1] - n[i - 1]) * (
+                    (n[i] - n[i - 1] + step) * (q[i + 1] - q[i]) / (n[i + 1] - n[i])
+                    + (n[i + 1] - n[i] - step) * (q[i] - q[i - 1]) / (n[i] - n[i - 1])
+                )
+                if q[i - 1] < parabolic < q[i + 1]:
+                    q[i] = parabolic
+                else:
+                    q[i] += step * (q[i + step] - q[i]) / (n[i + step] - n[i])
+                n[i] += step
+
+    def value(self) -> Optional[float]:
+        if not self.heights:
+            return None
+        if self.count <= 5:
+            return self.heights[min(len(self.heights) - 1, int(round(self.p * (len(self.heights) - 1))))]
+        return self.heights[2]
+
+
+def _round_sig(value: float) -> float:
+    return float(f"{value:.6g}")
+
+
+class ResourceBaseline:
+    """
+    Streaming baseline of one resource of one container: an EWMA mean and variance (the
+    adaptive "normal"), Welford's lifetime mean/variance and a P-square p95.
+    """
+
+    __slots__ = ("ewma", "ewm_var", "count", "mean", "m2", "p95", "updated", "streak")
+
+    def __init__(self) -> None:
+        self.ewma = 0.0
+        self.ewm_var = 0.0
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.p95 = P2Quantile(0.95)
+        self.updated = 0.0
+        self.streak = 0  # consecutive anomalous samples
+
+    @property
+    def stddev(self) -> float:
+        return math.sqrt(max(0.0, self.ewm_var))
+
+    def update(self, x: float, alpha: float, now: float, outlier: bool = False) -> None:
+        if self.count == 0:
+            self.ewma = x
+        else:
+            diff = x - self.ewma
+            increment = alpha * diff
+            self.ewma += increment
+            # An outlier still drags the EWMA (a lasting level shift is absorbed after a
+            # few runs) but would inflate the variance enough to hide its own follow-ups
+            if not outlier:
+                self.ewm_var = (1 - alpha) * (self.ewm_var + diff * increment)
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (x - self.mean)
+        self.p95.add(x)
+        self.updated = now
+
+    def to_state(self) -> Dict[str, Any]:
+        return {
+            "ewma": _round_sig(self.ewma), "ewm_var": _round_sig(self.ewm_var), "count": self.count,
+            "mean": _round_sig(self.mean), "m2": _round_sig(self.m2), "updated": round(self.updated),
+            "p95": [[_round_sig(h) for h in self.p95.heights], self.p95.positions],
+        }
+
+    @classmethod
+    def from_state(cls, state: Dict[str, Any]) -> "ResourceBaseline":
+        baseline = cls()
+        baseline.ewma = float(state["ewma"])
+        baseline.ewm_var = float(state["ewm_var"])
+        baseline.count = int(state["count"])
+        baseline.mean = float(state["mean"])
+        baseline.m2 = float(state["m2"])
+        baseline.updated = float(state["updated"])
+        heights, positions = state["p95"]
+        baseline.p95 = P2Quantile(0.95, [float(h) for h in heights], [int(n) for n in positions], baseline.count)
+        return baseline
+
+
+class ContainerStatsCollector:
+    """
+    Per-container resource baselines from the Docker stats API.
+
+    Each run lists the running containers of every host and reads one-shot stats for all
+    of them concurrently (API >= 1.41; older daemons fall back to the slower two-sample
+    read). CPU, network and block I/O rates come from the counters of consecutive runs.
+    Every (host, container, resource) series keeps a ResourceBaseline; a sample is
+    anomalous once the baseline has warmup samples, it sits z_threshold standard
+    deviations above the EWMA and above the p95, and that held for anomaly_samples runs
+    in a row. Small absolute deviations never count (MIN_STDDEV).
+
+    Baselines change on every run, so the copy handed to the state file is only refreshed
+    every persist_seconds; checkpoints in between see unchanged state and skip the write.
+    """
+
+    RESOURCES = (
+        "cpu_percent", "memory_bytes", "net_rx_bytes_per_second", "net_tx_bytes_per_second",
+        "blk_read_bytes_per_second", "blk_write_bytes_per_second",
+    )
+    MIN_STDDEV = {
+        "cpu_percent": 2.0,
+        "memory_bytes": 32 * 2**20,
+        "net_rx_bytes_per_second": 256 * 2**10,
+        "net_tx_bytes_per_second": 256 * 2**10,
+        "blk_read_bytes_per_second": 256 * 2**10,
+        "blk_write_bytes_per_second": 256 * 2**10,
+    }
+    STATS = ("ewma", "stddev", "mean", "p95")
+
+    def __init__(
+        self,
+        alpha: float = 0.1,
+        warmup_samples: int = 30,
+        z_threshold: float = 4.0,
+        anomaly_samples: int = 2,
+        forget_seconds: float = 604800.0,
+        concurrency: int = 8,
+        on_request: Optional[Callable[[str, int], None]] = None,
+        persist_seconds: float = 900.0,
+    ) -> None:
+        self.alpha = alpha
+        self.warmup_samples = warmup_samples
+        self.z_threshold = z_threshold
+        self.anomaly_samples = max(1, anomaly_samples)
+        self.forget_seconds = forget_seconds
+        self._pool = ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="docker-stats")
+        self._on_request = on_request or (lambda source, n: None)
+        self._lock = Lock()
+        self.baselines: Dict[Tuple[str, str, str], ResourceBaseline] = {}
+        self._counters: Dict[Tuple[str, str], Dict[str, float]] = {}  # (host, container) -> last counters
+        self._one_shot: Dict[str, bool] = {}
+        self.persist_seconds = persist_seconds
+        self._persisted: Optional[Dict[str, Any]] = None
+        self._persisted_at = 0.0  # monotonic
+
+    def run(self, hosts: List["DockerHost"]) -> List[Dict[str, Any]]:
+        """Sample every running container once; returns the currently anomalous series."""
+        jobs = []
+        for host in hosts:
+            try:
+                running = host.client.api.containers(filters={"status": "running"})
+                self._on_request("docker_list", 1)
+            except Exception as e:
+                _log("warn", "Docker stats listing failed", host=host.name, error=str(e))
+                continue
+            for c in running:
+                names = c.get("Names") or []
+                name = names[0].lstrip("/") if names else c["Id"][:12]
+                jobs.append((host, name, self._pool.submit(contextvars.copy_context().run, self._read, host, c["Id"])))
+
+        anomalies: List[Dict[str, Any]] = []
+        sampled = set()
+        for host, name, future in jobs:
+            try:
+                stats, read_at = future.result(timeout=host.timeout_seconds + 1)
+            except Exception as e:
+                _log("debug", "Docker stats read failed", host=host.name, container=name, error=str(e))
+                continue
+            sampled.add((host.name, name))
+            anomalies.extend(self.observe(host.name, name, stats, read_at))
+        now = time.time()
+        with self._lock:
+            self._counters = {k: v for k, v in self._counters.items() if k in sampled}
+            for key in [k for k, b in self.baselines.items() if now - b.updated > self.forget_seconds]:
+                del self.baselines[key]
+        return anomalies
+
+    def _read(self, host: "DockerHost", container_id: str) -> Tuple[Dict[str, Any], float]:
+        api = host.client.api
+        self._on_request("docker_stats", 1)
+        if self._one_shot.get(host.name, True):
+            try:
+                return api.stats(container_id, stream=False, one_shot=True), time.time()
+            except docker.errors.InvalidVersion:
+                self._one_shot[host.name] = False
+        return api.stats(container_id, stream=False), time.time()
+
+    @staticmethod
+    def _counters_of(stats: Dict[str, Any], read_at: float) -> Dict[str, float]:
+        cpu = stats.get("cpu_stats") or {}
+        usage = cpu.get("cpu_usage") or {}
+        networks = (stats.get("networks") or {}).values()
+        blkio = (stats.get("blkio_stats") or {}).get("io_service_bytes_recursive") or []
+        return {
+            "at": read_at,
+            "cpu_total": float(usage.get("total_usage") or 0),
+            "cpu_system": float(cpu.get("system_cpu_usage") or 0),
+            "cpus": float(cpu.get("online_cpus") or len(usage.get("percpu_usage") or []) or 1),
+            "net_rx": float(sum(n.get("rx_bytes", 0) for n in networks)),
+            "net_tx": float(sum(n.get("tx_bytes", 0) for n in networks)),
+            "blk_read": float(sum(e.get("value", 0) for e in blkio if (e.get("op") or "").lower() == "read")),
+            "blk_write": float(sum(e.get("value", 0) for e in blkio if (e.get("op") or "").lower() == "write")),
+        }
+
+    def _values(self, stats: Dict[str, Any], current: Dict[str, float],
+                previous: Optional[Dict[str, float]]) -> Dict[str, float]:
+        values: Dict[str, float] = {}
+        memory = stats.get("memory_stats") or {}
+        if memory.get("usage") is not None:
+            detail = memory.get("stats") or {}
+            # Same as `docker stats`: page cache that can be reclaimed doesn't count
+            cache = detail.get("inactive_file", detail.get("total_inactive_file", detail.get("cache", 0)))
+            values["memory_bytes"] = float(memory["usage"] - (cache or 0))
+        if previous is None:
+            return values
+        elapsed = current["at"] - previous["at"]
+        system = current["cpu_system"] - previous["cpu_system"]
+        cpu = current["cpu_total"] - previous["cpu_total"]
+        if system > 0 and cpu >= 0:
+            values["cpu_percent"] = cpu / system * current["cpus"] * 100
+        if elapsed > 0:
+            for resource, counter in (
+                ("net_rx_bytes_per_second", "net_rx"), ("net_tx_bytes_per_second", "net_tx"),
+                ("blk_read_bytes_per_second", "blk_read"), ("blk_write_bytes_per_second", "blk_write"),
+            ):
+                delta = current[counter] - previous[counter]
+                if delta >= 0:  # negative: counters reset by a container restart
+                    values[resource] = delta / elapsed
+        return values
+
+    def observe(self, host: str, container: str, stats: Dict[str, Any], read_at: float) -> List[Dict[str, Any]]:
+        """Fold one stats sample into the container's baselines and export them."""
+        current = self._counters_of(stats, read_at)
+        label = CONTAINER_LABELS.label(container)
+        anomalies: List[Dict[str, Any]] = []
+        with self._lock:
+            previous = self._counters.get((host, container))
+            self._counters[(host, container)] = current
+            for resource, value in self._values(stats, current, previous).items():
+                baseline = self.baselines.get((host, container, resource))
+                if baseline is None:
+                    baseline = self.baselines[(host, container, resource)] = ResourceBaseline()
+                # Scored against the baseline before this sample is folded in
+                sigma = max(baseline.stddev, self.MIN_STDDEV[resource])
+                zscore = (value - baseline.ewma) / sigma if baseline.count else 0.0
+                p95 = baseline.p95.value()
+                if (
+                    baseline.count >= self.warmup_samples
+                    and zscore >= self.z_threshold
+                    and p95 is not None and value > p95
+                ):
+                    baseline.streak += 1
+                else:
+                    baseline.streak = 0
+                if baseline.streak >= self.anomaly_samples:
+                    if baseline.streak == self.anomaly_samples:
+                        CONTAINER_RESOURCE_ANOMALIES_TOTAL.labels(resource=resource).inc()
+                    anomalies.append({
+                        "host": host, "container": container, "resource": resource,
+                        "value": float(f"{value:.3g}"), "ewma": float(f"{baseline.ewma:.3g}"),
+                        "p95": float(f"{p95:.3g}"), "zscore": round(zscore, 1),
+                    })
+                baseline.update(value, self.alpha, read_at, outlier=baseline.streak > 0)
+                if label == LabelLifecycle.OVERFLOW:
+                    continue
+                CONTAINER_RESOURCE_ZSCORE.labels(host=host, container=label, resource=resource).set(zscore)
+                for stat, stat_value in (
+                    ("ewma", baseline.ewma), ("stddev", baseline.stddev),
+                    ("mean", baseline.mean), ("p95", baseline.p95.value() or 0.0),
+                ):
+                    CONTAINER_RESOURCE_BASELINE.labels(
+                        host=host, container=label, resource=resource, stat=stat
+                    ).set(stat_value)
+        return anomalies
+
+    def to_state(self, fresh: bool = False) -> Dict[str, Any]:
+        """Baselines as of the last refresh; fresh=True (shutdown) refreshes regardless."""
+        now = time.monotonic()
+        with self._lock:
+            if fresh or self._persisted is None or now - self._persisted_at >= self.persist_seconds:
+                self._persisted = {"/".join(key): b.to_state() for key, b in self.baselines.items()}
+                self._persisted_at = now
+            return self._persisted
+
+    def load_state(self, state: Dict[str, Any]) -> int:
+        now = time.time()
+        with self._lock:
+            for key, entry in state.items():
+                host, _, rest = key.partition("/")
+                container, _, resource = rest.rpartition("/")
+                if resource not in self.RESOURCES:
+                    continue
+                baseline = ResourceBaseline.from_state(entry)
+                if now - baseline.updated <= self.forget_seconds:
+                    self.baselines[(host, container, resource)] = baseline
+            return len(self.baselines)
+
+
+class _LogCursor:
+    __slots__ = ("since", "salient", "tail", "block_kind", "block_lines")
+
+    def __init__(self, salient_lines: int, tail_lines: int) -> None:
+        self.since: Optional[Tuple[int, int]] = None  # (epoch seconds, nanoseconds) of the last line read
+        self.salient: deque = deque(maxlen=salient_lines)
+        self.tail: deque = deque(maxlen=tail_lines)
+        self.block_kind: Optional[str] = None  # inside a multi-line traceback/panic
+        self.block_lines = 0
+
+
+class ContainerLogTracker:
+    """
+    Incremental log reader for failing containers.
+
+    Each container has a since= cursor, so a fetch only returns lines written after the
+    previous one. Lines are classified as they are read with precompiled patterns; salient
+    lines (tracebacks and panics with their indented frames, OOM, errors) go into a bounded
+    ring buffer and the last few lines are kept for context. Memory per container is fixed.
+    """
+
+    # First match wins; traceback/panic open a block that captures the indented lines after them
+    PATTERNS = [
+        ("traceback", re.compile(r"^Traceback \(most recent call last\)")),
+        ("panic", re.compile(r"^panic:|^fatal error:|^goroutine \d+ \[|\bFATAL\b")),
+        ("oom", re.compile(r"out of memory|OOMKilled|oom[-_ ]kill|cannot allocate memory|MemoryError", re.IGNORECASE)),
+        ("error", re.compile(r"\b(error|exception|failed|failure|refused|timed out|timeout)\b|\bE!|\[error\]|level=error", re.IGNORECASE)),
+    ]
+    BLOCK_KINDS = {"traceback", "panic"}
+    MAX_BLOCK_LINES = 40
+    MAX_LINE_CHARS = 500
+
+    def __init__(
+        self,
+        api: Any,
+        salient_lines: int = 50,
+        tail_lines: int = 10,
+        initial_tail: int = 200,
+        max_fetch_lines: int = 1000,
+        on_fetch: Optional[Callable[[], None]] = None,
+    ) -> None:
+        self._api = api
+        self.salient_lines = salient_lines
+        self.tail_lines = tail_lines
+        self.initial_tail = initial_tail
+        self.max_fetch_lines = max_fetch_lines
+        self._on_fetch = on_fetch
+        self._cursors: Dict[str, _LogCursor] = {}
+        self._lock = Lock()
+
+    def fetch(self, container: str) -> Dict[str, List[str]]:
+        """Read new log lines for a container and return its salient lines and recent tail."""
+        with self._lock:
+            cursor = self._cursors.get(container)
+            if cursor is None:
+                cursor = self._cursors[container] = _LogCursor(self.salient_lines, self.tail_lines)
+        if self._on_fetch is not None:
+            self._on_fetch()
+        if cursor.since is None:
+            raw = self._api.logs(container, timestamps=True, tail=self.initial_tail)
+        else:
+            since = cursor.since[0] + cursor.since[1] / 1e9
+            raw = self._api.logs(container, timestamps=True, since=since, tail=self.max_fetch_lines)
+        self._consume(cursor, raw.decode("utf-8", errors="ignore"))
+        return {"salient": list(cursor.salient), "tail": list(cursor.tail)}
+
+    def retain(self, containers: set) -> None:
+        """Drop cursors for containers that no longer exist."""
+        with self._lock:
+            for name in [n for n in self._cursors if n not in containers]:
+                del self._cursors[name]
+
+    @staticmethod
+    def _parse_timestamp(ts: str) -> Optional[Tuple[int, int]]:
+        # RFC3339Nano as emitted by Docker, e.g. 2024-05-01T12:00:00.123456789Z (fraction width varies)
+        try:
+            base, _, frac = ts.rstrip("Z").partition(".")
+            seconds = int(datetime.strptime(base, "%Y-%m-%dT%H:%M:%S").replace(tzinfo=timezone.utc).timestamp())
+            return seconds, int((frac + "000000000")[:9]) if frac else 0
+        except ValueError:
+            return None
+
+    def _consume(self, cursor: _LogCursor, text: str) -> None:
+        for raw_line in text.splitlines():
+            ts_text, _, line = raw_line.partition(" ")
+            ts = self._parse_timestamp(ts_text)
+            if ts is None:
+                line = raw_line
+            elif cursor.since is not None and ts <= cursor.since:
+                continue  # since= is inclusive; skip lines already seen
+            else:
+                cursor.since = ts
+            line = line.rstrip()[: self.MAX_LINE_CHARS]
+            if not line:
+                continue
+            cursor.tail.append(line)
+
+            # Continuation of a traceback/panic: indented frames, then the closing exception line
+            if cursor.block_kind is not None and cursor.block_lines < self.MAX_BLOCK_LINES:
+                if line[:1].isspace() or cursor.block_kind == "panic":
+                    cursor.salient.append(line)
+                    cursor.block_lines += 1
+                    LOG_LINES_CLASSIFIED_TOTAL.labels(kind=cursor.block_kind).inc()
+                    continue
+                cursor.salient.append(line)  # e.g. "ValueError: ..." ends a Python traceback
+                LOG_LINES_CLASSIFIED_TOTAL.labels(kind=cursor.block_kind).inc()
+                cursor.block_kind = None
+                continue
+            cursor.block_kind = None
+
+            kind = "other"
+            for name, pattern in self.PATTERNS:
+                if pattern.search(line):
+                    kind = name
+                    break
+            LOG_LINES_CLASSIFIED_TOTAL.labels(kind=kind).inc()
+            if kind == "other":
+                continue
+            cursor.salient.append(line)
+            if kind in self.BLOCK_KINDS:
+                cursor.block_kind = kind
+                cursor.block_lines = 0
+
+
+class ContainerStateTable:
+    """
+    In-memory container state kept current by the Docker events stream.
+
+    A daemon thread applies start/restart/die/health_status/destroy events as they arrive.
+    Full listings only happen when the stream (re)connects and every resync_seconds, so
+    steady-state reads cost no Docker API calls.
+    """
+
+    EVENTS = ["start", "restart", "die", "health_status", "destroy"]
+
+    def __init__(
+        self,
+        client: Any,
+        list_states: Callable[[], List[Dict[str, Any]]],
+        resync_seconds: float,
+        on_failure: Optional[Callable[[Dict[str, Any]], None]] = None,
+    ) -> None:
+        self._client = client
+        self._list_states = list_states
+        self.resync_seconds = resync_seconds
+        self._on_failure = on_failure
+        self._lock = Lock()
+        self._containers: Dict[str, Dict[str, Any]] = {}  # container id -> state
+        self._event_at: Dict[str, float] = {}  # container id -> monotonic time of last event
+        self._synced_at: Optional[float] = None
+        self._stream: Any = None
+        self._stop = Event()
+
+    @property
+    def ready(self) -> bool:
+        return self._synced_at is not None
+
+    def start(self) -> None:
+        Thread(target=self._run, name="docker-events", daemon=True).start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._stream is not None:
+            try:
+                self._stream.close()
+            except Exception:
+                pass
+
+    def resync(self) -> None:
+        """Replace the table with a full listing, keeping entries changed by events meanwhile."""
+        started = time.monotonic()
+        states = self._list_states()
+        with self._lock:
+            fresh = {st["id"]: {k: v for k, v in st.items() if k != "id"} for st in states}
+            for cid, at in self._event_at.items():
+                if at >= started:
+                    if cid in self._containers:
+                        fresh[cid] = self._containers[cid]
+                    else:
+                        fresh.pop(cid, None)  # destroyed while listing
+            self._containers = fresh
+            self._event_at = {cid: at for cid, at in self._event_at.items() if cid in fresh}
+            self._synced_at = time.monotonic()
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        if self._synced_at is not None and time.monotonic() - self._synced_at >= self.resync_seconds:
+            self.resync()
+        with self._lock:
+            return [dict(c) for c in self._containers.values()]
+
+    def _run(self) -> None:
+        backoff = 1.0
+        while not self._stop.is_set():
+            try:
+                # Subscribe before listing so nothing between the two is missed
+                self._stream = self._client.events(
+                    decode=True, filters={"type": "container", "event": self.EVENTS}
+                )
+                self.resync()
+                _log("info", "Docker events stream connected", containers=len(self._containers))
+                backoff = 1.0
+                for event in self._stream:
+                    self.apply(event)
+            except Exception as e:
+                if not self._stop.is_set():
+                    _log("warn", "Docker events stream error", error=str(e))
+            # Until the next resync the table may be missing events; fall back to polling
+            self._synced_at = None
+            self._stop.wait(backoff)
+            backoff = min(backoff * 2, 60.0)
+
+    def apply(self, event: Dict[str, Any]) -> None:
+        action = event.get("Action") or event.get("status") or ""
+        actor = event.get("Actor") or {}
+        attributes = actor.get("Attributes") or {}
+        cid = actor.get("ID") or event.get("id")
+        if not cid:
+            return
+
+        with self._lock:
+            self._event_at[cid] = time.monotonic()
+            if action == "destroy":
+                self._containers.pop(cid, None)
+                return
+            entry = self._containers.get(cid) or {
+                "name": None, "status": None, "health": None, "exit_code": None,
+            }
+            if attributes.get("name"):
+                entry["name"] = attributes["name"]
+            if action == "die":
+                entry["status"] = "exited"
+                try:
+                    entry["exit_code"] = int(attributes.get("exitCode", 0))
+                except (TypeError, ValueError):
+                    entry["exit_code"] = None
+            elif action in {"start", "restart"}:
+                entry["status"] = "running"
+                entry["exit_code"] = 0
+                if entry.get("health"):
+                    entry["health"] = "starting"
+            elif action.startswith("health_status"):
+                entry["health"] = action.split(":", 1)[-1].strip() or None
+            else:
+                return
+            self._containers[cid] = entry
+            failing = _is_failing(entry)
+
+        if failing and self._on_failure is not None:
+            self._on_failure(dict(entry))
+
+
+@dataclass
+class MqttStream:
+    name: str
+    topic_filter: str
+    stale_seconds: float
+
+
+class _Heartbeat:
+    __slots__ = ("last_seen", "count")
+
+    def __init__(self, last_seen: float, count: int = 0) -> None:
+        self.last_seen = last_seen
+        self.count = count
+
+
+class MqttHeartbeatTracker:
+    """
+    Last-seen time and message rate per (stream, device) from one MQTT subscription.
+
+    paho's network thread calls handle() for every message: a dict lookup of the topic
+    (each topic is matched against the stream filters once, then cached) and two field
+    updates. publish() runs on the scheduler: it turns counters into smoothed rates,
+    exports the gauges and returns the devices silent for longer than their stream's
+    stale_seconds. Devices are tracked from their first message and forgotten after
+    forget_seconds of silence.
+
+    The device is the part of the topic matched by wildcards: esp-sensor-hub/<device>/status
+    for "esp-sensor-hub/+/status", and everything but the last level for "#" filters
+    (surveillance/camera/<device>/snapshot -> camera/<device>).
+    """
+
+    RATE_ALPHA = 0.3  # EWMA weight of the newest rate sample
+
+    def __init__(
+        self,
+        url: str,
+        streams: List[MqttStream],
+        max_devices: int = 500,
+        forget_seconds: float = 604800.0,
+        username: Optional[str] = None,
+        password: Optional[str] = None,
+    ) -> None:
+        parsed = urlparse(url if "://" in url else f"tcp://{url}")
+        self.url = url
+        self.host = parsed.hostname or "localhost"
+        self.tls = parsed.scheme in {"ssl", "mqtts", "tls"}
+        self.port = parsed.port or (8883 if self.tls else 1883)
+        self.streams = streams
+        self.max_devices = max_devices
+        self.forget_seconds = forget_seconds
+        self.username = username
+        self.password = password
+        self.connected = False
+        self._filters = [(s, s.topic_filter.split("/")) for s in streams]
+        self._stale_seconds = {s.name: s.stale_seconds for s in streams}
+        self._routes: Dict[str, Any] = {}  # topic -> (stream, device), or "" if unmatched
+        self._beats: Dict[Tuple[str, str], _Heartbeat] = {}
+        self._lock = Lock()
+        self._capped = False
+        # publish() state, only touched by the scheduler thread
+        self._published_at: Optional[float] = None
+        self._rates: Dict[Tuple[str, str], Tuple[int, Optional[float]]] = {}  # key -> (count, rate)
+        self._client: Any = None
+
+    @staticmethod
+    def _match(filter_parts: List[str], parts: List[str]) -> Optional[str]:
+        device: List[str] = []
+        for i, part in enumerate(filter_parts):
+            if part == "#":
+                rest = parts[i:]
+                device.extend(rest[:-1] if len(rest) > 1 else rest)
+                break
+            if i >= len(parts):
+                return None
+            if part == "+":
+                device.append(parts[i])
+            elif part != parts[i]:
+                return None
+        else:
+            if len(parts) != len(filter_parts):
+                return None
+        return "/".join(device) or parts[-1]
+
+    def _route(self, topic: str) -> Any:
+        parts = topic.split("/")
+        key: Any = ""
+        for stream, filter_parts in self._filters:
+            device = self._match(filter_parts, parts)
+            if device is not None:
+                key = (stream.name, device)
+                break
+        if len(self._routes) >= self.max_devices * 4:
+            self._routes.clear()  # bounds memory if devices put ids or counters in topics
+        self._routes[topic] = key
+        return key
+
+    def handle(self, topic: str, now: Optional[float] = None) -> None:
+        key = self._routes.get(topic)
+        if key is None:
+            key = self._route(topic)
+        if not key:
+            return
+        now = time.time() if now is None else now
+        with self._lock:
+            beat = self._beats.get(key)
+            if beat is None:
+                if len(self._beats) >= self.max_devices:
+                    self._capped = True
+                    return
+                beat = self._beats[key] = _Heartbeat(now)
+            beat.last_seen = now
+            beat.count += 1
+
+    def publish(self, now: Optional[float] = None) -> Dict[str, Any]:
+        """Export staleness/rate gauges; returns {"connected", "devices", "silent": [...]}."""
+        now = time.time() if now is None else now
+        with self._lock:
+            for key in [k for k, b in self._beats.items() if now - b.last_seen > self.forget_seconds]:
+                del self._beats[key]
+            beats = [(key, b.last_seen, b.count) for key, b in self._beats.items()]
+            capped, self._capped = self._capped, False
+        if capped:
+            _log("warn", "MQTT device cap reached; new devices are not tracked", max_devices=self.max_devices)
+
+        elapsed = now - self._published_at if self._published_at is not None else 0.0
+        self._published_at = now
+        rates: Dict[Tuple[str, str], Tuple[int, Optional[float]]] = {}
+        messages: Dict[str, int] = {}
+        silent_by_stream = {s.name: 0 for s in self.streams}
+        silent: List[Dict[str, Any]] = []
+        overflow: Dict[str, Tuple[float, float]] = {}
+        for key, last_seen, count in beats:
+            stream, device = key
+            previous, rate = self._rates.get(key, (0, None))
+            delta = max(0, count - previous)
+            messages[stream] = messages.get(stream, 0) + delta
+            if elapsed > 0:
+                sample = delta / elapsed
+                rate = sample if rate is None else self.RATE_ALPHA * sample + (1 - self.RATE_ALPHA) * rate
+            rates[key] = (count, rate)
+
+            staleness = max(0.0, now - last_seen)
+            if staleness > self._stale_seconds.get(stream, float("inf")):
+                silent_by_stream[stream] = silent_by_stream.get(stream, 0) + 1
+                silent.append({"stream": stream, "device": device, "silent_seconds": int(staleness)})
+            label = MQTT_DEVICE_LABELS.label(device)
+            if label == LabelLifecycle.OVERFLOW:
+                worst, total = overflow.get(stream, (0.0, 0.0))
+                overflow[stream] = (max(worst, staleness), total + (rate or 0.0))
+                continue
+            MQTT_DEVICE_STALENESS_SECONDS.labels(stream=stream, device=label).set(staleness)
+            if rate is not None:
+                MQTT_DEVICE_MESSAGE_RATE.labels(stream=stream, device=label).set(rate)
+        for stream, (worst, total) in overflow.items():
+            MQTT_DEVICE_STALENESS_SECONDS.labels(stream=stream, device=LabelLifecycle.OVERFLOW).set(worst)
+            MQTT_DEVICE_MESSAGE_RATE.labels(stream=stream, device=LabelLifecycle.OVERFLOW).set(total)
+        self._rates = rates
+        for stream, n in messages.items():
+            if n:
+                MQTT_MESSAGES_TOTAL.labels(stream=stream).inc(n)
+        for stream, n in silent_by_stream.items():
+            MQTT_SILENT_DEVICES.labels(stream=stream).set(n)
+        MQTT_CONNECTED.set(1 if self.connected else 0)
+        MQTT_DEVICE_LABELS.sweep()
+        silent.sort(key=lambda d: -d["silent_seconds"])
+        return {"connected": self.connected, "devices": len(beats), "silent": silent}
+
+    def to_state(self) -> Dict[str, Any]:
+        """
+        Last-seen times rounded to half the stream's stale_seconds (at least a minute): the
+        state only changes when a device crosses a bucket, not on every message, so
+        unchanged checkpoints are still skipped, and a restored time is off by at most a
+        quarter of the threshold.
+        """
+        with self._lock:
+            beats = [(s, d, b.last_seen) for (s, d), b in self._beats.items()]
+        last_seen = []
+        for stream, device, seen in beats:
+            bucket = max(60.0, self._stale_seconds.get(stream, 0.0) / 2)
+            last_seen.append([stream, device, round(seen / bucket) * bucket])
+        return {"last_seen": last_seen}
+
+    def load_state(self, state: Dict[str, Any]) -> int:
+        """Seed last-seen times so a device that went quiet during a redeploy is still noticed."""
+        streams = set(self._stale_seconds)
+        now = time.time()
+        with self._lock:
+            for stream, device, last_seen in state.get("last_seen") or []:
+                if stream in streams and len(self._beats) < self.max_devices:
+                    # Rounding may have moved the newest times slightly into the future
+                    self._beats.setdefault((stream, device), _Heartbeat(min(float(last_seen), now)))
+            return len(self._beats)
+
+    def start(self) -> None:
+        """Connect in the background; paho reconnects (1-60s backoff) and on_connect resubscribes."""
+        client = mqtt.Client(
+            mqtt.CallbackAPIVersion.VERSION2,
+            client_id=f"ai-monitor-{socket.gethostname()}",
+            clean_session=True,
+        )
+        if self.username:
+            client.username_pw_set(self.username, self.password)
+        if self.tls:
+            client.tls_set()
+        client.on_connect = self._on_connect
+        client.on_disconnect = self._on_disconnect
+        client.on_message = lambda _client, _userdata, msg: self.handle(msg.topic)
+        client.on_connect_fail = lambda _client, _userdata: _log("debug", "MQTT connect failed; retrying", broker=self.url)
+        client.reconnect_delay_set(min_delay=1, max_delay=60)
+        client.connect_async(self.host, self.port, keepalive=60)
+        client.loop_start()
+        self._client = client
+
+    def stop(self) -> None:
+        if self._client is not None:
+            self._client.disconnect()
+            self._client.loop_stop()
+
+    def _on_connect(self, client: Any, userdata: Any, flags: Any, reason_code: Any, properties: Any = None) -> None:
+        if reason_code.is_failure:
+            _log("warn", "MQTT connection refused", broker=self.url, reason=str(reason_code))
+            return
+        client.subscribe([(s.topic_filter, 0) for s in self.streams])
+        self.connected = True
+        MQTT_CONNECTED.set(1)
+        _log("info", "MQTT heartbeat tracker connected", broker=self.url, topics=[s.topic_filter for s in self.streams])
+
+    def _on_disconnect(self, client: Any, userdata: Any, flags: Any, reason_code: Any, properties: Any = None) -> None:
+        was_connected, self.connected = self.connected, False
+        MQTT_CONNECTED.set(0)
+        if was_connected:
+            _log("warn", "MQTT heartbeat tracker disconnected", broker=self.url, reason=str(reason_code))
+
+
+@dataclass
+class TriageRequest:
+    kind: str  # http|docker|predictive
+    fingerprint: str
+    snapshot: Dict[str, Any]
+    enqueued_at: float  # monotonic
+
+
+class TriageWorker:
+    """
+    Runs triage off the monitoring loop on a single daemon thread.
+
+    The queue is bounded and keyed by incident fingerprint: a new request for an incident
+    that is still waiting replaces the queued snapshot (keeping its place in line), and when
+    the queue is full the oldest request is dropped.
+    """
+
+    def __init__(self, handler: Callable[[TriageRequest], None], max_queue: int) -> None:
+        self._handler = handler
+        self.max_queue = max(1, max_queue)
+        self._pending: Dict[str, TriageRequest] = {}  # insertion order = queue order
+        self._cond = threading.Condition()
+        self._busy = False
+        self._started = False
+
+    @property
+    def started(self) -> bool:
+        return self._started
+
+    def start(self) -> None:
+        self._started = True
+        Thread(target=self._run, name="triage-worker", daemon=True).start()
+
+    def submit(self, request: TriageRequest) -> None:
+        with self._cond:
+            previous = self._pending.get(request.fingerprint)
+            if previous is not None:
+                TRIAGE_REQUESTS_DROPPED_TOTAL.labels(reason="replaced").inc()
+                # Keep the original position and wait time, but triage the newer snapshot
+                request.enqueued_at = previous.enqueued_at
+                self._pending[request.fingerprint] = request
+            else:
+                while len(self._pending) >= self.max_queue:
+                    oldest = next(iter(self._pending))
+                    dropped = self._pending.pop(oldest)
+                    TRIAGE_REQUESTS_DROPPED_TOTAL.labels(reason="overflow").inc()
+                    _log("warn", "Triage queue full; dropping oldest request",
+                         kind=dropped.kind, fingerprint=oldest)
+                self._pending[request.fingerprint] = request
+            TRIAGE_QUEUE_DEPTH.set(len(self._pending))
+            self._cond.notify()
+
+    def join(self, timeout: float) -> bool:
+        """Wait until the queue is empty and the worker is idle. Returns False on timeout."""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self._pending or self._busy:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                fingerprint = next(iter(self._pending))
+                request = self._pending.pop(fingerprint)
+                self._busy = True
+                TRIAGE_QUEUE_DEPTH.set(len(self._pending))
+            TRIAGE_QUEUE_WAIT_SECONDS.observe(time.monotonic() - request.enqueued_at)
+            try:
+                self._handler(request)
+            except Exception as e:
+                _log("error", "Triage worker error", kind=request.kind, error=str(e))
+            finally:
+                with self._cond:
+                    self._busy = False
+                    self._cond.notify_all()
+
+
+class RestartExecutor:
+    """
+    Restarts a set of containers in docker-compose dependency order.
+
+    The depends_on graph comes from the labels compose puts on every container. Containers
+    are grouped into levels (dependencies first); each level is restarted concurrently, and
+    every restart is verified by polling until the container reports healthy (or simply
+    running when it has no healthcheck) within verify_seconds.
+    """
+
+    DEPENDS_ON_LABEL = "com.docker.compose.depends_on"
+    SERVICE_LABEL = "com.docker.compose.service"
+    PROJECT_LABEL = "com.docker.compose.project"
+    SUCCESS = {"healthy", "running"}
+
+    def __init__(
+        self,
+        api: Any,
+        concurrency: int,
+        verify_seconds: float,
+        poll_seconds: float = 1.0,
+        stop_timeout: int = 10,
+        on_call: Optional[Callable[[str], None]] = None,
+        host: str = "local",
+    ) -> None:
+        self._api = api
+        self.host = host
+        self.verify_seconds = verify_seconds
+        self.poll_seconds = poll_seconds
+        self.stop_timeout = stop_timeout
+        self._on_call = on_call or (lambda source: None)
+        self._pool = ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="restart")
+
+    def dependencies(self) -> Dict[str, set]:
+        """container name -> names of the containers it depends on (same compose project)."""
+        listing = self._api.containers(all=True, filters={"label": self.PROJECT_LABEL})
+        self._on_call("docker_list")
+        by_service: Dict[Tuple[str, str], str] = {}
+        declared: Dict[str, Tuple[str, List[str]]] = {}
+        for r in listing:
+            names = r.get("Names") or []
+            if not names:
+                continue
+            name = names[0].lstrip("/")
+            labels = r.get("Labels") or {}
+            project = labels.get(self.PROJECT_LABEL, "")
+            by_service[(project, labels.get(self.SERVICE_LABEL, ""))] = name
+            # "svc:service_started:false,other:service_healthy:true"
+            deps = [d.split(":", 1)[0] for d in (labels.get(self.DEPENDS_ON_LABEL) or "").split(",") if d]
+            declared[name] = (project, deps)
+        return {
+            name: {by_service[(project, d)] for d in deps if (project, d) in by_service}
+            for name, (project, deps) in declared.items()
+        }
+
+    @staticmethod
+    def levels(names: List[str], graph: Dict[str, set]) -> List[List[str]]:
+        """Group names so every container comes after the ones it (transitively) depends on."""
+        wanted = set(names)
+        depth: Dict[str, int] = {}
+
+        def visit(name: str, path: set) -> int:
+            if name in depth:
+                return depth[name]
+            level = 0
+            for dep in graph.get(name, ()):
+                if dep in path:
+                    continue  # dependency cycle; break it rather than loop
+                dep_level = visit(dep, path | {dep})
+                level = max(level, dep_level + 1 if dep in wanted else dep_level)
+            depth[name] = level
+            return level
+
+        grouped: Dict[int, List[str]] = {}
+        for name in names:
+            grouped.setdefault(visit(name, {name}), []).append(name)
+        return [sorted(grouped[k]) for k in sorted(grouped)]
+
+    def run(self, names: List[str]) -> Dict[str, str]:
+        """Restart names level by level; returns container -> outcome."""
+        try:
+            graph = self.dependencies()
+        except Exception as e:
+            _log("warn", "Compose dependency lookup failed; restarting without ordering", host=self.host, error=str(e))
+            graph = {}
+        outcomes: Dict[str, str] = {}
+        for level in self.levels(names, graph):
+            futures = {name: self._pool.submit(self._restart_and_verify, name) for name in level}
+            for name, future in futures.items():
+                outcomes[name] = future.result()
+            failed = [n for n in level if outcomes[n] not in self.SUCCESS]
+            if failed:
+                _log("warn", "Restart not verified; continuing with dependents", host=self.host, containers=failed)
+        return outcomes
+
+    def _restart_and_verify(self, name: str) -> str:
+        started = time.monotonic()
+        outcome = "failed"
+        try:
+            _log("warn", "Restarting container", host=self.host, container=name)
+            self._on_call("docker_restart")
+            self._api.restart(name, timeout=self.stop_timeout)
+            RESTARTS_TOTAL.labels(host=self.host, container=CONTAINER_LABELS.label(name)).inc()
+            outcome = self._verify(name, started + self.verify_seconds)
+        except Exception as e:
+            _log("error", "Restart failed", host=self.host, container=name, error=str(e))
+        elapsed = time.monotonic() - started
+        RESTART_DURATION_SECONDS.labels(host=self.host, outcome=outcome).observe(elapsed)
+        PHASE_DURATION_SECONDS.labels(phase="restart", target=self.host, outcome=outcome).observe(elapsed)
+        _log("info" if outcome in self.SUCCESS else "warn", "Restart finished",
+             host=self.host, container=name, outcome=outcome, seconds=round(elapsed, 1))
+        return outcome
+
+    def _verify(self, name: str, deadline: float) -> str:
+        while True:
+            state = self._api.inspect_container(name).get("State") or {}
+            self._on_call("docker_inspect")
+            status = (state.get("Status") or "").lower()
+            health = ((state.get("Health") or {}).get("Status") or "").lower()
+            if status in {"exited", "dead"}:
+                return "exited"
+            if status == "running" and (health == "healthy" or not health):
+                return "healthy" if health else "running"
+            if time.monotonic() + self.poll_seconds > deadline:
+                return "timeout"
+            time.sleep(self.poll_seconds)
+
+
+class TokenBucket:
+    """Classic token bucket on wall-clock time (so its level survives a restart)."""
+
+    __slots__ = ("capacity", "refill_per_second", "tokens", "updated")
+
+    def __init__(self, capacity: float, refill_per_second: float, tokens: Optional[float] = None,
+                 updated: Optional[float] = None) -> None:
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.tokens = capacity if tokens is None else min(capacity, tokens)
+        self.updated = time.time() if updated is None else updated
+
+    def level(self, now: float) -> float:
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.refill_per_second)
+            self.updated = now
+        return self.tokens
+
+    def take(self, now: float) -> bool:
+        if self.level(now) < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class _RestartRecord:
+    __slots__ = ("history", "bucket", "base_seconds", "breaker", "opened_at", "trial_at")
+
+    def __init__(self, bucket: TokenBucket, base_seconds: float) -> None:
+        self.history: deque = deque()  # wall-clock times of restarts within the flap window
+        self.bucket = bucket
+        self.base_seconds = base_seconds  # the host's cooldown; first step of the backoff
+        self.breaker = RestartGovernor.CLOSED
+        self.opened_at = 0.0
+        self.trial_at: Optional[float] = None
+
+
+class RestartGovernor:
+    """
+    Decides whether a container may be auto-restarted.
+
+    A restart needs, in order: a closed (or half-open) circuit breaker, the container's
+    backoff to have elapsed, and a token from both the container's bucket and the
+    fleet-wide bucket. The backoff starts at the host's cooldown and doubles with every
+    restart still inside the flap window, up to max_backoff_seconds. A container that
+    already has flap_threshold restarts within flap_window_seconds is flapping: its breaker
+    opens, auto-restarts stop and on_open is called to escalate. After
+    breaker_reset_seconds the breaker is half-open and allows one trial restart; needing
+    another restart within the flap window re-opens it, otherwise it closes again.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = 0, 1, 2
+
+    def __init__(
+        self,
+        bucket_capacity: float = 3,
+        bucket_refill_per_hour: float = 1,
+        global_capacity: float = 6,
+        global_refill_per_hour: float = 6,
+        max_backoff_seconds: float = 14400,
+        flap_window_seconds: float = 21600,
+        flap_threshold: int = 4,
+        breaker_reset_seconds: float = 21600,
+        on_open: Optional[Callable[[str, str, List[float]], None]] = None,
+    ) -> None:
+        self.bucket_capacity = bucket_capacity
+        self.bucket_refill_per_second = bucket_refill_per_hour / 3600
+        self.max_backoff_seconds = max_backoff_seconds
+        self.flap_window_seconds = flap_window_seconds
+        self.flap_threshold = max(1, flap_threshold)
+        self.breaker_reset_seconds = breaker_reset_seconds
+        self._on_open = on_open or (lambda host, container, history: None)
+        self._global = TokenBucket(global_capacity, global_refill_per_hour / 3600)
+        self._records: Dict[Tuple[str, str], _RestartRecord] = {}
+        self._lock = Lock()
+
+    def _record(self, key: Tuple[str, str], base_seconds: float) -> _RestartRecord:
+        record = self._records.get(key)
+        if record is None:
+            record = self._records[key] = _RestartRecord(
+                TokenBucket(self.bucket_capacity, self.bucket_refill_per_second), base_seconds
+            )
+        record.base_seconds = base_seconds
+        return record
+
+    def _prune(self, record: _RestartRecord, now: float) -> None:
+        while record.history and now - record.history[0] >= self.flap_window_seconds:
+            record.history.popleft()
+        if record.breaker == self.OPEN and now - record.opened_at >= self.breaker_reset_seconds:
+            record.breaker, record.trial_at = self.HALF_OPEN, None
+        elif record.breaker == self.HALF_OPEN:
+            if record.trial_at is not None:
+                held = now - record.trial_at >= self.flap_window_seconds  # the trial restart held
+            else:
+                # Never needed the trial (fixed by hand): close once a whole flap window passed
+                held = now - record.opened_at >= self.breaker_reset_seconds + self.flap_window_seconds
+            if held:
+                record.breaker = self.CLOSED
+
+    def backoff_seconds(self, record: _RestartRecord) -> float:
+        if not record.history:
+            return 0.0
+        return min(self.max_backoff_seconds, record.base_seconds * 2 ** (len(record.history) - 1))
+
+    def claim(self, host: str, container: str, base_seconds: float, now: Optional[float] = None) -> Tuple[bool, str]:
+        """Take a restart slot; returns (allowed, reason) with reason ok|circuit_open|backoff|budget|global_budget."""
+        now = time.time() if now is None else now
+        opened: Optional[List[float]] = None
+        with self._lock:
+            record = self._record((host, container), base_seconds)
+            self._prune(record, now)
+            if record.breaker == self.HALF_OPEN and record.trial_at is not None:
+                record.breaker, record.opened_at = self.OPEN, now  # failed again after the trial
+                opened = list(record.history)
+            elif record.breaker == self.CLOSED and len(record.history) >= self.flap_threshold:
+                record.breaker, record.opened_at = self.OPEN, now
+                opened = list(record.history)
+
+            if record.breaker == self.OPEN:
+                reason = "circuit_open"
+            elif record.history and now - record.history[-1] < self.backoff_seconds(record):
+                reason = "backoff"
+            elif record.bucket.level(now) < 1:
+                reason = "budget"
+            elif self._global.level(now) < 1:
+                reason = "global_budget"
+            else:
+                record.bucket.take(now)
+                self._global.take(now)
+                record.history.append(now)
+                if record.breaker == self.HALF_OPEN:
+                    record.trial_at = now
+                reason = "ok"
+        if opened is not None:
+            self._on_open(host, container, opened)
+        if reason != "ok":
+            RESTARTS_DENIED_TOTAL.labels(reason=reason).inc()
+        self.publish(now, keys=[(host, container)])
+        return reason == "ok", reason
+
+    def publish(self, now: Optional[float] = None, keys: Optional[List[Tuple[str, str]]] = None) -> None:
+        """Export budgets, backoff and breaker state; forgets containers that are fully recovered."""
+        now = time.time() if now is None else now
+        with self._lock:
+            RESTART_GLOBAL_BUDGET_TOKENS.set(self._global.level(now))
+            for key in list(self._records) if keys is None else keys:
+                record = self._records.get(key)
+                if record is None:
+                    continue
+                self._prune(record, now)
+                host, container = key
+                label = CONTAINER_LABELS.label(container)
+                RESTART_BUDGET_TOKENS.labels(host=host, container=label).set(record.bucket.level(now))
+                RESTART_BACKOFF_SECONDS.labels(host=host, container=label).set(self.backoff_seconds(record))
+                RESTART_BREAKER_STATE.labels(host=host, container=label).set(record.breaker)
+                if (
+                    keys is None
+                    and not record.history
+                    and record.breaker == self.CLOSED
+                    and record.bucket.level(now) >= record.bucket.capacity
+                ):
+                    del self._records[key]
+
+    def to_state(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "global": {"tokens": self._global.tokens, "updated": self._global.updated},
+                "containers": {
+                    f"{host}/{container}": {
+                        "history": list(r.history),
+                        "tokens": r.bucket.tokens,
+                        "updated": r.bucket.updated,
+                        "base_seconds": r.base_seconds,
+                        "breaker": r.breaker,
+                        "opened_at": r.opened_at,
+                        "trial_at": r.trial_at,
+                    }
+                    for (host, container), r in self._records.items()
+                },
+            }
+
+    def load_state(self, state: Dict[str, Any]) -> int:
+        """Restore buckets, history and breakers; returns how many containers were restored."""
+        with self._lock:
+            g = state.get("global") or {}
+            if "tokens" in g:
+                self._global = TokenBucket(self._global.capacity, self._global.refill_per_second,
+                                           float(g["tokens"]), float(g["updated"]))
+            for key, entry in (state.get("containers") or {}).items():
+                host, _, container = key.rpartition("/")
+                record = self._record((host, container), float(entry.get("base_seconds") or 0.0))
+                record.history = deque(float(t) for t in entry.get("history") or [])
+                record.bucket = TokenBucket(self.bucket_capacity, self.bucket_refill_per_second,
+                                            float(entry["tokens"]), float(entry["updated"]))
+                record.breaker = int(entry.get("breaker") or self.CLOSED)
+                record.opened_at = float(entry.get("opened_at") or 0.0)
+                record.trial_at = entry.get("trial_at")
+            return len(state.get("containers") or {})
+
+
+class DockerHost:
+    """
+    One Docker daemon watched by the monitor, with its own client and guardrails.
+
+    Each host keeps its own connection pool and timeout, events table, log cursors, restart
+    executor, allowlist, cooldowns and per-run restart cap, so a slow or unreachable
+    daemon only affects its own share of a snapshot and restarts on one host never use up
+    another host's budget. Restart plans for one host run one at a time (so dependency
+    ordering holds across plans); different hosts restart independently.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        url: str,
+        client: Any,
+        timeout_seconds: float,
+        allowed_containers: set,
+        max_restarts_per_run: int,
+        cooldown_seconds: float,
+        log_tracker: ContainerLogTracker,
+        restart_executor: RestartExecutor,
+    ) -> None:
+        self.name = name
+        self.url = url
+        self.client = client
+        self.timeout_seconds = timeout_seconds
+        self.allowed_containers = allowed_containers
+        self.max_restarts_per_run = max_restarts_per_run
+        self.cooldown_seconds = cooldown_seconds
+        self.log_tracker = log_tracker
+        self.restart_executor = restart_executor
+        self.table: Optional[ContainerStateTable] = None
+        self.restart_plans = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"restart-plan-{name}")
+
+    def allows(self, container: str) -> bool:
+        return not self.allowed_containers or container in self.allowed_containers
+
+
+@dataclass
+class ScheduledTask:
+    name: str
+    interval_seconds: float
+    run: Callable[[], None]
+    jitter_seconds: float = 0.0  # random delay added to each tick, not to the grid
+    deadline_seconds: Optional[float] = None  # defaults to the interval
+
+
+class Scheduler:
+    """
+    Runs each task on its own fixed grid of the monotonic clock (start + n * interval), so
+    run time never shifts later ticks. Tasks execute on a pool and never overlap themselves:
+    a tick that arrives while the previous run is still going is skipped, as are ticks
+    missed while the scheduler was stalled. Runs longer than the deadline count as overruns.
+    """
+
+    def __init__(self, tasks: List[ScheduledTask]) -> None:
+        self.tasks = {t.name: t for t in tasks}
+        self._pool = ThreadPoolExecutor(max_workers=max(1, len(tasks)), thread_name_prefix="task")
+        self._lock = Lock()
+        self._wake = Event()
+        self._grid: Dict[str, float] = {}  # task -> next grid tick
+        self._fire_at: Dict[str, float] = {}  # task -> next tick plus jitter
+        self._triggered: Dict[str, float] = {}  # task -> out-of-band run time
+        self._running: Dict[str, bool] = {}
+
+    def trigger(self, name: str, delay_seconds: float = 0.0) -> None:
+        """Run a task early (e.g. on a Docker event); bursts within the delay coalesce."""
+        if name not in self.tasks:
+            return
+        at = time.monotonic() + delay_seconds
+        with self._lock:
+            if name not in self._triggered or at < self._triggered[name]:
+                self._triggered[name] = at
+        self._wake.set()
+
+    def run_forever(self) -> None:
+        now = time.monotonic()
+        for name, task in self.tasks.items():
+            self._grid[name] = now
+            self._fire_at[name] = now + random.uniform(0, task.jitter_seconds)
+            self._running[name] = False
+        while True:
+            now = time.monotonic()
+            for name, task in self.tasks.items():
+                with self._lock:
+                    triggered = self._triggered.get(name)
+                    if triggered is not None and triggered <= now:
+                        del self._triggered[name]
+                if self._fire_at[name] <= now:
+                    self._advance(task, now)
+                    self._dispatch(task)
+                elif triggered is not None and triggered <= now:
+                    self._dispatch(task)
+            with self._lock:
+                upcoming = list(self._fire_at.values()) + list(self._triggered.values())
+            self._wake.wait(max(0.0, min(upcoming) - time.monotonic()))
+            self._wake.clear()
+
+    def _advance(self, task: ScheduledTask, now: float) -> None:
+        grid = self._grid[task.name] + task.interval_seconds
+        if grid <= now:
+            missed = int((now - grid) // task.interval_seconds) + 1
+            SCHEDULER_SKIPPED_TICKS_TOTAL.labels(task=task.name).inc(missed)
+            _log("warn", "Scheduler fell behind; skipping ticks", task=task.name, skipped=missed)
+            grid += missed * task.interval_seconds
+        self._grid[task.name] = grid
+        self._fire_at[task.name] = grid + random.uniform(0, task.jitter_seconds)
+
+    def _dispatch(self, task: ScheduledTask) -> None:
+        with self._lock:
+            if self._running[task.name]:
+                SCHEDULER_SKIPPED_TICKS_TOTAL.labels(task=task.name).inc()
+                _log("debug", "Task still running; tick skipped", task=task.name)
+                return
+            self._running[task.name] = True
+        self._pool.submit(self._execute, task)
+
+    def _execute(self, task: ScheduledTask) -> None:
+        started = time.monotonic()
+        try:
+            task.run()
+        except Exception as e:
+            _log("error", "Scheduled task error", task=task.name, error=str(e))
+        finally:
+            elapsed = time.monotonic() - started
+            SCHEDULER_TASK_DURATION_SECONDS.labels(task=task.name).observe(elapsed)
+            deadline = task.deadline_seconds or task.interval_seconds
+            if elapsed > deadline:
+                SCHEDULER_OVERRUNS_TOTAL.labels(task=task.name).inc()
+                _log("warn", "Scheduled task overran its deadline", task=task.name,
+                     seconds=round(elapsed, 2), deadline_seconds=deadline)
+            with self._lock:
+                self._running[task.name] = False
+
+
+class IncidentStore:
+    """
+    SQLite incident store, indexed by time, fingerprint, severity and container.
+
+    Writes are buffered and committed in one transaction per batch (every flush_seconds or
+    batch_size incidents). WAL with synchronous=NORMAL only fsyncs on checkpoints, which
+    keeps SD-card writes small and sequential; a power cut can lose the last unflushed
+    batch but never corrupts the database. A repeat of an open incident (same fingerprint
+    within dedupe_seconds) bumps its occurrence count instead of adding a row. Retention
+    drops incidents older than retention_days and then the oldest ones while the database
+    exceeds max_bytes.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS incidents (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            first_seen REAL NOT NULL,
+            last_seen REAL NOT NULL,
+            occurrences INTEGER NOT NULL DEFAULT 1,
+            fingerprint TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            severity TEXT NOT NULL,
+            confidence REAL,
+            summary TEXT NOT NULL,
+            triage TEXT NOT NULL,
+            evidence TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS incident_containers (
+            incident_id INTEGER NOT NULL REFERENCES incidents(id) ON DELETE CASCADE,
+            container TEXT NOT NULL,
+            PRIMARY KEY (container, incident_id)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS incidents_first_seen ON incidents(first_seen);
+        CREATE INDEX IF NOT EXISTS incidents_fingerprint ON incidents(fingerprint, last_seen);
+        CREATE INDEX IF NOT EXISTS incidents_severity ON incidents(severity, first_seen);
+    """
+    RETENTION_CHECK_SECONDS = 3600
+
+    def __init__(
+        self,
+        path: str,
+        batch_size: int = 20,
+        flush_seconds: float = 30.0,
+        retention_days: float = 90.0,
+        max_bytes: int = 50_000_000,
+        dedupe_seconds: float = 3600.0,
+    ) -> None:
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.retention_days = retention_days
+        self.max_bytes = max_bytes
+        self.dedupe_seconds = dedupe_seconds
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA auto_vacuum=INCREMENTAL")  # only effective on a new database
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("PRAGMA foreign_keys=ON")
+        self._db.executescript(self.SCHEMA)
+        self._lock = Lock()  # guards the connection
+        self._pending: List[Dict[str, Any]] = []
+        self._pending_lock = Lock()
+        self._wake = Event()
+        self._last_retention = 0.0
+
+    def start(self) -> None:
+        Thread(target=self._run, name="incident-store", daemon=True).start()
+
+    def add(self, incident: Dict[str, Any]) -> None:
+        with self._pending_lock:
+            self._pending.append(incident)
+            full = len(self._pending) >= self.batch_size
+        if full:
+            self._wake.set()
+
+    def flush(self) -> int:
+        """Commit buffered incidents in one transaction; returns how many were written."""
+        with self._pending_lock:
+            batch, self._pending = self._pending, []
+        if not batch:
+            return 0
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                for incident in batch:
+                    self._write(incident)
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                with self._pending_lock:
+                    self._pending = batch + self._pending
+                raise
+        INCIDENT_STORE_BYTES.set(self.size_bytes())
+        return len(batch)
+
+    def _write(self, incident: Dict[str, Any]) -> None:
+        row = self._db.execute(
+            "SELECT id FROM incidents WHERE fingerprint = ? AND last_seen >= ? ORDER BY last_seen DESC LIMIT 1",
+            (incident["fingerprint"], incident["ts"] - self.dedupe_seconds),
+        ).fetchone()
+        if row is not None:
+            self._db.execute(
+                "UPDATE incidents SET last_seen = MAX(last_seen, ?), occurrences = occurrences + 1 WHERE id = ?",
+                (incident["ts"], row["id"]),
+            )
+            return
+        cursor = self._db.execute(
+            "INSERT INTO incidents (first_seen, last_seen, fingerprint, kind, severity, confidence, summary, triage, evidence)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                incident["ts"], incident["ts"], incident["fingerprint"], incident["kind"], incident["severity"],
+                incident["confidence"], incident["summary"], json.dumps(incident["triage"], ensure_ascii=False),
+                json.dumps(incident["evidence"], separators=(",", ":"), ensure_ascii=False),
+            ),
+        )
+        self._db.executemany(
+            "INSERT OR IGNORE INTO incident_containers (incident_id, container) VALUES (?, ?)",
+            [(cursor.lastrowid, c) for c in incident["containers"]],
+        )
+        INCIDENTS_RECORDED_TOTAL.labels(severity=incident["severity"]).inc()
+
+    def size_bytes(self) -> int:
+        return sum(os.path.getsize(p) for p in (self.path, self.path + "-wal") if os.path.exists(p))
+
+    def apply_retention(self) -> int:
+        """Drop incidents past the age limit, then the oldest while over the size limit."""
+        removed = 0
+        with self._lock:
+            cutoff = time.time() - self.retention_days * 86400
+            removed += self._db.execute("DELETE FROM incidents WHERE last_seen < ?", (cutoff,)).rowcount
+            while self.size_bytes() > self.max_bytes:
+                count = self._db.execute("SELECT COUNT(*) FROM incidents").fetchone()[0]
+                if not count:
+                    break
+                removed += self._db.execute(
+                    "DELETE FROM incidents WHERE id IN (SELECT id FROM incidents ORDER BY first_seen LIMIT ?)",
+                    (max(1, count // 10),),
+                ).rowcount
+                self._db.execute("PRAGMA incremental_vacuum")
+                self._db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            if removed:
+                self._db.execute("PRAGMA incremental_vacuum")
+        INCIDENT_STORE_BYTES.set(self.size_bytes())
+        if removed:
+            _log("info", "Incident retention applied", removed=removed)
+        return removed
+
+    def _run(self) -> None:
+        while True:
+            self._wake.wait(self.flush_seconds)
+            self._wake.clear()
+            try:
+                self.flush()
+                if time.time() - self._last_retention >= self.RETENTION_CHECK_SECONDS:
+                    self._last_retention = time.time()
+                    self.apply_retention()
+            except Exception as e:
+                _log("error", "Incident store flush failed", error=str(e))
+
+    # ------------------------------ queries -----------------------------------
+    def _where(
+        self,
+        container: Optional[str],
+        severity: Optional[str],
+        fingerprint: Optional[str],
+        since: Optional[float],
+        until: Optional[float],
+    ) -> Tuple[str, List[Any]]:
+        clauses: List[str] = []
+        params: List[Any] = []
+        if container:
+            clauses.append("id IN (SELECT incident_id FROM incident_containers WHERE container = ?)")
+            params.append(container)
+        if severity:
+            clauses.append("severity = ?")
+            params.append(severity.lower())
+        if fingerprint:
+            clauses.append("fingerprint = ?")
+            params.append(fingerprint)
+        if since is not None:
+            clauses.append("last_seen >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("first_seen < ?")
+            params.append(until)
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def query(
+        self,
+        container: Optional[str] = None,
+        severity: Optional[str] = None,
+        fingerprint: Optional[str] = None,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+        limit: int = 50,
+    ) -> List[Dict[str, Any]]:
+        self.flush()
+        where, params = self._where(container, severity, fingerprint, since, until)
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id, first_seen, last_seen, occurrences, fingerprint, kind, severity, confidence, summary"
+                f" FROM incidents{where} ORDER BY first_seen DESC LIMIT ?",
+                params + [max(1, min(limit, 1000))],
+            ).fetchall()
+            containers = self._containers([r["id"] for r in rows])
+        return [{**dict(r), "containers": containers.get(r["id"], [])} for r in rows]
+
+    def stats(self, since: Optional[float] = None, until: Optional[float] = None) -> Dict[str, Any]:
+        self.flush()
+        where, params = self._where(None, None, None, since, until)
+        with self._lock:
+            by_severity = self._db.execute(
+                f"SELECT severity, COUNT(*) AS n, SUM(occurrences) AS occ FROM incidents{where} GROUP BY severity",
+                params,
+            ).fetchall()
+            by_container = self._db.execute(
+                "SELECT c.container, COUNT(*) AS n, SUM(i.occurrences) AS occ FROM incident_containers c"
+                f" JOIN (SELECT * FROM incidents{where}) i ON i.id = c.incident_id"
+                " GROUP BY c.container ORDER BY n DESC",
+                params,
+            ).fetchall()
+        return {
+            "by_severity": {r["severity"]: {"incidents": r["n"], "occurrences": r["occ"]} for r in by_severity},
+            "by_container": {r["container"]: {"incidents": r["n"], "occurrences": r["occ"]} for r in by_container},
+        }
+
+    def get(self, incident_id: int) -> Optional[Dict[str, Any]]:
+        self.flush()
+        with self._lock:
+            row = self._db.execute("SELECT * FROM incidents WHERE id = ?", (incident_id,)).fetchone()
+            if row is None:
+                return None
+            containers = self._containers([incident_id])
+        incident = dict(row)
+        incident["triage"] = json.loads(incident["triage"])
+        incident["evidence"] = json.loads(incident["evidence"])
+        incident["containers"] = containers.get(incident_id, [])
+        return incident
+
+    def _containers(self, ids: List[int]) -> Dict[int, List[str]]:
+        if not ids:
+            return {}
+        out: Dict[int, List[str]] = {}
+        marks = ",".join("?" * len(ids))
+        for r in self._db.execute(
+            f"SELECT incident_id, container FROM incident_containers WHERE incident_id IN ({marks}) ORDER BY container",
+            ids,
+        ):
+            out.setdefault(r["incident_id"], []).append(r["container"])
+        return out
+
+    @staticmethod
+    def render_markdown(incident: Dict[str, Any]) -> str:
+        triage = incident["triage"]
+        first = datetime.fromtimestamp(incident["first_seen"], timezone.utc).strftime("%Y-%m-%d %H:%M:%S UTC")
+        last = datetime.fromtimestamp(incident["last_seen"], timezone.utc).strftime("%Y-%m-%d %H:%M:%S UTC")
+        confidence = incident.get("confidence")
+        report = f"""# Incident Report #{incident["id"]}
+**Time:** {first}  
+**Last seen:** {last} ({incident["occurrences"]} occurrences)  
+**Severity:** {incident["severity"]}  
+**Confidence:** {f"{confidence:.0%}" if isinstance(confidence, (int, float)) else "n/a"}  
+**Fingerprint:** `{incident["fingerprint"]}` ({incident["kind"]})
+
+## Summary
+{incident["summary"]}
+
+## Suspected Causes
+"""
+        for cause in triage.get("suspected_causes") or []:
+            report += f"- {cause}\n"
+
+        report += "\n## Recommended Actions\n"
+        for action in triage.get("recommended_actions") or []:
+            report += f"- **{action.get('type')}**"
+            if action.get("target"):
+                report += f" → {action['target']}"
+            if action.get("reason"):
+                report += f": {action['reason']}"
+            report += "\n"
+
+        report += "\n## System Snapshot\n"
+        evidence = incident.get("evidence") or {}
+        down = evidence.get("down_targets") or []
+        if down:
+            report += f"- **Down targets:** {', '.join(str(d) for d in down)}\n"
+        if incident.get("containers"):
+            report += f"- **Containers:** {', '.join(incident['containers'])}\n"
+        failing_http = (evidence.get("http_checks") or {}).get("failing") or []
+        if failing_http:
+            report += f"- **Failing HTTP checks:** {', '.join(str(h.get('target')) for h in failing_http)}\n"
+        if evidence.get("predictive_trigger"):
+            report += f"- **Predictive trigger:** {evidence['predictive_trigger']}\n"
+        return report
+
+
+class AlertInbox:
+    """
+    Firing Alertmanager alerts keyed by fingerprint.
+
+    Alertmanager re-sends the whole group on every group_interval/repeat_interval, so
+    receive() only returns alerts that need triage: newly firing ones, and repeats of ones
+    that were never triaged (e.g. throttled). Resolved alerts are dropped; alerts not re-sent
+    for ttl_seconds are forgotten, in case resolved notifications are disabled.
+    """
+
+    def __init__(self, ttl_seconds: float) -> None:
+        self.ttl_seconds = ttl_seconds
+        self._alerts: Dict[str, Dict[str, Any]] = {}  # fingerprint -> {"alert", "seen", "triaged"}
+        self._lock = Lock()
+
+    @staticmethod
+    def _compact(alert: Dict[str, Any]) -> Dict[str, Any]:
+        labels = {str(k): str(v) for k, v in (alert.get("labels") or {}).items()}
+        annotations = alert.get("annotations") or {}
+        fingerprint = alert.get("fingerprint") or hashlib.sha256(
+            json.dumps(labels, sort_keys=True).encode()
+        ).hexdigest()[:16]
+        return {
+            "fingerprint": str(fingerprint),
+            "alertname": labels.pop("alertname", ""),
+            "labels": labels,
+            "summary": str(annotations.get("summary") or annotations.get("description") or "")[:300],
+            "starts_at": alert.get("startsAt"),
+        }
+
+    def receive(self, alerts: List[Dict[str, Any]], now: float) -> Tuple[List[Dict[str, Any]], Dict[str, int]]:
+        """Returns (alerts to triage, counts by result: new|duplicate|resolved)."""
+        due: List[Dict[str, Any]] = []
+        counts = {"new": 0, "duplicate": 0, "resolved": 0}
+        with self._lock:
+            self._prune(now)
+            for raw in alerts:
+                if not isinstance(raw, dict):
+                    continue
+                alert = self._compact(raw)
+                fingerprint = alert["fingerprint"]
+                if raw.get("status") == "resolved":
+                    counts["resolved"] += 1
+                    self._alerts.pop(fingerprint, None)
+                    continue
+                entry = self._alerts.get(fingerprint)
+                # A new startsAt for a known fingerprint is a new firing episode
+                if entry is None or entry["alert"]["starts_at"] != alert["starts_at"]:
+                    counts["new"] += 1
+                    entry = self._alerts[fingerprint] = {"alert": alert, "seen": now, "triaged": False}
+                else:
+                    counts["duplicate"] += 1
+                    entry["seen"] = now
+                if not entry["triaged"]:
+                    due.append(alert)
+        return due, counts
+
+    def mark_triaged(self, fingerprints: Iterable[str]) -> None:
+        with self._lock:
+            for fingerprint in fingerprints:
+                if fingerprint in self._alerts:
+                    self._alerts[fingerprint]["triaged"] = True
+
+    def firing(self, now: float) -> int:
+        with self._lock:
+            self._prune(now)
+            return len(self._alerts)
+
+    def _prune(self, now: float) -> None:
+        for fingerprint in [f for f, e in self._alerts.items() if now - e["seen"] > self.ttl_seconds]:
+            del self._alerts[fingerprint]
+
+
+@dataclass
+class FreshnessTarget:
+    database: str
+    series: str  # measurement (InfluxDB 3) or [schema.]table (TimescaleDB)
+    stale_seconds: float
+
+
+class FreshnessQueryError(RuntimeError):
+    """The store rejected the query itself (e.g. a missing table), rather than being unreachable."""
+
+
+class FreshnessProbe(ABC):
+    """
+    Newest-row age per series in one time-series store.
+
+    The series of a database are folded into a single UNION ALL query of
+    MAX(time) bounded by lookback_seconds, so each run costs one round trip per
+    database and only scans recent chunks/files. A series the store rejects (a
+    missing or misspelled table) is reported on its own and queried alone from
+    then on, so it can't blank the healthy series of its database. A series
+    without rows in the lookback window reports the window as its lag and is
+    stale whatever its threshold. When a query fails the last known timestamps
+    keep ageing, so a store that stopped answering still goes stale; the error
+    is reported alongside.
+    """
+
+    store = ""
+    # Series names end up in SQL text; plain identifiers only
+    name_pattern = re.compile(r"[A-Za-z_][\w\-]*")
+
+    def __init__(self, targets: List[FreshnessTarget], timeout_seconds: float, lookback_seconds: float,
+                 on_request: Optional[Callable[[str, int], None]] = None) -> None:
+        self.databases: Dict[str, List[FreshnessTarget]] = {}
+        for target in targets:
+            self.databases.setdefault(target.database, []).append(target)
+        self.timeout_seconds = timeout_seconds
+        self.lookback_seconds = lookback_seconds
+        self._on_request = on_request or (lambda source, n: None)
+        self._latest: Dict[Tuple[str, str], Optional[float]] = {}  # (database, series) -> newest row, epoch seconds
+        self._rejected: Dict[str, set] = {}  # database -> series the store rejected on the last run
+
+    @abstractmethod
+    def _query(self, database: str, series: List[str]) -> Dict[str, Optional[float]]:
+        """
+        Newest row per series (epoch seconds, None without rows in the lookback window).
+        Raises FreshnessQueryError when the query is rejected, anything else when the
+        store can't be reached.
+        """
+
+    def _query_database(
+        self, database: str, names: List[str]
+    ) -> Tuple[Dict[str, Optional[float]], Dict[str, str], Optional[str]]:
+        """Returns newest rows, per-series rejections and the database-level error, if any."""
+        rejected = self._rejected.get(database, set())
+        pending = [[n for n in names if n not in rejected]] + [[n] for n in names if n in rejected]
+        latest: Dict[str, Optional[float]] = {}
+        failed: Dict[str, str] = {}
+        while pending:
+            group = pending.pop()
+            if not group:
+                continue
+            self._on_request(self.store, 1)
+            try:
+                with _PhaseTimer(self.store, database):
+                    latest.update(self._query(database, group))
+            except FreshnessQueryError as e:
+                if len(group) > 1:
+                    pending.extend([n] for n in group)  # find the series that was rejected
+                    continue
+                DATA_FRESHNESS_PROBE_ERRORS_TOTAL.labels(store=self.store, database=database).inc()
+                failed[group[0]] = str(e)[:300]
+            except Exception as e:
+                DATA_FRESHNESS_PROBE_ERRORS_TOTAL.labels(store=self.store, database=database).inc()
+                return {}, {}, str(e)[:300]
+        self._rejected[database] = set(failed)
+        return latest, failed, None
+
+    def run(self, now: Optional[float] = None) -> Dict[str, Any]:
+        """Query every database; returns lags, stale series and per-database/per-series errors."""
+        lags: Dict[str, float] = {}
+        stale: List[Dict[str, Any]] = []
+        errors: Dict[str, str] = {}
+        for database, targets in self.databases.items():
+            latest, failed, error = self._query_database(database, [t.series for t in targets])
+            if error is not None:
+                errors[database] = error
+            errors.update({f"{database}/{name}": e for name, e in failed.items()})
+            checked = time.time() if now is None else now
+            for target in targets:
+                key = (database, target.series)
+                if error is None and target.series not in failed:
+                    self._latest[key] = latest.get(target.series)  # None: no rows within the lookback window
+                elif key not in self._latest:
+                    continue  # never answered; nothing to age
+                newest = self._latest[key]
+                lag = max(0.0, checked - newest) if newest is not None else self.lookback_seconds
+                DATA_FRESHNESS_LAG_SECONDS.labels(store=self.store, database=database, series=target.series).set(lag)
+                lags[f"{database}/{target.series}"] = round(lag, 1)
+                if newest is None or lag > target.stale_seconds:
+                    stale.append({
+                        "store": self.store, "database": database, "series": target.series,
+                        "lag_seconds": round(lag), "stale_seconds": target.stale_seconds,
+                        "no_rows": newest is None,
+                    })
+        DATA_FRESHNESS_STALE_SERIES.labels(store=self.store).set(len(stale))
+        return {"lags": lags, "stale": stale, "errors": errors}
+
+    def close(self) -> None:
+        pass
+
+
+class InfluxDB3FreshnessProbe(FreshnessProbe):
+    """Freshness of InfluxDB 3 measurements via the SQL query API (one pooled keep-alive session)."""
+
+    store = "influxdb3"
+
+    def __init__(self, url: str, token: str, targets: List[FreshnessTarget], **kwargs: Any) -> None:
+        super().__init__(targets, **kwargs)
+        self.url = url.rstrip("/")
+        self._session = requests.Session()
+        if token:
+            self._session.headers["Authorization"] = f"Bearer {token}"
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=2)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+
+    def _query(self, database: str, series: List[str]) -> Dict[str, Optional[float]]:
+        window = f"time > now() - INTERVAL '{int(self.lookback_seconds)} seconds'"
+        sql = " UNION ALL ".join(
+            f"SELECT '{name}' AS series, MAX(time) AS latest FROM \"{name}\" WHERE {window}" for name in series
+        )
+        response = self._session.get(
+            f"{self.url}/api/v3/query_sql",
+            params={"db": database, "q": sql, "format": "json"},
+            timeout=self.timeout_seconds,
+        )
+        if not response.ok:
+            # The body carries the useful part ("table 'x' not found", auth errors)
+            message = f"HTTP {response.status_code}: {response.text.strip()[:200]}"
+            if response.status_code in {401, 403, 502, 503, 504}:
+                raise RuntimeError(message)  # every query would fail the same way
+            raise FreshnessQueryError(message)
+        latest: Dict[str, Optional[float]] = {}
+        for row in response.json():
+            value = row.get("latest")  # naive RFC 3339 in UTC, nanosecond precision
+            latest[row["series"]] = _query_time(value) if value else None
+        return latest
+
+    def close(self) -> None:
+        self._session.close()
+
+
+class TimescaleFreshnessProbe(FreshnessProbe):
+    """
+    Freshness of TimescaleDB hypertables (or any table with a time column).
+
+    Each database gets a small psycopg2 connection pool, opened lazily; connections are
+    autocommit with connect and statement timeouts, and a connection that errors is
+    discarded instead of returned to the pool.
+    """
+
+    store = "timescaledb"
+    # [schema.]table; each part becomes its own quoted identifier
+    name_pattern = re.compile(r"[A-Za-z_][\w\-]*(\.[A-Za-z_][\w\-]*)?")
+
+    def __init__(self, dsn: str, targets: List[FreshnessTarget], **kwargs: Any) -> None:
+        super().__init__(targets, **kwargs)
+        self.dsn = dsn
+        self._pools: Dict[str, Any] = {}
+
+    def _pool(self, database: str) -> Any:
+        pool = self._pools.get(database)
+        if pool is None:
+            pool = self._pools[database] = psycopg2.pool.ThreadedConnectionPool(
+                0, 2, self.dsn,
+                dbname=database,
+                connect_timeout=max(1, int(self.timeout_seconds)),
+                # UTC so timestamp-without-time-zone columns (telegraf's default) compare correctly
+                options=f"-c statement_timeout={int(self.timeout_seconds * 1000)} -c TimeZone=UTC",
+                application_name="ai-monitor",
+            )
+        return pool
+
+    def _query(self, database: str, series: List[str]) -> Dict[str, Optional[float]]:
+        from psycopg2 import sql
+
+        statement = sql.SQL(" UNION ALL ").join(
+            sql.SQL(
+                "SELECT {name}, EXTRACT(EPOCH FROM MAX(time))::float8 FROM {table} "
+                "WHERE time > now() - make_interval(secs => {window})"
+            ).format(
+                name=sql.Literal(name),
+                table=sql.Identifier(*name.split(".", 1)),
+                window=sql.Literal(self.lookback_seconds),
+            )
+            for name in series
+        )
+        pool = self._pool(database)
+        conn = pool.getconn()
+        try:
+            conn.autocommit = True
+            with conn.cursor() as cursor:
+                cursor.execute(statement)
+                rows = cursor.fetchall()
+        except Exception as e:
+            pool.putconn(conn, close=True)
+            # Missing table/column, not a time column, ...: only this query is at fault
+            if isinstance(e, (psycopg2.ProgrammingError, psycopg2.DataError)):
+                raise FreshnessQueryError(str(e).strip()) from e
+            raise
+        pool.putconn(conn)
+        return {name: latest for name, latest in rows}
+
+    def close(self) -> None:
+        for pool in self._pools.values():
+            pool.closeall()
+        self._pools.clear()
+
+
+class StateFile:
+    """
+    Compact JSON checkpoint of the monitor's in-memory state, for warm restarts.
+
+    save() writes a temporary file next to the checkpoint, fsyncs it and renames it over the
+    old one, so a crash or power cut leaves either the previous or the new state, never a
+    torn file. Saves with unchanged content are skipped (no SD-card write). load() ignores
+    a file written by another schema version or older than max_age_seconds.
+    """
+
+    VERSION = 2
+
+    def __init__(self, path: str, max_age_seconds: float) -> None:
+        self.path = path
+        self.max_age_seconds = max_age_seconds
+        self._last_digest: Optional[str] = None
+        self._lock = Lock()
+
+    def load(self) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            _log("warn", "State file unreadable; starting cold", path=self.path, error=str(e))
+            return None
+        if not isinstance(state, dict) or state.get("version") != self.VERSION:
+            _log("warn", "State file schema mismatch; starting cold", path=self.path,
+                 version=state.get("version") if isinstance(state, dict) else None)
+            return None
+        age = time.time() - float(state.get("saved_at") or 0)
+        if age > self.max_age_seconds:
+            _log("info", "State file stale; starting cold", path=self.path, age_seconds=int(age))
+            return None
+        return state
+
+    def save(self, state: Dict[str, Any]) -> bool:
+        """Write state atomically; returns False when it was unchanged since the last save."""
+        body = json.dumps(state, separators=(",", ":"), sort_keys=True, default=str)
+        digest = hashlib.sha256(body.encode("utf-8")).hexdigest()
+        with self._lock:
+            if digest == self._last_digest:
+                return False
+            payload = {"version": self.VERSION, "saved_at": time.time(), **state}
+            directory = os.path.dirname(self.path) or "."
+            os.makedirs(directory, exist_ok=True)
+            tmp = f"{self.path}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(payload, f, separators=(",", ":"), default=str)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+            try:
+                dir_fd = os.open(directory, os.O_RDONLY)
+                try:
+                    os.fsync(dir_fd)  # make the rename itself durable
+                finally:
+                    os.close(dir_fd)
+            except OSError:
+                pass
+            self._last_digest = digest
+        STATE_CHECKPOINT_TIMESTAMP.set(payload["saved_at"])
+        return True
+
+
+class _ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+
+class _QuietRequestHandler(WSGIRequestHandler):
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+
+class MonitorHTTPServer:
+    """
+    The monitor's HTTP endpoint: Prometheus /metrics plus small JSON/markdown routes.
+
+    Routes are (method, path prefix) -> handler(environ, path_rest) returning
+    (status, content_type, body); the longest matching prefix wins.
+    """
+
+    def __init__(self, port: int) -> None:
+        self.port = port
+        self._metrics_app = make_wsgi_app()
+        self._routes: List[Tuple[str, str, Callable[[Dict[str, Any], str], Tuple[str, str, bytes]]]] = []
+
+    def route(self, method: str, prefix: str, handler: Callable[[Dict[str, Any], str], Tuple[str, str, bytes]]) -> None:
+        self._routes.append((method.upper(), prefix, handler))
+        self._routes.sort(key=lambda r: len(r[1]), reverse=True)
+
+    def app(self, environ: Dict[str, Any], start_response: Callable[..., Any]) -> Iterable[bytes]:
+        path = environ.get("PATH_INFO") or "/"
+        method = environ.get("REQUEST_METHOD", "GET").upper()
+        for route_method, prefix, handler in self._routes:
+            if method == route_method and (path == prefix or path.startswith(prefix.rstrip("/") + "/")):
+                try:
+                    status, content_type, body = handler(environ, path[len(prefix):].lstrip("/"))
+                except ValueError as e:
+                    status, content_type, body = "400 Bad Request", "application/json", _json_body({"error": str(e)})
+                except Exception as e:
+                    _log("error", "HTTP handler error", path=path, error=str(e))
+                    status, content_type, body = "500 Internal Server Error", "application/json", _json_body({"error": "internal error"})
+                start_response(status, [("Content-Type", content_type), ("Content-Length", str(len(body)))])
+                return [body]
+        return self._metrics_app(environ, start_response)
+
+    def start(self) -> None:
+        server = make_server("", self.port, self.app, _ThreadingWSGIServer, handler_class=_QuietRequestHandler)
+        Thread(target=server.serve_forever, name="http-server", daemon=True).start()
+
+
+def _json_body(payload: Any) -> bytes:
+    return json.dumps(payload, ensure_ascii=False, default=str).encode("utf-8")
+
+
+def _bearer_ok(environ: Dict[str, Any], token: str) -> bool:
+    """Constant-time check of the request's bearer token; an empty token never matches."""
+    supplied = environ.get("HTTP_AUTHORIZATION", "").encode("utf-8")
+    return bool(token) and hmac.compare_digest(supplied, f"Bearer {token}".encode("utf-8"))
+
+
+def _query_time(value: Optional[str]) -> Optional[float]:
+    """Epoch seconds or an ISO-8601 date/time (UTC if no offset) from a query parameter."""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"invalid time: {value}")
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+class AiMonitor:
+    def __init__(self) -> None:
+        self.prometheus_url = os.getenv("PROMETHEUS_URL", "http://prometheus:9090").rstrip("/")
+        self.interval_seconds = _env_int("AI_MONITOR_INTERVAL_SECONDS", 60)
+        self.execute = _env_bool("AI_MONITOR_EXECUTE", False)
+        self.self_heal_docker_health = _env_bool("AI_MONITOR_SELF_HEAL_DOCKER_HEALTH", True)
+        self.max_restarts_per_run = _env_int("AI_MONITOR_MAX_RESTARTS_PER_RUN", 2)
+        self.restart_unhealthy = _env_bool("AI_MONITOR_RESTART_UNHEALTHY", True)
+        self.restart_exited = _env_bool("AI_MONITOR_RESTART_EXITED", True)
+        self.llm_enabled = _env_bool("AI_MONITOR_LLM_ENABLED", True)
+        # Snapshot JSON embedded in triage prompts is compacted to fit this budget (~4 bytes/token)
+        self.llm_prompt_budget_bytes = _env_int("AI_MONITOR_LLM_PROMPT_BUDGET_BYTES", 8000)
+        self.llm_timeout_seconds = _env_float("AI_MONITOR_LLM_TIMEOUT_SECONDS", 60.0)
+        self.prom_timeout_seconds = _env_int("AI_MONITOR_PROM_TIMEOUT_SECONDS", 5)
+        self.docker_timeout_seconds = _env_int("AI_MONITOR_DOCKER_TIMEOUT_SECONDS", 10)
+        self.http_timeout_seconds = _env_float("AI_MONITOR_HTTP_TIMEOUT_SECONDS", 3.0)
+        # Upper bound for a whole snapshot; sources still running past it are reported as timed out
+        self.snapshot_deadline_seconds = _env_float("AI_MONITOR_SNAPSHOT_DEADLINE_SECONDS", 15.0)
+        self.allowed_containers = {
+            c.strip() for c in os.getenv("AI_MONITOR_ALLOWED_CONTAINERS", "").split(",") if c.strip()
+        }
+        
+        # LLM backend selection (priority: Claude > Gemini)
+        self.claude_api_key = os.getenv("CLAUDE_API_KEY")
+        self.claude_model = os.getenv("CLAUDE_MODEL", "claude-3-haiku-20240307")
+        self.use_claude = bool(self.claude_api_key and ANTHROPIC_AVAILABLE)
+        if self.use_claude:
+            self._anthropic_client = Anthropic(
+                api_key=self.claude_api_key, timeout=self.llm_timeout_seconds, max_retries=1
+            )
+        
+        self.gemini_api_key = os.getenv("GEMINI_API_KEY")
+        self.gemini_model = os.getenv("GEMINI_MODEL", "gemini-2.0-flash-exp")
+        self.use_gemini = bool(self.gemini_api_key and GEMINI_AVAILABLE and not self.use_claude)
+        if self.use_gemini:
+            genai.configure(api_key=self.gemini_api_key)
+            self._gemini_model = genai.GenerativeModel(self.gemini_model)
+
+        # Per-entity metric series: cardinality cap and removal after N sweeps without the entity
+        for lifecycle in (CONTAINER_LABELS, HTTP_TARGET_LABELS, FORECAST_ENTITY_LABELS, MQTT_DEVICE_LABELS):
+            lifecycle.configure(
+                max_values=_env_int("AI_MONITOR_METRIC_MAX_LABEL_VALUES", 500),
+                stale_sweeps=_env_int("AI_MONITOR_METRIC_STALE_SWEEPS", 5),
+            )
+
+        # sparse: one sparse list call + inspect of failing allowlisted containers
+        # full:   docker-py default listing (one inspect per container)
+        self.docker_list_mode = os.getenv("AI_MONITOR_DOCKER_LIST_MODE", "sparse").strip().lower()
+        # Restarts come from both the loop and the triage worker; the governor serializes claims
+        self._restart_governor = RestartGovernor(
+            bucket_capacity=_env_float("AI_MONITOR_RESTART_BUCKET_CAPACITY", 3),
+            bucket_refill_per_hour=_env_float("AI_MONITOR_RESTART_BUCKET_REFILL_PER_HOUR", 1),
+            global_capacity=_env_float("AI_MONITOR_RESTART_GLOBAL_BUCKET_CAPACITY", 6),
+            global_refill_per_hour=_env_float("AI_MONITOR_RESTART_GLOBAL_BUCKET_REFILL_PER_HOUR", 6),
+            max_backoff_seconds=_env_float("AI_MONITOR_RESTART_BACKOFF_MAX_SECONDS", 14400),
+            flap_window_seconds=_env_float("AI_MONITOR_RESTART_FLAP_WINDOW_SECONDS", 21600),
+            flap_threshold=_env_int("AI_MONITOR_RESTART_FLAP_THRESHOLD", 4),
+            breaker_reset_seconds=_env_float("AI_MONITOR_RESTART_BREAKER_RESET_SECONDS", 21600),
+            on_open=self._on_restart_breaker_open,
+        )
+        # Event-driven container state (falls back to polling until the first sync)
+        self.docker_events_enabled = _env_bool("AI_MONITOR_DOCKER_EVENTS_ENABLED", True)
+        self.event_debounce_seconds = _env_float("AI_MONITOR_EVENT_DEBOUNCE_SECONDS", 2.0)
+
+        # Fleet mode: "pi1=unix:///var/run/docker.sock,pi2=ssh://pi@192.168.0.146"; a single
+        # AI_MONITOR_DOCKER_HOST endpoint (named "local") otherwise
+        self.docker_hosts: Dict[str, DockerHost] = {}
+        for name, url in self._docker_endpoints():
+            self.docker_hosts[name] = self._build_docker_host(name, url)
+        
+        # Predictive monitoring
+        self.predictive_enabled = _env_bool("AI_MONITOR_PREDICTIVE_ENABLED", False)
+        self.predictive_interval = _env_int("AI_MONITOR_PREDICTIVE_INTERVAL_SECONDS", 86400)  # Daily
+        self._last_predictive_check = 0.0  # last predictive triage
+        # Trend forecasting runs far more often than predictive triage; the LLM is only
+        # asked again when the set of concerning trends changes or the triage interval passes
+        self.forecast_interval = _env_int("AI_MONITOR_FORECAST_INTERVAL_SECONDS", 300)
+        self._last_forecast_run = 0.0
+        self._last_predictive_keys: List[Tuple[str, str]] = []
+        self._last_forecast: List[TrendFinding] = []
+        
+        # Incident reports
+        self.incident_reports_enabled = _env_bool("AI_MONITOR_INCIDENT_REPORTS_ENABLED", True)
+        self.incident_reports_dir = os.getenv("AI_MONITOR_INCIDENT_REPORTS_DIR", "/app/incidents")
+        self._incident_store: Optional[IncidentStore] = None
+        if self.incident_reports_enabled:
+            try:
+                self._incident_store = IncidentStore(
+                    os.getenv("AI_MONITOR_INCIDENT_DB", os.path.join(self.incident_reports_dir, "incidents.db")),
+                    batch_size=_env_int("AI_MONITOR_INCIDENT_BATCH_SIZE", 20),
+                    flush_seconds=_env_float("AI_MONITOR_INCIDENT_FLUSH_SECONDS", 30.0),
+                    retention_days=_env_float("AI_MONITOR_INCIDENT_RETENTION_DAYS", 90.0),
+                    max_bytes=int(_env_float("AI_MONITOR_INCIDENT_MAX_MB", 50.0) * 1_000_000),
+                    dedupe_seconds=_env_float("AI_MONITOR_INCIDENT_DEDUPE_SECONDS", 3600.0),
+                )
+            except Exception as e:
+                _log("error", "Incident store unavailable; incidents will only be logged", error=str(e))
+        # Incident gating (to avoid false positives)
+        self.incident_min_severity = os.getenv("AI_MONITOR_INCIDENT_MIN_SEVERITY", "medium").strip().lower()
+        self.incident_min_confidence = _env_float("AI_MONITOR_INCIDENT_MIN_CONFIDENCE", 0.5)
+        self.incident_require_evidence = _env_bool("AI_MONITOR_INCIDENT_REQUIRE_EVIDENCE", True)
+
+        # Triage cache: identical failure state within the TTL reuses the previous triage
+        self.triage_cache_ttl_seconds = _env_int("AI_MONITOR_TRIAGE_CACHE_TTL_SECONDS", 3600)
+        self._triage_cache: Dict[str, Tuple[float, Triage]] = {}
+        self._triage_cache_lock = Lock()
+
+        # Per-family probe cadences used by run_forever (run_once still collects everything)
+        self.http_interval_seconds = _env_float("AI_MONITOR_HTTP_INTERVAL_SECONDS", 15.0)
+        self.docker_interval_seconds = _env_float("AI_MONITOR_DOCKER_INTERVAL_SECONDS", 30.0)
+        self.prom_interval_seconds = _env_float("AI_MONITOR_PROM_INTERVAL_SECONDS", float(self.interval_seconds))
+        # Each tick is delayed by up to this fraction of its interval to spread load
+        self.schedule_jitter = _env_float("AI_MONITOR_SCHEDULE_JITTER", 0.1)
+        self._scheduler: Optional[Scheduler] = None
+        # Latest result of every probe family, merged so each task triages the full picture
+        self._latest: Dict[str, Any] = {"http_checks": {}}
+        self._latest_lock = Lock()
+
+        # Triage runs on a background worker once run_forever starts; one-shot run_once
+        # calls (no worker) triage inline
+        self._triage_worker = TriageWorker(
+            self._process_triage, max_queue=_env_int("AI_MONITOR_TRIAGE_QUEUE_SIZE", 8)
+        )
+
+        # Predictive memory thresholds (tunable via env)
+        self.mem_growth_bytes = _env_int("AI_MONITOR_MEM_GROWTH_BYTES", 300_000_000)  # 300MB
+        self.mem_growth_window_hours = _env_int("AI_MONITOR_MEM_GROWTH_WINDOW_HOURS", 2)  # 2h
+        
+        # HTTP synthetic checks
+        self.http_checks = self._parse_http_checks(os.getenv("AI_MONITOR_HTTP_CHECKS", ""))
+        self._last_http_check_results: Dict[str, Dict[str, Any]] = {}
+
+        # MQTT heartbeats: per-device last-seen and rate for the sensor/camera data path
+        self._mqtt: Optional[MqttHeartbeatTracker] = None
+        self._last_mqtt_silent: set = set()
+        mqtt_url = os.getenv("AI_MONITOR_MQTT_URL", "").strip()
+        self.mqtt_interval_seconds = _env_float("AI_MONITOR_MQTT_INTERVAL_SECONDS", 30.0)
+        if mqtt_url and not PAHO_AVAILABLE:
+            _log("warn", "paho-mqtt not installed; MQTT heartbeat tracking disabled")
+        elif mqtt_url:
+            self._mqtt = MqttHeartbeatTracker(
+                mqtt_url,
+                self._parse_mqtt_streams(os.getenv("AI_MONITOR_MQTT_STREAMS", self.DEFAULT_MQTT_STREAMS)),
+                max_devices=_env_int("AI_MONITOR_MQTT_MAX_DEVICES", 500),
+                forget_seconds=_env_float("AI_MONITOR_MQTT_FORGET_SECONDS", 604800.0),
+                username=os.getenv("AI_MONITOR_MQTT_USERNAME") or None,
+                password=os.getenv("AI_MONITOR_MQTT_PASSWORD") or None,
+            )
+
+        # Per-container resource baselines from Docker stats (scheduler only; advisory triage)
+        self.stats_enabled = _env_bool("AI_MONITOR_STATS_ENABLED", True)
+        self.stats_interval_seconds = _env_float("AI_MONITOR_STATS_INTERVAL_SECONDS", 60.0)
+        self._stats = ContainerStatsCollector(
+            alpha=_env_float("AI_MONITOR_STATS_EWMA_ALPHA", 0.1),
+            warmup_samples=_env_int("AI_MONITOR_STATS_WARMUP_SAMPLES", 30),
+            z_threshold=_env_float("AI_MONITOR_STATS_Z_THRESHOLD", 4.0),
+            anomaly_samples=_env_int("AI_MONITOR_STATS_ANOMALY_SAMPLES", 2),
+            forget_seconds=_env_float("AI_MONITOR_STATS_FORGET_SECONDS", 604800.0),
+            concurrency=_env_int("AI_MONITOR_STATS_CONCURRENCY", 8),
+            on_request=self._count_call,
+            persist_seconds=_env_float("AI_MONITOR_STATS_PERSIST_SECONDS", 900.0),
+        )
+        self._last_anomalies: set = set()
+
+        # Data freshness: newest row per InfluxDB 3 measurement / TimescaleDB hypertable
+        self.freshness_interval_seconds = _env_float("AI_MONITOR_FRESHNESS_INTERVAL_SECONDS", 60.0)
+        self._freshness_probes: List[FreshnessProbe] = []
+        self._last_stale_series: set = set()
+        probe_options = {
+            "timeout_seconds": _env_float("AI_MONITOR_FRESHNESS_TIMEOUT_SECONDS", 5.0),
+            "lookback_seconds": _env_float("AI_MONITOR_FRESHNESS_LOOKBACK_SECONDS", 21600.0),
+            "on_request": self._count_call,
+        }
+        influx_url = os.getenv("AI_MONITOR_INFLUXDB3_URL", "").strip()
+        if influx_url:
+            self._freshness_probes.append(InfluxDB3FreshnessProbe(
+                influx_url,
+                os.getenv("AI_MONITOR_INFLUXDB3_TOKEN", ""),
+                self._parse_freshness_targets(
+                    os.getenv("AI_MONITOR_INFLUXDB3_FRESHNESS", self.DEFAULT_INFLUXDB3_FRESHNESS),
+                    InfluxDB3FreshnessProbe.name_pattern,
+                ),
+                **probe_options,
+            ))
+        timescale_dsn = os.getenv("AI_MONITOR_TIMESCALE_DSN", "").strip()
+        if timescale_dsn and not PSYCOPG2_AVAILABLE:
+            _log("warn", "psycopg2 not installed; TimescaleDB freshness probe disabled")
+        elif timescale_dsn:
+            self._freshness_probes.append(TimescaleFreshnessProbe(
+                timescale_dsn,
+                self._parse_freshness_targets(
+                    os.getenv("AI_MONITOR_TIMESCALE_FRESHNESS", self.DEFAULT_TIMESCALE_FRESHNESS),
+                    TimescaleFreshnessProbe.name_pattern,
+                ),
+                **probe_options,
+            ))
+
+        # Bearer token for state-changing endpoints on the metrics port (POST /log-level);
+        # they are not served at all while it is unset
+        self.admin_token = os.getenv("AI_MONITOR_ADMIN_TOKEN", "")
+
+        # Alertmanager webhook: push-triggered triage, with the polling loop as the fallback
+        self._alert_inbox = AlertInbox(ttl_seconds=_env_float("AI_MONITOR_ALERT_TTL_SECONDS", 14700.0))
+        self._alert_triage_bucket = TokenBucket(
+            _env_float("AI_MONITOR_ALERT_TRIAGE_BURST", 3),
+            _env_float("AI_MONITOR_ALERT_TRIAGE_PER_HOUR", 30) / 3600,
+        )
+        # Alerts end up in triage prompts (and may lead to restarts); /alerts is only served with a token
+        self.alert_webhook_token = os.getenv("AI_MONITOR_ALERT_WEBHOOK_TOKEN", "")
+        # >1 stretches the Prometheus poll by this factor while no alert is firing
+        self.alert_quiet_poll_factor = max(1.0, _env_float("AI_MONITOR_ALERT_QUIET_POLL_FACTOR", 1.0))
+        if self.alert_quiet_poll_factor > 1 and not self.alert_webhook_token:
+            _log("warn", "AI_MONITOR_ALERT_QUIET_POLL_FACTOR needs the alert webhook; ignored")
+            self.alert_quiet_poll_factor = 1.0
+        self._alert_pending: Dict[str, Tuple[float, Dict[str, Any]]] = {}  # fingerprint -> (received, alert)
+        self._alert_lock = Lock()
+        self._alert_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="alert-triage")
+        self._last_prom_poll: Optional[float] = None
+
+        # Per-task upstream call accounting (collector threads update a tally concurrently)
+        self._calls_lock = Lock()
+
+        # Snapshot sources are fetched concurrently so a cycle costs the slowest source, not the sum
+        collector_workers = _env_int("AI_MONITOR_COLLECTOR_WORKERS", len(SNAPSHOT_QUERIES) + 1)
+        self._collector = ThreadPoolExecutor(max_workers=collector_workers, thread_name_prefix="collector")
+        # Source deadlines start at submit, so Docker hosts must not queue behind slow Prometheus
+        # queries; two workers per host let the docker task and an alert snapshot list at once
+        self._docker_pool = ThreadPoolExecutor(
+            max_workers=2 * max(1, len(self.docker_hosts)), thread_name_prefix="docker-list"
+        )
+        self._prom = PrometheusClient(
+            self.prometheus_url,
+            timeout_seconds=self.prom_timeout_seconds,
+            cache_ttl_seconds=_env_float("AI_MONITOR_PROM_CACHE_TTL_SECONDS", 10.0),
+            retries=_env_int("AI_MONITOR_PROM_RETRIES", 2),
+            backoff_seconds=_env_float("AI_MONITOR_PROM_RETRY_BACKOFF_SECONDS", 0.25),
+            pool_size=collector_workers,
+            on_request=lambda: self._count_call("prometheus"),
+        )
+
+        self._forecaster: Optional[TrendForecaster] = None
+        if NUMPY_AVAILABLE:
+            self._forecaster = TrendForecaster(
+                self._prom,
+                window_hours=_env_float("AI_MONITOR_FORECAST_WINDOW_HOURS", 6.0),
+                step_seconds=_env_float("AI_MONITOR_FORECAST_STEP_SECONDS", 300.0),
+                horizon_hours=_env_float("AI_MONITOR_FORECAST_HORIZON_HOURS", 24.0),
+                method=os.getenv("AI_MONITOR_FORECAST_METHOD", "linear").strip().lower(),
+                mem_growth_bytes=self.mem_growth_bytes,
+                mem_growth_window_hours=self.mem_growth_window_hours,
+                disk_min_free_percent=_env_float("AI_MONITOR_DISK_MIN_FREE_PERCENT", 20.0),
+                max_flaps_per_hour=_env_float("AI_MONITOR_MAX_FLAPS_PER_HOUR", 5.0),
+            )
+
+        # HTTP checks get their own capped pool and a keep-alive session sized to match
+        self.http_concurrency = max(1, _env_int("AI_MONITOR_HTTP_CONCURRENCY", 8))
+        self._http_pool = ThreadPoolExecutor(max_workers=self.http_concurrency, thread_name_prefix="http-check")
+        self._http_session = requests.Session()
+        adapter = TimedHTTPAdapter(pool_connections=16, pool_maxsize=self.http_concurrency)
+        self._http_session.mount("http://", adapter)
+        self._http_session.mount("https://", adapter)
+
+        # Warm restarts: cooldowns, triage cache, predictive timestamps and HTTP baselines
+        # survive a redeploy. An empty AI_MONITOR_STATE_FILE disables persistence.
+        state_path = os.getenv("AI_MONITOR_STATE_FILE", os.path.join(self.incident_reports_dir, "monitor-state.json"))
+        self.state_checkpoint_seconds = _env_float("AI_MONITOR_STATE_CHECKPOINT_SECONDS", 60.0)
+        self._state_file: Optional[StateFile] = None
+        if state_path.strip():
+            self._state_file = StateFile(
+                state_path, max_age_seconds=_env_float("AI_MONITOR_STATE_MAX_AGE_SECONDS", 21600.0)
+            )
+            self._restore_state()
+
+    def _parse_http_checks(self, checks_str: str) -> List[Dict[str, Any]]:
+        """
+        Parse AI_MONITOR_HTTP_CHECKS env var.
+        Format: url|expected_status[|option=value...] ; url2|expected_status[|...]
+        Options method=, timeout= and body= configure the request; any other key=value is a header.
+        """
+        checks = []
+        if not checks_str.strip():
+            return checks
+        for check_entry in checks_str.split(";"):
+            parts = [p.strip() for p in check_entry.split("|")]
+            if len(parts) < 2:
+                continue
+            url = parts[0]
+            expected_status = int(parts[1])
+            headers = {}
+            method = "GET"
+            timeout = self.http_timeout_seconds
+            body: Optional[str] = None
+            for i in range(2, len(parts)):
+                if "=" in parts[i]:
+                    k, v = parts[i].split("=", 1)
+                    k, v = k.strip(), v.strip()
+                    if k.lower() == "method":
+                        method = v.upper()
+                    elif k.lower() == "timeout":
+                        try:
+                            timeout = float(v)
+                        except ValueError:
+                            pass
+                    elif k.lower() == "body":
+                        body = v
+                    else:
+                        headers[k] = v
+            checks.append({
+                "url": url,
+                "expected_status": expected_status,
+                "headers": headers,
+                "method": method,
+                "timeout": timeout,
+                "body": body,
+            })
+        return checks
+
+    DEFAULT_MQTT_STREAMS = (
+        "esp_temperature=esp-sensor-hub/+/temperature|900;"
+        "esp_status=esp-sensor-hub/+/status|900;"
+        "surveillance=surveillance/#|900"
+    )
+
+    @staticmethod
+    def _parse_mqtt_streams(streams_str: str) -> List[MqttStream]:
+        """
+        Parse AI_MONITOR_MQTT_STREAMS.
+        Format: name=topic_filter|stale_seconds ; name2=topic_filter2|stale_seconds
+        """
+        streams = []
+        for entry in streams_str.split(";"):
+            name, sep, rest = entry.partition("=")
+            topic_filter, _, stale = rest.partition("|")
+            if not sep or not name.strip() or not topic_filter.strip():
+                continue
+            try:
+                stale_seconds = float(stale) if stale.strip() else 900.0
+            except ValueError:
+                _log("warn", "Invalid MQTT stale_seconds; using 900", stream=name.strip(), value=stale)
+                stale_seconds = 900.0
+            streams.append(MqttStream(name.strip(), topic_filter.strip(), stale_seconds))
+        return streams
+
+    DEFAULT_INFLUXDB3_FRESHNESS = (
+        "temperature_data=esp_temperature|300;temperature_data=esp_status|900;surveillance=surveillance|900"
+    )
+    DEFAULT_TIMESCALE_FRESHNESS = "postgres=esp_temperature|300"
+
+    @staticmethod
+    def _parse_freshness_targets(targets_str: str, name_pattern: "re.Pattern[str]") -> List[FreshnessTarget]:
+        """
+        Parse AI_MONITOR_INFLUXDB3_FRESHNESS / AI_MONITOR_TIMESCALE_FRESHNESS.
+        Format: database=series[,series...]|stale_seconds ; database2=series2|stale_seconds
+        Series names must match the store's name_pattern.
+        """
+        targets = []
+        for entry in targets_str.split(";"):
+            database, sep, rest = entry.partition("=")
+            names, _, stale = rest.partition("|")
+            if not sep or not database.strip():
+                continue
+            try:
+                stale_seconds = float(stale) if stale.strip() else 900.0
+            except ValueError:
+                _log("warn", "Invalid freshness stale_seconds; using 900", database=database.strip(), value=stale)
+                stale_seconds = 900.0
+            for name in filter(None, (n.strip() for n in names.split(","))):
+                if not name_pattern.fullmatch(name):
+                    _log("warn", "Invalid freshness series name; skipped", database=database.strip(), series=name)
+                    continue
+                targets.append(FreshnessTarget(database.strip(), name, stale_seconds))
+        return targets
+
+    @staticmethod
+    def _docker_endpoints() -> List[Tuple[str, str]]:
+        fleet = os.getenv("AI_MONITOR_DOCKER_HOSTS", "").strip()
+        if not fleet:
+            return [("local", os.getenv("AI_MONITOR_DOCKER_HOST", "unix://var/run/docker.sock"))]
+        endpoints: List[Tuple[str, str]] = []
+        for i, entry in enumerate(e.strip() for e in fleet.split(",")):
+            if not entry:
+                continue
+            name, sep, url = entry.partition("=")
+            if not sep or "://" in name:
+                name, url = f"host{i + 1}", entry  # unnamed endpoint
+            endpoints.append((name.strip(), url.strip()))
+        return endpoints
+
+    def _build_docker_host(self, name: str, url: str) -> DockerHost:
+        """
+        Client and guardrails for one endpoint. Per-host settings use the prefix
+        AI_MONITOR_DOCKER_<NAME>_ and fall back to the global values.
+        """
+        prefix = f"AI_MONITOR_DOCKER_{re.sub(r'[^A-Z0-9]+', '_', name.upper())}_"
+        timeout = _env_int(prefix + "TIMEOUT_SECONDS", self.docker_timeout_seconds)
+        # tcp:// with TLS: CA and/or client certificate files mounted into the container
+        ca_cert = os.getenv(prefix + "TLS_CA_CERT")
+        client_cert = os.getenv(prefix + "TLS_CLIENT_CERT")
+        client_key = os.getenv(prefix + "TLS_CLIENT_KEY")
+        tls: Any = False
+        if ca_cert or client_cert:
+            tls = docker.tls.TLSConfig(
+                client_cert=(client_cert, client_key) if client_cert and client_key else None,
+                ca_cert=ca_cert,
+                verify=ca_cert or True,
+            )
+        client_kwargs: Dict[str, Any] = {
+            "base_url": url,
+            "timeout": timeout,
+            "tls": tls,
+            # ssh:// through the ssh binary (keys/known_hosts mounted); false uses paramiko
+            "use_ssh_client": _env_bool(prefix + "SSH_CLIENT", True),
+            "version": os.getenv(prefix + "API_VERSION", "auto"),
+        }
+        try:
+            client = docker.DockerClient(**client_kwargs)
+        except docker.errors.DockerException as e:
+            # "auto" asks the daemon for its API version; an unreachable host must not stop
+            # the rest of the fleet, so pin a version and let it report down until it's back
+            if client_kwargs["version"] != "auto":
+                raise
+            _log("warn", "Docker host unreachable at startup", host=name, url=url, error=str(e))
+            client = docker.DockerClient(**{**client_kwargs, "version": docker.constants.DEFAULT_DOCKER_API_VERSION})
+        allowed_raw = os.getenv(prefix + "ALLOWED_CONTAINERS")
+        allowed = (
+            {c.strip() for c in allowed_raw.split(",") if c.strip()}
+            if allowed_raw is not None
+            else self.allowed_containers
+        )
+        host = DockerHost(
+            name=name,
+            url=url,
+            client=client,
+            timeout_seconds=timeout,
+            allowed_containers=allowed,
+            max_restarts_per_run=_env_int(prefix + "MAX_RESTARTS_PER_RUN", self.max_restarts_per_run),
+            cooldown_seconds=_env_int(
+                prefix + "RESTART_COOLDOWN_SECONDS", _env_int("AI_MONITOR_RESTART_COOLDOWN_SECONDS", 600)
+            ),
+            log_tracker=ContainerLogTracker(
+                client.api,
+                salient_lines=_env_int("AI_MONITOR_LOG_SALIENT_LINES", 50),
+                tail_lines=_env_int("AI_MONITOR_LOG_TAIL_LINES", 10),
+                initial_tail=_env_int("AI_MONITOR_LOG_INITIAL_TAIL", 200),
+                on_fetch=lambda: self._count_call("docker_logs"),
+            ),
+            restart_executor=RestartExecutor(
+                client.api,
+                concurrency=_env_int("AI_MONITOR_RESTART_CONCURRENCY", 3),
+                verify_seconds=_env_float("AI_MONITOR_RESTART_VERIFY_SECONDS", 90.0),
+                on_call=self._count_call,
+                host=name,
+            ),
+        )
+        if self.docker_events_enabled:
+            host.table = ContainerStateTable(
+                client,
+                lambda: self._list_container_states(host),
+                resync_seconds=_env_int("AI_MONITOR_DOCKER_RESYNC_SECONDS", 600),
+                on_failure=lambda container: self._on_container_failure(host, container),
+            )
+        return host
+
+    def _count_call(self, source: str, n: int = 1) -> None:
+        if n <= 0:
+            return
+        UPSTREAM_CALLS_TOTAL.labels(source=source).inc(n)
+        calls = _CALL_SCOPE.get()
+        if calls is not None:
+            with self._calls_lock:
+                calls[source] = calls.get(source, 0) + n
+
+    def _count_task_calls(self, task: str, run: Callable[[], Optional[bool]]) -> None:
+        """
+        Run one task with its own upstream call tally and publish it. A run that returns
+        False was skipped and leaves the previous counts in place.
+        """
+        calls: Dict[str, int] = {}
+        token = _CALL_SCOPE.set(calls)
+        ran: Optional[bool] = None
+        try:
+            ran = run()
+        finally:
+            _CALL_SCOPE.reset(token)
+            if ran is not False:
+                with self._calls_lock:
+                    calls = dict(calls)  # a timed-out source may still be counting
+                self._publish_task_calls(task, calls)
+
+    def _publish_task_calls(self, task: str, calls: Dict[str, int]) -> Dict[str, int]:
+        for source in UPSTREAM_SOURCES:
+            CYCLE_UPSTREAM_CALLS.labels(task=task, source=source).set(calls.get(source, 0))
+        _log("debug", "Cycle upstream calls", task=task, total=sum(calls.values()), **calls)
+        return calls
+
+    def _run_http_check(self, check: Dict[str, Any]) -> Dict[str, Any]:
+        """Run a single HTTP check on the pooled session and update its Prometheus metrics."""
+        target = check["url"]
+        series = HTTP_TARGET_LABELS.label(target)
+        phases: Dict[str, float] = {}
+        _HTTP_PHASES.current = phases
+        timer = _PhaseTimer("http_check", series)
+        try:
+            self._count_call("http_check")
+            start = time.perf_counter()
+            with timer:
+                response = self._http_session.request(
+                    check["method"],
+                    check["url"],
+                    headers=check["headers"],
+                    data=check["body"],
+                    timeout=check["timeout"],
+                    allow_redirects=False,
+                )
+                if response.status_code != check["expected_status"]:
+                    timer.outcome = "unexpected_status"
+            latency_ms = int((time.perf_counter() - start) * 1000)
+            # requests' elapsed runs from send to parsed headers; minus connection setup that is TTFB
+            setup = phases.get("dns", 0.0) + phases.get("connect", 0.0) + phases.get("tls", 0.0)
+            phases["ttfb"] = max(0.0, response.elapsed.total_seconds() - setup)
+            ok = response.status_code == check["expected_status"]
+            HTTP_CHECK_OK.labels(target=series).set(1 if ok else 0)
+            HTTP_CHECK_LATENCY.labels(target=series).set(latency_ms)
+            timings = {phase: round(phases.get(phase, 0.0) * 1000, 1) for phase in ("dns", "connect", "tls", "ttfb")}
+            for phase, ms in timings.items():
+                HTTP_CHECK_PHASE.labels(target=series, phase=phase).set(ms)
+            return {
+                "target": target,
+                "ok": ok,
+                "status": response.status_code,
+                "expected": check["expected_status"],
+                "latency_ms": latency_ms,
+                "timings_ms": timings,
+            }
+        except Exception as e:
+            HTTP_CHECK_OK.labels(target=series).set(0)
+            return self._http_check_error(check, str(e))
+        finally:
+            _HTTP_PHASES.current = None
+
+    @staticmethod
+    def _http_check_error(check: Dict[str, Any], error: str) -> Dict[str, Any]:
+        return {
+            "target": check["url"],
+            "ok": False,
+            "status": None,
+            "expected": check["expected_status"],
+            "latency_ms": None,
+            "error": error,
+        }
+
+    # ----------------------------- Prometheus ---------------------------------
+    def prom_query(self, query: str, timeout_seconds: int = 10, name: str = "adhoc") -> Dict[str, Any]:
+        return self._prom.query(query, name=name, timeout_seconds=timeout_seconds)
+
+    def _run_prom_query(self, q: PromQuery) -> Dict[str, Any]:
+        try:
+            payload = self.prom_query(q.query, timeout_seconds=self.prom_timeout_seconds, name=q.name)
+            series = payload.get("data", {}).get("result", [])
+            return {
+                "description": q.description,
+                "query": q.query,
+                "result": series,
+            }
+        except Exception as e:
+            return self._prom_query_error(q, str(e))
+
+    @staticmethod
+    def _prom_query_error(q: PromQuery, error: str) -> Dict[str, Any]:
+        return {
+            "description": q.description,
+            "query": q.query,
+            "error": error,
+            "result": [],
+        }
+
+    def _collect(self, sources: List[CollectionSource]) -> Dict[str, Any]:
+        """
+        Fan out all sources on the collector pool and wait for them against two deadlines:
+        each source's own deadline and the overall snapshot deadline, whichever comes first.
+        Sources that miss their deadline get their on_timeout placeholder and are listed
+        under "timed_out_sources"; their worker keeps running until the client timeout fires.
+        """
+        started = time.monotonic()
+        cycle_deadline = started + self.snapshot_deadline_seconds
+        pending = [
+            (
+                src,
+                (src.executor or self._collector).submit(contextvars.copy_context().run, src.fetch),
+                min(started + src.deadline_seconds, cycle_deadline),
+            )
+            for src in sources
+        ]
 
-    def _run_http_checks(self) -> Dict[str, Dict[str, Any]]:
-        """Run HTTP checks and return results. Also update Prometheus metrics."""
-        results = {}
-        for check in self.http_checks:
-            target = check["url"]
+        results: Dict[str, Any] = {}
+        timed_out: List[str] = []
+        for src, future, deadline in pending:
             try:
-                start = time.time()
-                response = requests.get(check["url"], headers=check["headers"], timeout=3)
-                latency_ms = int((time.time() - start) * 1000)
-                ok = response.status_code == check["expected_status"]
-                result = {
-                    "target": target,
-                    "ok": ok,
-                    "status": response.status_code,
-                    "expected": check["expected_status"],
-                    "latency_ms": latency_ms,
-                }
-                results[target] = result
-                HTTP_CHECK_OK.labels(target=target).set(1 if ok else 0)
-                HTTP_CHECK_LATENCY.labels(target=target).set(latency_ms)
+                results[src.name] = future.result(timeout=max(0.0, deadline - time.monotonic()))
+            except FutureTimeoutError:
+                future.cancel()
+                timed_out.append(src.name)
+                results[src.name] = src.on_timeout("deadline exceeded")
             except Exception as e:
-                results[target] = {
-                    "target": target,
-                    "ok": False,
-                    "status": None,
-                    "expected": check["expected_status"],
-                    "latency_ms": None,
-                    "error": str(e),
-                }
-                HTTP_CHECK_OK.labels(target=target).set(0)
+                results[src.name] = src.on_timeout(str(e))
+
+        if timed_out:
+            _log("warn", "Snapshot sources timed out", sources=timed_out)
+        _log(
+            "debug",
+            "Snapshot collected",
+            sources=len(sources),
+            duration_ms=int((time.monotonic() - started) * 1000),
+        )
+        results["timed_out_sources"] = timed_out
         return results
 
-    # ----------------------------- Prometheus ---------------------------------
-    def prom_query(self, query: str, timeout_seconds: int = 10) -> Dict[str, Any]:
-        url = f"{self.prometheus_url}/api/v1/query"
-        response = requests.get(url, params={"query": query}, timeout=timeout_seconds)
-        response.raise_for_status()
-        return response.json()
+    # Small grace on top of each client timeout so the client, not the collector, reports the error
+    _SOURCE_GRACE_SECONDS = 1.0
 
-    def gather_snapshot(self) -> Dict[str, Any]:
-        queries = [
-            PromQuery(
-                name="down_targets",
-                query='up == 0',
-                description="Any Prometheus scrape targets currently down",
-            ),
-            PromQuery(
-                name="container_mem_top",
-                query='topk(5, docker_container_mem_usage)',
-                description="Top container memory usage (bytes) if available",
-            ),
-            PromQuery(
-                name="container_cpu_top",
-                query='topk(5, rate(container_cpu_usage_seconds_total[5m]))',
-                description="Top container CPU usage (cores) if available",
-            ),
+    def _prom_sources(self) -> List[CollectionSource]:
+        return [
+            CollectionSource(
+                name=q.name,
+                fetch=lambda q=q: self._run_prom_query(q),
+                deadline_seconds=self.prom_timeout_seconds + self._SOURCE_GRACE_SECONDS,
+                on_timeout=lambda err, q=q: self._prom_query_error(q, err),
+            )
+            for q in SNAPSHOT_QUERIES
         ]
 
-        results: Dict[str, Any] = {}
-        for q in queries:
-            try:
-                payload = self.prom_query(q.query, timeout_seconds=self.prom_timeout_seconds)
-                series = payload.get("data", {}).get("result", [])
-                results[q.name] = {
-                    "description": q.description,
-                    "query": q.query,
-                    "result": series,
-                }
-            except Exception as e:
-                results[q.name] = {
-                    "description": q.description,
-                    "query": q.query,
-                    "error": str(e),
-                    "result": [],
-                }
+    def _docker_sources(self) -> List[CollectionSource]:
+        # Docker health snapshot (ground truth), one source per host so hosts are listed
+        # concurrently and a slow daemon only times out its own share
+        return [
+            CollectionSource(
+                name=f"docker:{host.name}",
+                fetch=lambda host=host: self._docker_health_snapshot(host),
+                deadline_seconds=host.timeout_seconds + self._SOURCE_GRACE_SECONDS,
+                on_timeout=lambda err, host=host: self._docker_host_error(host, err),
+                executor=self._docker_pool,
+            )
+            for host in self.docker_hosts.values()
+        ]
 
-        # Docker health snapshot (local ground truth)
-        # Include logs when gathering for triage (not for routine checks)
-        results["docker_health"] = self._docker_health_snapshot(include_logs=False)
-        
-        # HTTP synthetic checks
-        results["http_checks"] = self._run_http_checks()
+    def _http_sources(self) -> List[CollectionSource]:
+        # HTTP synthetic checks; with more checks than workers they run in waves
+        waves = math.ceil(len(self.http_checks) / self.http_concurrency) if self.http_checks else 0
+        return [
+            CollectionSource(
+                name=f"http:{check['url']}",
+                fetch=lambda check=check: self._run_http_check(check),
+                deadline_seconds=check["timeout"] * waves + self._SOURCE_GRACE_SECONDS,
+                on_timeout=lambda err, check=check: self._http_check_error(check, err),
+                executor=self._http_pool,
+            )
+            for check in self.http_checks
+        ]
+
+    def _collect_snapshot(self, sources: List[CollectionSource]) -> Dict[str, Any]:
+        results = self._collect(sources)
+        http = {
+            check["url"]: results.pop(f"http:{check['url']}")
+            for check in self.http_checks
+            if f"http:{check['url']}" in results
+        }
+        if http:
+            results["http_checks"] = http
+        hosts = {
+            name: results.pop(f"docker:{name}")
+            for name in self.docker_hosts
+            if f"docker:{name}" in results
+        }
+        if hosts:
+            results["docker_health"] = self._merge_docker_health(hosts)
         return results
-    
-    def gather_snapshot_with_logs(self) -> Dict[str, Any]:
-        """Gather snapshot including container logs for failed containers."""
-        snapshot = self.gather_snapshot()
-        # Replace docker health with version that includes logs
-        snapshot["docker_health"] = self._docker_health_snapshot(include_logs=True)
+
+    @staticmethod
+    def _merge_docker_health(hosts: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+        """One docker_health view over all hosts; containers carry their host name."""
+        merged: Dict[str, Any] = {"containers": [], "hosts": {}}
+        errors: List[str] = []
+        for name, health in hosts.items():
+            merged["containers"].extend(health.get("containers", []))
+            merged["hosts"][name] = {k: v for k, v in health.items() if k != "containers"}
+            if health.get("error"):
+                errors.append(f"{name}: {health['error']}" if len(hosts) > 1 else health["error"])
+        if errors:
+            merged["error"] = "; ".join(errors)
+        return merged
+
+    def gather_snapshot(self) -> Dict[str, Any]:
+        snapshot = self._collect_snapshot(self._prom_sources() + self._docker_sources() + self._http_sources())
+        snapshot.setdefault("http_checks", {})
+        if self._mqtt is not None:
+            snapshot["mqtt"] = self._mqtt.publish()
         return snapshot
+    
+    def gather_snapshot_with_logs(self, snapshot: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Return the snapshot enriched with recent logs for failing containers.
+
+        When an existing snapshot is passed, nothing is re-collected: only the failing
+        containers' logs are fetched. Logs are attached to the shared container entries, so
+        a second enrichment in the same cycle is free. The returned dict is a shallow copy,
+        so callers can add trigger-specific keys without leaking them into other triages.
+        """
+        if snapshot is None:
+            snapshot = self.gather_snapshot()
+        for c in snapshot.get("docker_health", {}).get("containers", []):
+            if "recent_logs" not in c and _is_failing(c) and c.get("name"):
+                c.update(self._fetch_container_logs(self.docker_hosts.get(c.get("host")), c["name"]))
+        return dict(snapshot)
 
     # ------------------------------- Docker -----------------------------------
-    def _docker_health_snapshot(self, include_logs: bool = False) -> Dict[str, Any]:
+    def _fetch_container_logs(self, host: Optional[DockerHost], container: str) -> Dict[str, Any]:
+        """Salient lines (errors, tracebacks, OOM) and the recent tail, read incrementally."""
+        try:
+            with _PhaseTimer("docker_logs", host.name):
+                logs = host.log_tracker.fetch(container)
+            return {"salient_logs": logs["salient"], "recent_logs": "\n".join(logs["tail"])}
+        except Exception:
+            return {"recent_logs": "(logs unavailable)"}
+
+    def _list_container_states(self, host: DockerHost) -> List[Dict[str, Any]]:
+        with _PhaseTimer("docker_list", host.name):
+            if self.docker_list_mode == "full":
+                return self._list_container_states_full(host)
+            return self._list_container_states_sparse(host)
+
+    def _list_container_states_sparse(self, host: DockerHost) -> List[Dict[str, Any]]:
+        """
+        Cheap listing: one sparse list call gives counts and coarse state (State, plus the
+        health rendered in Status), and only failing allowlisted containers (the ones
+        self-heal may act on) are fully inspected.
+        """
+        api = host.client.api
+        listing = api.containers(all=True)
+        self._count_call("docker_list")
+
+        states: List[Dict[str, Any]] = []
+        for r in listing:
+            names = r.get("Names") or []
+            status_text = r.get("Status") or ""
+            health_match = _STATUS_HEALTH_RE.search(status_text)
+            exit_match = _STATUS_EXIT_CODE_RE.match(status_text)
+            st: Dict[str, Any] = {
+                "id": r["Id"],
+                "name": names[0].lstrip("/") if names else None,
+                "status": r.get("State"),
+                "health": health_match.group(1).replace("health: ", "") if health_match else None,
+                "exit_code": int(exit_match.group(1)) if exit_match else (0 if r.get("State") == "running" else None),
+            }
+            if _is_failing(st) and host.allows(st["name"]):
+                try:
+                    state = api.inspect_container(r["Id"]).get("State") or {}
+                    self._count_call("docker_inspect")
+                    st["status"] = state.get("Status", st["status"])
+                    st["health"] = (state.get("Health") or {}).get("Status", st["health"])
+                    st["exit_code"] = state.get("ExitCode", st["exit_code"])
+                except Exception as e:
+                    _log("debug", "Inspect failed; using sparse state", container=st["name"], error=str(e))
+            states.append(st)
+        return states
+
+    def _list_container_states_full(self, host: DockerHost) -> List[Dict[str, Any]]:
+        # Non-sparse listing is one list call plus one inspect per container
+        containers = host.client.containers.list(all=True)
+        self._count_call("docker_list")
+        self._count_call("docker_inspect", len(containers))
+        states: List[Dict[str, Any]] = []
+        for c in containers:
+            attrs = c.attrs or {}
+            state = (attrs.get("State") or {})
+            health = (state.get("Health") or {}) if isinstance(state, dict) else {}
+            states.append({
+                "id": c.id,
+                "name": c.name,
+                "status": state.get("Status"),
+                "health": health.get("Status"),
+                "exit_code": state.get("ExitCode"),
+            })
+        return states
+
+    def _docker_health_snapshot(self, host: DockerHost) -> Dict[str, Any]:
         snapshot: Dict[str, Any] = {"containers": []}
         try:
-            containers = self._docker_client.containers.list(all=True)
-            for c in containers:
-                attrs = c.attrs or {}
-                state = (attrs.get("State") or {})
-                health = (state.get("Health") or {}) if isinstance(state, dict) else {}
-                
-                container_info = {
-                    "name": c.name,
-                    "status": state.get("Status"),
-                    "health": health.get("Status"),
-                    "exit_code": state.get("ExitCode"),
-                }
-                
-                # Include logs for unhealthy/exited containers if requested
-                if include_logs and (container_info["health"] == "unhealthy" or 
-                                    container_info["status"] in ["exited", "dead"]):
-                    try:
-                        logs = c.logs(tail=50, timestamps=False).decode('utf-8', errors='ignore')
-                        container_info["recent_logs"] = logs[-2000:]  # Last 2KB of logs
-                    except Exception:
-                        container_info["recent_logs"] = "(logs unavailable)"
-                
-                snapshot["containers"].append(container_info)
+            table = host.table
+            if table is not None and table.ready:
+                states = table.snapshot()
+                snapshot["source"] = "events"
+            else:
+                states = self._list_container_states(host)
+                snapshot["source"] = "poll"
+            host.log_tracker.retain({st.get("name") for st in states})
+            for st in sorted(states, key=lambda st: st.get("name") or ""):
+                if not st.get("name"):
+                    continue
+                snapshot["containers"].append({
+                    "host": host.name,
+                    "name": st["name"],
+                    "status": st.get("status"),
+                    "health": st.get("health"),
+                    "exit_code": st.get("exit_code"),
+                })
+            DOCKER_HOST_UP.labels(host=host.name).set(1)
         except Exception as e:
-            snapshot["error"] = str(e)
+            return self._docker_host_error(host, str(e))
         return snapshot
 
-    def _restart_container(self, container_name: str) -> bool:
-        cooldown_seconds = _env_int("AI_MONITOR_RESTART_COOLDOWN_SECONDS", 600)
-        now = time.time()
-        last = self._last_restart.get(container_name, 0)
-        if now - last < cooldown_seconds:
-            _log("warn", "Restart skipped (cooldown)", container=container_name, cooldown_seconds=cooldown_seconds)
-            return False
+    @staticmethod
+    def _docker_host_error(host: DockerHost, error: str) -> Dict[str, Any]:
+        DOCKER_HOST_UP.labels(host=host.name).set(0)
+        return {"containers": [], "error": error}
+
+    def _on_container_failure(self, host: DockerHost, container: Dict[str, Any]) -> None:
+        """Called from the events thread; wakes the loop instead of waiting for the next tick."""
+        _log("warn", "Container failure event", host=host.name, container=container.get("name"),
+             status=container.get("status"), health=container.get("health"))
+        if self._scheduler is not None:
+            self._scheduler.trigger("docker", delay_seconds=self.event_debounce_seconds)
 
-        if self.allowed_containers and container_name not in self.allowed_containers:
-            _log("warn", "Restart blocked (not allowlisted)", container=container_name)
+    def _claim_restart(self, host: DockerHost, container_name: str) -> bool:
+        """Apply the host's allowlist and the restart governor; on success the restart slot is taken."""
+        if not host.allows(container_name):
+            _log("warn", "Restart blocked (not allowlisted)", host=host.name, container=container_name)
             return False
 
+        allowed, reason = self._restart_governor.claim(host.name, container_name, host.cooldown_seconds)
+        if not allowed:
+            _log("debug" if reason == "circuit_open" else "warn", "Restart skipped", host=host.name,
+                 container=container_name, reason=reason)
+        return allowed
+
+    def _on_restart_breaker_open(self, host: str, container: str, history: List[float]) -> None:
+        """A crash-looping container: stop restarting it and escalate as a high-severity incident."""
+        _log("error", "Restart circuit open; auto-restarts stopped", host=host, container=container,
+             restarts_in_window=len(history))
+        if self._incident_store is None:
+            return
+        summary = (
+            f"{host}/{container} was restarted {len(history)} times within "
+            f"{int(self._restart_governor.flap_window_seconds // 60)} minutes and keeps failing; "
+            "automatic restarts are suspended until the breaker resets"
+        )
+        self._incident_store.add({
+            "ts": time.time(),
+            "fingerprint": hashlib.sha256(f"restart_flap:{host}/{container}".encode()).hexdigest()[:16],
+            "kind": "restart_flap",
+            "severity": "high",
+            "confidence": 1.0,
+            "summary": summary,
+            "triage": {
+                "summary": summary,
+                "severity": "high",
+                "suspected_causes": ["Crash loop: the container fails again shortly after every restart"],
+                "recommended_actions": [
+                    {"type": "alert", "target": f"{host}/{container}", "reason": "Manual investigation required"}
+                ],
+                "confidence": 1.0,
+            },
+            "evidence": {"restart_history": history},
+            "containers": [container],
+        })
+
+    def _resolve_restart_targets(self, targets: List[str], snapshot: Dict[str, Any]) -> List[Tuple[DockerHost, str]]:
+        """
+        Map LLM restart targets to (host, container). "host/name" is explicit; a bare name
+        goes to the hosts where it is failing in the snapshot, or where it exists at all,
+        or to the only host when there is just one.
+        """
+        containers = snapshot.get("docker_health", {}).get("containers", [])
+        resolved: List[Tuple[DockerHost, str]] = []
+        for target in dict.fromkeys(targets):
+            host_name, _, name = target.rpartition("/")
+            if host_name in self.docker_hosts:
+                resolved.append((self.docker_hosts[host_name], name))
+                continue
+            name = target
+            present = [c for c in containers if c.get("name") == name]
+            hosts = (
+                [c.get("host") for c in present if _is_failing(c)]
+                or [c.get("host") for c in present]
+                or (list(self.docker_hosts) if len(self.docker_hosts) == 1 else [])
+            )
+            if not hosts:
+                _log("warn", "Restart target not found on any host", container=name)
+            resolved.extend((self.docker_hosts[h], name) for h in dict.fromkeys(hosts) if h in self.docker_hosts)
+        return resolved
+
+    def _restart_containers(self, targets: List[str], snapshot: Dict[str, Any]) -> List[str]:
+        """
+        Claim and schedule restarts. Claimed containers are restarted in the background in
+        compose dependency order with health verification, one plan per host; returns the
+        claimed containers as host/name.
+        """
+        claimed: Dict[str, List[str]] = {}
+        for host, name in self._resolve_restart_targets(targets, snapshot):
+            if self._claim_restart(host, name):
+                claimed.setdefault(host.name, []).append(name)
+        for host_name, names in claimed.items():
+            host = self.docker_hosts[host_name]
+            host.restart_plans.submit(self._run_restart_plan, host, names)
+        return [f"{h}/{n}" for h, names in claimed.items() for n in names]
+
+    def _run_restart_plan(self, host: DockerHost, names: List[str]) -> None:
         try:
-            container = self._docker_client.containers.get(container_name)
-            _log("warn", "Restarting container", container=container_name)
-            container.restart(timeout=10)
-            self._last_restart[container_name] = now
-            RESTARTS_TOTAL.labels(container=container_name).inc()
-            return True
+            outcomes = host.restart_executor.run(names)
+            _log("info", "Restart plan finished", host=host.name, outcomes=outcomes)
         except Exception as e:
-            _log("error", "Restart failed", container=container_name, error=str(e))
-            return False
+            _log("error", "Restart plan failed", host=host.name, containers=names, error=str(e))
 
-    def _containers_needing_restart(self, docker_health: List[Dict[str, Any]]) -> List[str]:
+    def _containers_needing_restart(self, host: DockerHost, docker_health: List[Dict[str, Any]]) -> List[str]:
         candidates: List[str] = []
         for c in docker_health:
             name = c.get("name")
             if not name:
                 continue
-            if self.allowed_containers and name not in self.allowed_containers:
+            if not host.allows(name):
                 continue
             health = (c.get("health") or "").lower() if isinstance(c.get("health"), str) else ""
             status = (c.get("status") or "").lower() if isinstance(c.get("status"), str) else ""
@@ -377,10 +4435,23 @@ class AiMonitor:
     # -------------------------- Predictive Monitoring -------------------------
     def _check_predictive_triggers(self) -> Optional[str]:
         """Check if any metrics show concerning trends. Returns reason if LLM should be called."""
+        if self._forecaster is not None:
+            try:
+                self._last_forecast = self._forecaster.run()
+            except Exception as e:
+                _log("warn", "Forecast failed", error=str(e))
+                self._last_forecast = []
+                return None
+            if not self._last_forecast:
+                return None
+            # Top-ranked first; _should_save_incident keys off the leading reason
+            return "; ".join(f.reason for f in self._last_forecast[:3])
+
+        # Without NumPy: legacy instant-query thresholds (first match only)
         try:
             # Check memory growth
             mem_query = f'delta(docker_container_mem_usage[{self.mem_growth_window_hours}h])'
-            result = self.prom_query(mem_query, timeout_seconds=5)
+            result = self.prom_query(mem_query, timeout_seconds=5, name="predictive_mem_growth")
             for series in result.get("data", {}).get("result", []):
                 delta_bytes = float(series.get("value", [0, 0])[1])
                 if delta_bytes > float(self.mem_growth_bytes):
@@ -391,13 +4462,13 @@ class AiMonitor:
             
             # Check disk usage
             disk_query = 'node_filesystem_avail_bytes{mountpoint="/"} / node_filesystem_size_bytes{mountpoint="/"} * 100 < 20'
-            result = self.prom_query(disk_query, timeout_seconds=5)
+            result = self.prom_query(disk_query, timeout_seconds=5, name="predictive_disk_free")
             if result.get("data", {}).get("result", []):
                 return "Disk space below 20%"
             
             # Check restart frequency
             restart_query = 'changes(up[1h]) > 5'
-            result = self.prom_query(restart_query, timeout_seconds=5)
+            result = self.prom_query(restart_query, timeout_seconds=5, name="predictive_restarts")
             if result.get("data", {}).get("result", []):
                 return "High restart frequency detected"
                 
@@ -406,59 +4477,34 @@ class AiMonitor:
         
         return None
 
-    def _save_incident_report(self, triage: 'Triage', snapshot: Dict[str, Any]) -> None:
-        """Save incident report as markdown file."""
+    def _save_incident_report(self, triage: 'Triage', snapshot: Dict[str, Any], request: TriageRequest) -> None:
+        """Record an incident in the incident store; markdown is rendered on demand by the HTTP API."""
+        if self._incident_store is None:
+            return
         try:
-            os.makedirs(self.incident_reports_dir, exist_ok=True)
-            
-            timestamp = datetime.now(timezone.utc).strftime("%Y%m%d_%H%M%S")
-            filename = f"{self.incident_reports_dir}/incident_{timestamp}.md"
-            
-            # Build markdown report
-            report = f"""# Incident Report
-**Time:** {datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S UTC")}  
-**Severity:** {triage.severity}  
-**Confidence:** {triage.confidence:.0%}
-
-## Summary
-{triage.summary}
-
-## Suspected Causes
-"""
-            for cause in triage.suspected_causes:
-                report += f"- {cause}\n"
-            
-            report += "\n## Recommended Actions\n"
-            for action in triage.recommended_actions:
-                report += f"- **{action.type}**"
-                if action.target:
-                    report += f" → {action.target}"
-                if action.reason:
-                    report += f": {action.reason}"
-                report += "\n"
-            
-            # Add key metrics
-            report += "\n## System Snapshot\n"
-            down = snapshot.get("down_targets", {}).get("result", [])
-            if down:
-                report += f"- **Down targets:** {len(down)}\n"
-            
-            docker_health = snapshot.get("docker_health", {})
-            containers = docker_health.get("containers", [])
-            unhealthy = [c for c in containers if c.get("health") == "unhealthy"]
-            exited = [c for c in containers if c.get("status") in ["exited", "dead"]]
-            
-            if unhealthy:
-                report += f"- **Unhealthy containers:** {', '.join(c['name'] for c in unhealthy)}\n"
-            if exited:
-                report += f"- **Exited containers:** {', '.join(c['name'] for c in exited)}\n"
-            
-            with open(filename, 'w') as f:
-                f.write(report)
-            
-            _log("info", "Incident report saved", filename=filename)
+            containers = {c["name"] for c in snapshot.get("docker_health", {}).get("containers", []) if _is_failing(c)}
+            containers.update(
+                a.target.rpartition("/")[2]
+                for a in triage.recommended_actions
+                if a.type == "restart_container" and a.target
+            )
+            with _PhaseTimer("incident_write"):
+                self._incident_store.add(
+                    {
+                        "ts": time.time(),
+                        "fingerprint": request.fingerprint,
+                        "kind": request.kind,
+                        "severity": (triage.severity or "low").lower(),
+                        "confidence": triage.confidence,
+                        "summary": triage.summary,
+                        "triage": triage.model_dump(),
+                        "evidence": compact_snapshot(snapshot, self.llm_prompt_budget_bytes),
+                        "containers": sorted(containers),
+                    }
+                )
+            _log("info", "Incident recorded", fingerprint=request.fingerprint, severity=triage.severity)
         except Exception as e:
-            _log("error", "Failed to save incident report", error=str(e))
+            _log("error", "Failed to record incident", error=str(e))
 
     def _should_save_incident(self, triage: 'Triage', snapshot: Dict[str, Any]) -> bool:
         """Decide whether to persist an incident report based on severity, confidence, and evidence."""
@@ -480,7 +4526,12 @@ class AiMonitor:
             docker_health = snapshot.get("docker_health", {}).get("containers", [])
             unhealthy = [c for c in docker_health if (c.get("health") or "").lower() == "unhealthy"]
             exited = [c for c in docker_health if (c.get("status") or "").lower() in {"exited", "dead"}]
-            if down or unhealthy or exited:
+            silent = (snapshot.get("mqtt") or {}).get("silent")
+            stale_data = (snapshot.get("data_freshness") or {}).get("stale")
+            if (
+                down or unhealthy or exited or silent or stale_data
+                or snapshot.get("alerts") or snapshot.get("resource_anomalies")
+            ):
                 return True
 
             # Special-case predictive memory-only alerts: be conservative
@@ -500,12 +4551,140 @@ class AiMonitor:
             # On error, be conservative and don't save
             return False
 
+    # ------------------------------ Triage cache ------------------------------
+    @staticmethod
+    def _incident_fingerprint(snapshot: Dict[str, Any]) -> str:
+        """
+        Stable hash of the failure state: down targets, failing containers with exit codes,
+        failing HTTP checks, silent MQTT devices, stale data, Alertmanager alerts, resource
+        anomalies and the predictive trigger. Volatile details (latencies, error
+        text, log contents, forecast numbers) are deliberately left out.
+        """
+        down = sorted(
+            f"{(s.get('metric') or {}).get('job', '')}/{(s.get('metric') or {}).get('instance', '')}"
+            for s in snapshot.get("down_targets", {}).get("result", [])
+        )
+        containers = sorted(
+            f"{c.get('host')}/{c.get('name')}:{c.get('status')}:{c.get('health')}:{c.get('exit_code')}"
+            for c in snapshot.get("docker_health", {}).get("containers", [])
+            if _is_failing(c)
+        )
+        http = sorted(
+            f"{target}:{r.get('status') or 'error'}"
+            for target, r in (snapshot.get("http_checks") or {}).items()
+            if not r.get("ok", False)
+        )
+        findings = snapshot.get("predictive_findings")
+        if findings:
+            predictive = sorted(f"{f['kind']}:{f['entity']}" for f in findings)
+        else:
+            predictive = re.sub(r"[\d.]+", "#", snapshot.get("predictive_trigger") or "")
+        state = {"down": down, "containers": containers, "http": http, "predictive": predictive}
+        mqtt_state = snapshot.get("mqtt") or {}
+        if mqtt_state.get("silent"):
+            # With the broker unreachable every device goes quiet; that is one incident
+            state["mqtt"] = (
+                sorted(f"{d['stream']}/{d['device']}" for d in mqtt_state["silent"])
+                if mqtt_state.get("connected") else "broker_disconnected"
+            )
+        if snapshot.get("alerts"):
+            state["alerts"] = sorted(a["fingerprint"] for a in snapshot["alerts"])
+        freshness = snapshot.get("data_freshness") or {}
+        if freshness.get("stale"):
+            state["freshness"] = sorted(f"{d['store']}/{d['database']}/{d['series']}" for d in freshness["stale"])
+        if snapshot.get("resource_anomalies"):
+            state["anomalies"] = sorted(
+                f"{a['host']}/{a['container']}:{a['resource']}" for a in snapshot["resource_anomalies"]
+            )
+        return hashlib.sha256(json.dumps(state, sort_keys=True).encode()).hexdigest()[:16]
+
+    def _triage(self, snapshot: Dict[str, Any]) -> Tuple[Optional[Triage], bool]:
+        """
+        Triage via the cache. Returns (triage, cached); the snapshot is tagged with its
+        incident_fingerprint. Only successful triages are cached.
+        """
+        fingerprint = self._incident_fingerprint(snapshot)
+        snapshot["incident_fingerprint"] = fingerprint
+        now = time.time()
+        with self._triage_cache_lock:
+            cached = self._triage_cache.get(fingerprint)
+        if cached and now - cached[0] < self.triage_cache_ttl_seconds:
+            TRIAGE_CACHE_REQUESTS_TOTAL.labels(result="hit").inc()
+            LLM_CALLS_AVOIDED_TOTAL.inc()
+            _log("debug", "Triage cache hit", fingerprint=fingerprint, age_seconds=int(now - cached[0]))
+            return cached[1], True
+
+        TRIAGE_CACHE_REQUESTS_TOTAL.labels(result="miss").inc()
+        triage = self.ask_llm_for_triage(snapshot)
+        if triage is not None:
+            with self._triage_cache_lock:
+                self._triage_cache = {
+                    fp: entry for fp, entry in self._triage_cache.items()
+                    if now - entry[0] < self.triage_cache_ttl_seconds
+                }
+                self._triage_cache[fingerprint] = (now, triage)
+        return triage, False
+
+    # ------------------------------ Triage worker -----------------------------
+    _TRIAGE_LOG_MESSAGES = {
+        "http": "HTTP failure triage",
+        "mqtt": "MQTT silence triage",
+        "alert": "Alert triage",
+        "anomaly": "Resource anomaly triage",
+        "freshness": "Stale data triage",
+        "predictive": "Predictive triage",
+        "docker": "AI triage",
+        "prometheus": "Down target triage",
+    }
+
+    def _request_triage(self, kind: str, snapshot: Dict[str, Any]) -> None:
+        """Hand a snapshot to the triage worker, or triage inline when the worker isn't running."""
+        request = TriageRequest(kind, self._incident_fingerprint(snapshot), snapshot, time.monotonic())
+        if self._triage_worker.started:
+            self._triage_worker.submit(request)
+        else:
+            self._process_triage(request)
+
+    def _process_triage(self, request: TriageRequest) -> None:
+        """Triage one request, then write the incident report and execute restart actions."""
+        snapshot = request.snapshot
+        triage, cached = self._triage(snapshot)
+        if not triage:
+            _log("warn", "No triage returned", kind=request.kind)
+            return
+
+        _log(
+            "debug" if cached else "info",
+            self._TRIAGE_LOG_MESSAGES.get(request.kind, "AI triage"),
+            severity=triage.severity,
+            confidence=triage.confidence,
+            summary=triage.summary,
+            actions=[a.model_dump() for a in triage.recommended_actions],
+            cached=cached,
+        )
+
+        # Save incident report (only if justified); a cached triage was already reported
+        if self.incident_reports_enabled and not cached:
+            if self._should_save_incident(triage, snapshot):
+                self._save_incident_report(triage, snapshot, request)
+            else:
+                _log("info", "Triage benign; skipping incident report", kind=request.kind,
+                     severity=triage.severity, confidence=triage.confidence)
+
+        # Predictive and anomaly triage are advisory only
+        if not self.execute or request.kind in {"predictive", "anomaly"}:
+            return
+
+        targets = [a.target for a in triage.recommended_actions if a.type == "restart_container" and a.target]
+        if targets:
+            self._restart_containers(targets, snapshot)
+
     # --------------------------------- LLM ------------------------------------
     def ask_llm_for_triage(self, snapshot: Dict[str, Any]) -> Optional[Triage]:
         if self.use_claude:
-            return self._ask_claude_for_triage(snapshot)
+            backend, ask = "claude", self._ask_claude_for_triage
         elif self.use_gemini:
-            return self._ask_gemini_for_triage(snapshot)
+            backend, ask = "gemini", self._ask_gemini_for_triage
         else:
             _log(
                 "warning",
@@ -518,21 +4697,25 @@ class AiMonitor:
             )
             return None
 
+        with LLM_CALL_DURATION_SECONDS.labels(backend=backend).time(), _PhaseTimer("llm", backend) as timer:
+            triage = ask(snapshot)
+            if triage is None:
+                timer.outcome = "error"
+        return triage
+
+    def _build_triage_prompt(self, snapshot: Dict[str, Any], backend: str) -> str:
+        compact = compact_snapshot(snapshot, self.llm_prompt_budget_bytes)
+        prompt = _TRIAGE_PROMPT + json.dumps(compact, separators=(",", ":"), ensure_ascii=False)
+        prompt_bytes = len(prompt.encode("utf-8"))
+        tokens = math.ceil(prompt_bytes / 4)
+        LLM_PROMPT_BYTES.labels(backend=backend).set(prompt_bytes)
+        LLM_PROMPT_TOKENS.labels(backend=backend).set(tokens)
+        LLM_PROMPT_TOKENS_TOTAL.labels(backend=backend).inc(tokens)
+        _log("debug", "Triage prompt built", backend=backend, bytes=prompt_bytes, tokens_estimate=tokens)
+        return prompt
+
     def _ask_claude_for_triage(self, snapshot: Dict[str, Any]) -> Optional[Triage]:
-        prompt = (
-            "You are an SRE assistant for a Raspberry Pi docker-compose stack. "
-            "Given the JSON snapshot, produce a concise triage response. "
-            "Return ONLY valid JSON that matches this schema:\n"
-            '{"summary": string, "severity": "low"|"medium"|"high", '
-            '"suspected_causes": string[], '
-            '"recommended_actions": [{"type": "restart_container"|"alert"|"none", "target": string|null, "reason": string|null}], '
-            '"confidence": number }\n\n'
-            "Constraints:\n"
-            "- Be conservative: prefer alert/none over restarts.\n"
-            "- If you recommend a restart_container, set target to the exact container name.\n"
-            "- If everything looks fine, severity=low and action=none.\n\n"
-            f"SNAPSHOT:\n{json.dumps(snapshot, ensure_ascii=False)}"
-        )
+        prompt = self._build_triage_prompt(snapshot, "claude")
 
         try:
             response = self._anthropic_client.messages.create(
@@ -544,6 +4727,7 @@ class AiMonitor:
                 }]
             )
             raw = response.content[0].text.strip()
+            LLM_RESPONSE_BYTES.labels(backend="claude").set(len(raw.encode("utf-8")))
             if not raw:
                 return None
             
@@ -578,30 +4762,17 @@ class AiMonitor:
             
             TRIAGE_CALLS_TOTAL.labels(backend="claude", status="success").inc()
             return Triage.model_validate(data)
-        except requests.exceptions.Timeout:
-            TRIAGE_CALLS_TOTAL.labels(backend="claude", status="timeout").inc()
-            _log("error", "Claude triage failed", error="timeout")
-            return None
         except Exception as e:
+            if _is_timeout(e):
+                TRIAGE_CALLS_TOTAL.labels(backend="claude", status="timeout").inc()
+                _log("error", "Claude triage failed", error="timeout", timeout_seconds=self.llm_timeout_seconds)
+                return None
             TRIAGE_CALLS_TOTAL.labels(backend="claude", status="error").inc()
             _log("error", "Claude triage failed", error=str(e))
             return None
 
     def _ask_gemini_for_triage(self, snapshot: Dict[str, Any]) -> Optional[Triage]:
-        prompt = (
-            "You are an SRE assistant for a Raspberry Pi docker-compose stack. "
-            "Given the JSON snapshot, produce a concise triage response. "
-            "Return ONLY valid JSON that matches this schema:\n"
-            '{"summary": string, "severity": "low"|"medium"|"high", '
-            '"suspected_causes": string[], '
-            '"recommended_actions": [{"type": "restart_container"|"alert"|"none", "target": string|null, "reason": string|null}], '
-            '"confidence": number }\n\n'
-            "Constraints:\n"
-            "- Be conservative: prefer alert/none over restarts.\n"
-            "- If you recommend a restart_container, set target to the exact container name.\n"
-            "- If everything looks fine, severity=low and action=none.\n\n"
-            f"SNAPSHOT:\n{json.dumps(snapshot, ensure_ascii=False)}"
-        )
+        prompt = self._build_triage_prompt(snapshot, "gemini")
 
         try:
             response = self._gemini_model.generate_content(
@@ -609,9 +4780,11 @@ class AiMonitor:
                 generation_config=genai.GenerationConfig(
                     temperature=0.1,
                     max_output_tokens=1024,
-                )
+                ),
+                request_options={"timeout": self.llm_timeout_seconds},
             )
             raw = response.text.strip()
+            LLM_RESPONSE_BYTES.labels(backend="gemini").set(len(raw.encode("utf-8")))
             if not raw:
                 return None
             
@@ -638,11 +4811,11 @@ class AiMonitor:
             
             TRIAGE_CALLS_TOTAL.labels(backend="gemini", status="success").inc()
             return Triage.model_validate(data)
-        except requests.exceptions.Timeout:
-            TRIAGE_CALLS_TOTAL.labels(backend="gemini", status="timeout").inc()
-            _log("error", "Gemini triage failed", error="timeout")
-            return None
         except Exception as e:
+            if _is_timeout(e):
+                TRIAGE_CALLS_TOTAL.labels(backend="gemini", status="timeout").inc()
+                _log("error", "Gemini triage failed", error="timeout", timeout_seconds=self.llm_timeout_seconds)
+                return None
             TRIAGE_CALLS_TOTAL.labels(backend="gemini", status="error").inc()
             _log("error", "Gemini triage failed", error=str(e))
             return None
@@ -656,7 +4829,8 @@ class AiMonitor:
         2. Updates health metrics (healthy/unhealthy container counts)
         3. Checks for containers needing restart and performs self-healing if enabled
         4. If no remediation was taken and issues exist, requests LLM triage analysis
-        5. Executes recommended actions from LLM (e.g., container restarts) if execute mode is enabled
+        5. Triage, incident reports and recommended actions (e.g., container restarts) run on the
+           background triage worker, so a slow LLM never delays the next cycle
         The method implements a "fast-path" optimization: if all targets are up and Docker 
         containers are healthy, it skips LLM analysis. It also skips LLM triage if self-healing 
         actions were just performed to avoid analyzing stale pre-restart state.
@@ -668,9 +4842,22 @@ class AiMonitor:
         Returns:
             None
         """
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            self._count_task_calls("cycle", self._run_cycle)
+            outcome = "ok"
+        finally:
+            RUN_ONCE_DURATION_SECONDS.labels(outcome=outcome).observe(time.perf_counter() - started)
+
+    def _run_cycle(self) -> None:
         snapshot = self.gather_snapshot()
         LAST_RUN_TIMESTAMP.set(time.time())
+        self._evaluate_http(snapshot)
+        self._evaluate_mqtt(snapshot)
+        self._evaluate_health(snapshot)
 
+    def _evaluate_http(self, snapshot: Dict[str, Any]) -> None:
         # Check HTTP synthetics for failures and trigger triage if state changed or persistent failure
         http_checks = snapshot.get("http_checks", {})
         http_failures = {t: r for t, r in http_checks.items() if not r.get("ok", False)}
@@ -680,69 +4867,80 @@ class AiMonitor:
                 # State change detected; gather with logs and triage
                 _log("warn", "HTTP check failure detected", failures={t: r.get("status") or r.get("error") for t, r in http_failures.items()})
                 if self.llm_enabled:
-                    snapshot_with_logs = self.gather_snapshot_with_logs()
+                    snapshot_with_logs = self.gather_snapshot_with_logs(snapshot)
                     snapshot_with_logs["http_check_failures"] = http_failures
-                    triage = self.ask_llm_for_triage(snapshot_with_logs)
-                    if triage:
-                        _log("info", "HTTP failure triage", severity=triage.severity, summary=triage.summary, actions=[a.model_dump() for a in triage.recommended_actions])
-                        if self.incident_reports_enabled and self._should_save_incident(triage, snapshot_with_logs):
-                            self._save_incident_report(triage, snapshot_with_logs)
-                        if self.execute:
-                            for action in triage.recommended_actions:
-                                if action.type == "restart_container" and action.target:
-                                    self._restart_container(action.target)
+                    self._request_triage("http", snapshot_with_logs)
         self._last_http_check_results = http_checks.copy()
+        # Configured targets stay current even when a check timed out before touching its series
+        HTTP_TARGET_LABELS.mark(http_checks)
+        HTTP_TARGET_LABELS.sweep()
 
-        # fast-path: if nothing down and docker health is ok, we can avoid LLM calls
-        down_targets = snapshot.get("down_targets", {}).get("result", [])
-        docker_health = snapshot.get("docker_health", {}).get("containers", [])
-        
-        # Track ALL containers for read-only monitoring
-        all_unhealthy = [c for c in docker_health if c.get("health") == "unhealthy"]
-        all_exited = [c for c in docker_health if (c.get("status") or "").lower() in {"exited", "dead"}]
-        TOTAL_UNHEALTHY_CONTAINERS.set(len(all_unhealthy) + len(all_exited))
-        TOTAL_HEALTHY_CONTAINERS.set(len(docker_health) - len(all_unhealthy) - len(all_exited))
+    def _evaluate_mqtt(self, snapshot: Dict[str, Any]) -> None:
+        # A device going silent is a triage trigger, like a failing HTTP check
+        mqtt_state = snapshot.get("mqtt")
+        if not mqtt_state:
+            return
+        silent = {(d["stream"], d["device"]) for d in mqtt_state.get("silent", [])}
+        recovered = self._last_mqtt_silent - silent
+        if recovered:
+            _log("info", "MQTT devices publishing again", devices=sorted(f"{s}/{d}" for s, d in recovered))
+        if silent and silent != self._last_mqtt_silent:
+            _log(
+                "warn",
+                "MQTT devices silent",
+                devices={f"{d['stream']}/{d['device']}": d["silent_seconds"] for d in mqtt_state["silent"]},
+                connected=mqtt_state.get("connected"),
+            )
+            if self.llm_enabled:
+                self._request_triage("mqtt", self.gather_snapshot_with_logs(snapshot))
+        self._last_mqtt_silent = silent
 
-        # Update per-container unhealthy gauge (1 if unhealthy/exited else 0)
-        for c in docker_health:
-            name = c.get("name")
-            if not name:
-                continue
-            health = (c.get("health") or "").lower() if isinstance(c.get("health"), str) else ""
-            status = (c.get("status") or "").lower() if isinstance(c.get("status"), str) else ""
-            value = 1 if (health == "unhealthy" or status in {"exited", "dead"}) else 0
-            UNHEALTHY_BY_CONTAINER.labels(container=name).set(value)
-        
-        # Track allowlisted containers (for self-heal actions)
-        relevant = (
-            [c for c in docker_health if c.get("name") in self.allowed_containers]
-            if self.allowed_containers
-            else docker_health
-        )
-        unhealthy = [c for c in relevant if c.get("health") == "unhealthy"]
-        exited = [c for c in relevant if (c.get("status") or "").lower() in {"exited", "dead"}]
-        
-        # Update allowlist health gauges
-        UNHEALTHY_CONTAINERS.set(len(unhealthy) + len(exited))
-        HEALTHY_CONTAINERS.set(len(relevant) - len(unhealthy) - len(exited))
+    def _evaluate_freshness(self, snapshot: Dict[str, Any]) -> None:
+        # Data no longer landing in a store is a triage trigger (typically a stalled telegraf)
+        freshness = snapshot.get("data_freshness") or {}
+        stale = {(d["store"], d["database"], d["series"]) for d in freshness.get("stale", [])}
+        recovered = self._last_stale_series - stale
+        if recovered:
+            _log("info", "Data fresh again", series=sorted("/".join(k) for k in recovered))
+        if stale and stale != self._last_stale_series:
+            _log(
+                "warn",
+                "Stale data",
+                series={f"{d['store']}/{d['database']}/{d['series']}": d["lag_seconds"] for d in freshness["stale"]},
+                errors=freshness.get("errors") or None,
+            )
+            if self.llm_enabled and stale - self._last_stale_series:
+                self._request_triage("freshness", self.gather_snapshot_with_logs(snapshot))
+        self._last_stale_series = stale
 
-        restarts_this_run = 0
-        if self.execute and self.self_heal_docker_health:
-            for name in self._containers_needing_restart(docker_health):
-                if self.max_restarts_per_run >= 0 and restarts_this_run >= self.max_restarts_per_run:
-                    _log(
-                        "warn",
-                        "Restart cap reached for this run",
-                        max_restarts_per_run=self.max_restarts_per_run,
-                    )
-                    break
-                if self._restart_container(name):
-                    restarts_this_run += 1
+    def _evaluate_anomalies(self, snapshot: Dict[str, Any]) -> None:
+        # New resource anomalies get advisory triage (no restarts), like predictive findings
+        anomalies = snapshot.get("resource_anomalies") or []
+        current = {(a["host"], a["container"], a["resource"]) for a in anomalies}
+        if current and current != self._last_anomalies:
+            _log(
+                "warn",
+                "Container resource anomalies",
+                anomalies={f"{a['host']}/{a['container']}:{a['resource']}": a["zscore"] for a in anomalies},
+            )
+            if self.llm_enabled and current - self._last_anomalies:
+                self._request_triage("anomaly", self.gather_snapshot_with_logs(snapshot))
+        self._last_anomalies = current
+
+    def _evaluate_health(self, snapshot: Dict[str, Any], predictive: bool = True) -> None:
+        """
+        Docker gauges, self-heal and triage for down targets / failing containers. With
+        predictive=True a healthy snapshot also runs the forecast when it is due (one-shot
+        mode; the scheduler runs forecasting as its own task).
+        """
+        # fast-path: if nothing down and docker health is ok, we can avoid LLM calls
+        down_targets = snapshot.get("down_targets", {}).get("result", [])
+        unhealthy, exited, restarts_this_run = self._evaluate_containers(snapshot)
 
         # If we took remediation actions, don't block the loop on LLM calls.
         # Also avoids triaging on a snapshot taken before restarts.
         if restarts_this_run > 0:
-            _log("info", "Self-heal actions executed", restarts=restarts_this_run)
+            _log("info", "Self-heal restarts scheduled", restarts=restarts_this_run)
             return
 
         if not down_targets and not unhealthy:
@@ -750,23 +4948,9 @@ class AiMonitor:
                 _log("info", "Healthy snapshot", checks="up + docker health")
                 
                 # Check predictive triggers if enabled and interval elapsed
-                if self.predictive_enabled:
-                    now = time.time()
-                    if now - self._last_predictive_check >= self.predictive_interval:
-                        self._last_predictive_check = now
-                        trigger_reason = self._check_predictive_triggers()
-                        if trigger_reason:
-                            _log("info", "Predictive trigger detected", reason=trigger_reason)
-                            # Use snapshot with logs for predictive analysis
-                            pred_snapshot = self.gather_snapshot_with_logs()
-                            pred_snapshot["predictive_trigger"] = trigger_reason
-                            triage = self.ask_llm_for_triage(pred_snapshot)
-                            if triage and self.incident_reports_enabled:
-                                if self._should_save_incident(triage, pred_snapshot):
-                                    self._save_incident_report(triage, pred_snapshot)
-                                else:
-                                    _log("info", "Predictive triage benign; skipping incident report",
-                                         severity=triage.severity, confidence=triage.confidence)
+                if predictive and self.predictive_enabled:
+                    if time.time() - self._last_forecast_run >= self.forecast_interval:
+                        self._run_predictive(snapshot)
                 
                 return
             _log("warn", "Containers exited", containers=[c.get("name") for c in exited if c.get("name")])
@@ -776,41 +4960,452 @@ class AiMonitor:
             return
 
         # Gather snapshot with logs for better triage
-        snapshot_with_logs = self.gather_snapshot_with_logs()
-        triage = self.ask_llm_for_triage(snapshot_with_logs)
-        if not triage:
-            _log("warn", "No triage returned")
+        snapshot_with_logs = self.gather_snapshot_with_logs(snapshot)
+        self._request_triage("docker", snapshot_with_logs)
+
+    def _evaluate_containers(
+        self, snapshot: Dict[str, Any]
+    ) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]], int]:
+        """
+        Per-host container gauges, self-heal claims and the container label sweep. Runs once
+        per Docker listing; returns the allowlisted unhealthy and exited containers and the
+        number of restarts scheduled.
+        """
+        docker_health = snapshot.get("docker_health", {}).get("containers", [])
+        host_health = snapshot.get("docker_health", {}).get("hosts") or {}
+        by_host: Dict[str, List[Dict[str, Any]]] = {}
+        for c in docker_health:
+            by_host.setdefault(c.get("host") or "", []).append(c)
+
+        unhealthy: List[Dict[str, Any]] = []
+        exited: List[Dict[str, Any]] = []
+        restarts_this_run = 0
+        for host in self.docker_hosts.values():
+            containers = by_host.get(host.name, [])
+            if (host_health.get(host.name) or {}).get("error"):
+                continue  # keep the last known gauges; ai_monitor_docker_host_up reports the outage
+
+            # Track ALL containers for read-only monitoring
+            all_unhealthy = [c for c in containers if c.get("health") == "unhealthy"]
+            all_exited = [c for c in containers if (c.get("status") or "").lower() in {"exited", "dead"}]
+            TOTAL_UNHEALTHY_CONTAINERS.labels(host=host.name).set(len(all_unhealthy) + len(all_exited))
+            TOTAL_HEALTHY_CONTAINERS.labels(host=host.name).set(len(containers) - len(all_unhealthy) - len(all_exited))
+
+            # Update per-container unhealthy gauge (1 if unhealthy/exited else 0)
+            overflow: Optional[int] = None  # containers past the cardinality cap share one series
+            for c in containers:
+                name = c.get("name")
+                if not name:
+                    continue
+                health = (c.get("health") or "").lower() if isinstance(c.get("health"), str) else ""
+                status = (c.get("status") or "").lower() if isinstance(c.get("status"), str) else ""
+                value = 1 if (health == "unhealthy" or status in {"exited", "dead"}) else 0
+                label = CONTAINER_LABELS.label(name)
+                if label == LabelLifecycle.OVERFLOW:
+                    overflow = max(overflow or 0, value)
+                else:
+                    UNHEALTHY_BY_CONTAINER.labels(host=host.name, container=label).set(value)
+            if overflow is not None:
+                UNHEALTHY_BY_CONTAINER.labels(host=host.name, container=LabelLifecycle.OVERFLOW).set(overflow)
+
+            # Track allowlisted containers (for self-heal actions)
+            relevant = [c for c in containers if host.allows(c.get("name") or "")]
+            host_unhealthy = [c for c in relevant if c.get("health") == "unhealthy"]
+            host_exited = [c for c in relevant if (c.get("status") or "").lower() in {"exited", "dead"}]
+            unhealthy.extend(host_unhealthy)
+            exited.extend(host_exited)
+
+            # Update allowlist health gauges
+            UNHEALTHY_CONTAINERS.labels(host=host.name).set(len(host_unhealthy) + len(host_exited))
+            HEALTHY_CONTAINERS.labels(host=host.name).set(len(relevant) - len(host_unhealthy) - len(host_exited))
+
+            if self.execute and self.self_heal_docker_health:
+                claimed: List[str] = []
+                for name in self._containers_needing_restart(host, containers):
+                    if host.max_restarts_per_run >= 0 and len(claimed) >= host.max_restarts_per_run:
+                        _log(
+                            "warn",
+                            "Restart cap reached for this run",
+                            host=host.name,
+                            max_restarts_per_run=host.max_restarts_per_run,
+                        )
+                        break
+                    if self._claim_restart(host, name):
+                        claimed.append(name)
+                if claimed:
+                    # Already claimed above; the plan restarts them in dependency order in the background
+                    host.restart_plans.submit(self._run_restart_plan, host, claimed)
+                restarts_this_run += len(claimed)
+        self._restart_governor.publish()
+        # The only container sweep, once per listing; a failed listing says nothing about
+        # which containers are gone
+        if not snapshot.get("docker_health", {}).get("error"):
+            CONTAINER_LABELS.sweep()
+        return unhealthy, exited, restarts_this_run
+
+    def _evaluate_down_targets(self, snapshot: Dict[str, Any]) -> None:
+        """Triage for down scrape targets; container state belongs to the docker task."""
+        down_targets = snapshot.get("down_targets", {}).get("result", [])
+        if not down_targets or not self.llm_enabled:
             return
+        self._request_triage("prometheus", self.gather_snapshot_with_logs(snapshot))
 
-        _log(
-            "info",
-            "AI triage",
-            severity=triage.severity,
-            confidence=triage.confidence,
-            summary=triage.summary,
-            actions=[a.model_dump() for a in triage.recommended_actions],
-        )
-        
-        # Save incident report (only if justified)
-        if self.incident_reports_enabled and self._should_save_incident(triage, snapshot_with_logs):
-            self._save_incident_report(triage, snapshot_with_logs)
-        elif self.incident_reports_enabled:
-            _log("info", "Triage benign; skipping incident report",
-                 severity=triage.severity, confidence=triage.confidence)
-
-        if not self.execute:
+    def _run_predictive(self, snapshot: Dict[str, Any]) -> None:
+        """Run the forecast and ask for predictive triage when concerning trends are new or due."""
+        now = time.time()
+        self._last_forecast_run = now
+        trigger_reason = self._check_predictive_triggers()
+        keys = sorted((f.kind, f.entity) for f in self._last_forecast)
+        changed = keys != self._last_predictive_keys
+        if not trigger_reason:
+            self._last_predictive_keys = []
+        elif changed or now - self._last_predictive_check >= self.predictive_interval:
+            self._last_predictive_check = now
+            self._last_predictive_keys = keys
+            _log("info", "Predictive trigger detected", reason=trigger_reason)
+            # Use snapshot with logs for predictive analysis
+            pred_snapshot = self.gather_snapshot_with_logs(snapshot)
+            pred_snapshot["predictive_trigger"] = trigger_reason
+            if self._last_forecast:
+                pred_snapshot["predictive_findings"] = [asdict(f) for f in self._last_forecast]
+            self._request_triage("predictive", pred_snapshot)
+
+    # ----------------------------- Persistent state ---------------------------
+    def _export_state(self, final: bool = False) -> Dict[str, Any]:
+        """
+        Everything that would make the first cycle after a restart more expensive than usual.
+        final=True (shutdown) also takes baselines that are newer than their persist cadence.
+        """
+        now = time.time()
+        with self._triage_cache_lock:
+            triage_cache = {
+                fp: {"at": at, "triage": triage.model_dump()}
+                for fp, (at, triage) in self._triage_cache.items()
+                if now - at < self.triage_cache_ttl_seconds
+            }
+        return {
+            "restart_governor": self._restart_governor.to_state(),
+            "triage_cache": triage_cache,
+            "predictive": {
+                "last_check": self._last_predictive_check,
+                "last_forecast_run": self._last_forecast_run,
+                "keys": self._last_predictive_keys,
+            },
+            # Only failures matter as a baseline; passing results would churn the file every cycle
+            "http_checks": {url: r for url, r in self._last_http_check_results.items() if not r.get("ok", False)},
+            "mqtt": self._mqtt.to_state() if self._mqtt is not None else {},
+            "baselines": self._stats.to_state(fresh=final) if self.stats_enabled else {},
+        }
+
+    def _restore_state(self) -> None:
+        state = self._state_file.load() if self._state_file is not None else None
+        if not state:
+            return
+        try:
+            now = time.time()
+            restored_restarts = self._restart_governor.load_state(state.get("restart_governor") or {})
+            for fp, entry in (state.get("triage_cache") or {}).items():
+                if now - float(entry["at"]) < self.triage_cache_ttl_seconds:
+                    self._triage_cache[fp] = (float(entry["at"]), Triage.model_validate(entry["triage"]))
+            predictive = state.get("predictive") or {}
+            self._last_predictive_check = float(predictive.get("last_check") or 0.0)
+            self._last_forecast_run = float(predictive.get("last_forecast_run") or 0.0)
+            self._last_predictive_keys = [tuple(k) for k in predictive.get("keys") or []]
+            self._last_http_check_results = {
+                url: result for url, result in (state.get("http_checks") or {}).items()
+                if url in {check["url"] for check in self.http_checks}
+            }
+            mqtt_devices = self._mqtt.load_state(state.get("mqtt") or {}) if self._mqtt is not None else 0
+            baselines = self._stats.load_state(state.get("baselines") or {}) if self.stats_enabled else 0
+            _log(
+                "info",
+                "Monitor state restored",
+                age_seconds=int(now - float(state.get("saved_at") or now)),
+                restart_records=restored_restarts,
+                triage_cache=len(self._triage_cache),
+                mqtt_devices=mqtt_devices,
+                baselines=baselines,
+            )
+        except Exception as e:
+            _log("warn", "State file invalid; starting cold", error=str(e))
+
+    def _checkpoint_state(self, final: bool = False) -> None:
+        if self._state_file is None:
             return
+        try:
+            if self._state_file.save(self._export_state(final)):
+                _log("debug", "Monitor state checkpointed", path=self._state_file.path)
+        except Exception as e:
+            _log("error", "Monitor state checkpoint failed", error=str(e))
 
-        for action in triage.recommended_actions:
-            if action.type != "restart_container" or not action.target:
-                continue
-            self._restart_container(action.target)
+    def _on_sigterm(self, signum: int, frame: Any) -> None:
+        """docker stop: persist buffered incidents and state before exiting."""
+        _log("info", "Shutting down", signal=signum)
+        if self._incident_store is not None:
+            try:
+                self._incident_store.flush()
+            except Exception as e:
+                _log("error", "Incident store flush failed", error=str(e))
+        self._checkpoint_state(final=True)
+        for probe in self._freshness_probes:
+            probe.close()
+        raise SystemExit(0)
+
+    # ------------------------------- Scheduler --------------------------------
+    def _refresh(self, sources: List[CollectionSource]) -> Dict[str, Any]:
+        """Collect one probe family, merge it into the latest state and return a copy."""
+        results = self._collect_snapshot(sources)
+        with self._latest_lock:
+            self._latest.update(results)
+            snapshot = dict(self._latest)
+        LAST_RUN_TIMESTAMP.set(time.time())
+        return snapshot
+
+    def _task_http(self) -> None:
+        self._evaluate_http(self._refresh(self._http_sources()))
+
+    def _task_docker(self) -> None:
+        self._evaluate_health(self._refresh(self._docker_sources()), predictive=False)
+
+    def _task_prometheus(self) -> bool:
+        """Returns False when a quiet tick was skipped (see alert_quiet_poll_factor)."""
+        if self.alert_quiet_poll_factor > 1 and not self._alert_inbox.firing(time.monotonic()):
+            # Alertmanager pushes anything that starts firing; half a tick of slack absorbs jitter
+            quiet_interval = self.prom_interval_seconds * (self.alert_quiet_poll_factor - 0.5)
+            if self._last_prom_poll is not None and time.monotonic() - self._last_prom_poll < quiet_interval:
+                return False
+        self._last_prom_poll = time.monotonic()
+        self._evaluate_down_targets(self._refresh(self._prom_sources()))
+        return True
+
+    def _task_mqtt(self) -> None:
+        result = self._mqtt.publish()
+        with self._latest_lock:
+            self._latest["mqtt"] = result
+            snapshot = dict(self._latest)
+        self._evaluate_mqtt(snapshot)
+
+    def _task_freshness(self) -> None:
+        result: Dict[str, Any] = {"lags": {}, "stale": [], "errors": {}}
+        for probe in self._freshness_probes:
+            probed = probe.run()
+            result["lags"].update({f"{probe.store}/{k}": v for k, v in probed["lags"].items()})
+            result["stale"].extend(probed["stale"])
+            result["errors"].update({f"{probe.store}/{k}": v for k, v in probed["errors"].items()})
+        for database, error in result["errors"].items():
+            _log("warn", "Freshness query failed", database=database, error=error)
+        with self._latest_lock:
+            self._latest["data_freshness"] = result
+            snapshot = dict(self._latest)
+        self._evaluate_freshness(snapshot)
+
+    def _task_stats(self) -> None:
+        with self._latest_lock:
+            host_health = dict((self._latest.get("docker_health") or {}).get("hosts") or {})
+        hosts = [h for h in self.docker_hosts.values() if not (host_health.get(h.name) or {}).get("error")]
+        anomalies = self._stats.run(hosts)
+        with self._latest_lock:
+            self._latest["resource_anomalies"] = anomalies
+            snapshot = dict(self._latest)
+        self._evaluate_anomalies(snapshot)
+
+    def _task_forecast(self) -> None:
+        with self._latest_lock:
+            snapshot = dict(self._latest)
+        down = snapshot.get("down_targets", {}).get("result", [])
+        failing = [c for c in snapshot.get("docker_health", {}).get("containers", []) if _is_failing(c)]
+        if down or failing:
+            return  # predictive triage is only for an otherwise healthy system
+        self._run_predictive(snapshot)
+
+    def _build_scheduler(self) -> Scheduler:
+        def task(name: str, interval: float, run: Callable[[], Optional[bool]]) -> ScheduledTask:
+            return ScheduledTask(
+                name,
+                interval,
+                lambda: self._count_task_calls(name, run),
+                jitter_seconds=interval * self.schedule_jitter,
+            )
+
+        tasks = [
+            task("docker", self.docker_interval_seconds, self._task_docker),
+            task("prometheus", self.prom_interval_seconds, self._task_prometheus),
+        ]
+        if self.http_checks:
+            tasks.append(task("http", self.http_interval_seconds, self._task_http))
+        if self._mqtt is not None:
+            tasks.append(task("mqtt", self.mqtt_interval_seconds, self._task_mqtt))
+        if self.stats_enabled:
+            tasks.append(task("stats", self.stats_interval_seconds, self._task_stats))
+        if self._freshness_probes:
+            tasks.append(task("freshness", self.freshness_interval_seconds, self._task_freshness))
+        if self.predictive_enabled:
+            tasks.append(task("forecast", float(self.forecast_interval), self._task_forecast))
+        if self._state_file is not None:
+            tasks.append(ScheduledTask("checkpoint", self.state_checkpoint_seconds, self._checkpoint_state))
+        return Scheduler(tasks)
+
+    # ------------------------------ HTTP API ----------------------------------
+    def _build_http_server(self, port: int) -> MonitorHTTPServer:
+        server = MonitorHTTPServer(port)
+        if self._incident_store is not None:
+            server.route("GET", "/incidents", self._http_incidents)
+        if self.alert_webhook_token:
+            server.route("POST", "/alerts", self._http_alerts)
+        server.route("GET", "/log-level", self._http_log_level)
+        if self.admin_token:
+            server.route("POST", "/log-level", self._http_log_level)
+        return server
+
+    def _http_log_level(self, environ: Dict[str, Any], rest: str) -> Tuple[str, str, bytes]:
+        """
+        GET /log-level; POST /log-level?level=debug (bearer AI_MONITOR_ADMIN_TOKEN) switches
+        it until the next restart.
+        """
+        if environ.get("REQUEST_METHOD", "GET").upper() == "POST":
+            if not _bearer_ok(environ, self.admin_token):
+                return "401 Unauthorized", "application/json", _json_body({"error": "invalid token"})
+            level = (parse_qs(environ.get("QUERY_STRING", "")).get("level") or [""])[-1]
+            previous = _LOGGER.level
+            _LOGGER.set_level(level)
+            _log("warn", "Log level changed", log_level=_LOGGER.level, previous=previous)
+        return "200 OK", "application/json", _json_body({"level": _LOGGER.level})
+
+    _ALERT_MAX_BODY_BYTES = 1_000_000
+
+    def _http_alerts(self, environ: Dict[str, Any], rest: str) -> Tuple[str, str, bytes]:
+        """
+        POST /alerts - Alertmanager webhook receiver (webhook_configs, payload version 4).
+        Newly firing alerts get a targeted snapshot and triage on a background worker; the
+        response only reports how the alerts were counted.
+        """
+        if rest:
+            return "404 Not Found", "application/json", _json_body({"error": "not found"})
+        if not _bearer_ok(environ, self.alert_webhook_token):
+            return "401 Unauthorized", "application/json", _json_body({"error": "invalid token"})
+        try:
+            length = int(environ.get("CONTENT_LENGTH") or 0)
+        except ValueError:
+            raise ValueError("invalid Content-Length")
+        if length > self._ALERT_MAX_BODY_BYTES:
+            raise ValueError("payload too large")
+        try:
+            payload = json.loads(environ["wsgi.input"].read(length) or b"{}")
+        except json.JSONDecodeError:
+            raise ValueError("invalid JSON")
+        if not isinstance(payload, dict) or not isinstance(payload.get("alerts"), list):
+            raise ValueError("expected an Alertmanager webhook payload")
+
+        received = time.monotonic()
+        due, counts = self._alert_inbox.receive(payload["alerts"], received)
+        for result, n in counts.items():
+            if n:
+                ALERTS_RECEIVED_TOTAL.labels(result=result).inc(n)
+        ALERTS_FIRING.set(self._alert_inbox.firing(received))
+        _log("info", "Alertmanager webhook", group=payload.get("groupKey"), status=payload.get("status"), **counts)
+        if due:
+            with self._alert_lock:
+                schedule = not self._alert_pending
+                for alert in due:
+                    self._alert_pending.setdefault(alert["fingerprint"], (received, alert))
+            if schedule:
+                self._alert_pool.submit(self._triage_alerts)
+        return "200 OK", "application/json", _json_body(counts)
+
+    # Alert labels that name a container (cAdvisor uses "name"; scrape configs here set "service")
+    _ALERT_CONTAINER_LABELS = ("container", "container_name", "name", "service")
+
+    def _alert_sources(self, alerts: List[Dict[str, Any]]) -> List[CollectionSource]:
+        """
+        Targeted snapshot for a batch of alerts: the down_targets query, the Docker hosts
+        named by a host label or running a container the alerts name, and the HTTP checks
+        whose host is a label value or a named container. Alerts that match neither a host
+        nor a check get every Docker host and HTTP check.
+        """
+        labels = [a["labels"] for a in alerts]
+        containers = {l.get(k) for l in labels for k in self._ALERT_CONTAINER_LABELS} - {None, ""}
+        hosts = {l.get("host") for l in labels} & set(self.docker_hosts)
+        if containers:
+            with self._latest_lock:
+                known = list((self._latest.get("docker_health") or {}).get("containers") or [])
+            hosts |= {c.get("host") for c in known if c.get("name") in containers}
+        # instance is usually host:port; the host part is what an HTTP check URL carries
+        values = {v for l in labels for v in l.values()} | {
+            l["instance"].rsplit(":", 1)[0] for l in labels if l.get("instance")
+        }
+        docker = [s for s in self._docker_sources() if s.name.split(":", 1)[1] in hosts]
+        http = [
+            source for source, check in zip(self._http_sources(), self.http_checks)
+            if (urlparse(check["url"]).hostname or check["url"]) in values
+        ]
+        if not docker and not http:
+            docker, http = self._docker_sources(), self._http_sources()
+        return docker + [s for s in self._prom_sources() if s.name == "down_targets"] + http
+
+    def _triage_alerts(self) -> None:
+        with self._alert_lock:
+            batch, self._alert_pending = self._alert_pending, {}
+        if not batch or not self.llm_enabled:
+            return
+        alerts = [alert for _, alert in batch.values()]
+        names = sorted({a["alertname"] for a in alerts})
+        if not self._alert_triage_bucket.take(time.time()):
+            # Left untriaged: Alertmanager's next re-send makes them due again
+            ALERT_TRIAGE_REQUESTS_TOTAL.labels(result="throttled").inc()
+            _log("warn", "Alert triage rate-limited; left to polling and the next re-send", alerts=names)
+            return
+        try:
+            snapshot = self.gather_snapshot_with_logs(self._refresh(self._alert_sources(alerts)))
+            snapshot["alerts"] = alerts
+            self._alert_inbox.mark_triaged(batch)
+            self._request_triage("alert", snapshot)
+        except Exception as e:
+            _log("error", "Alert triage failed", alerts=names, error=str(e))
+            return
+        ALERT_TRIAGE_REQUESTS_TOTAL.labels(result="triaged").inc()
+        ALERT_TO_TRIAGE_SECONDS.observe(time.monotonic() - min(received for received, _ in batch.values()))
+        _log("info", "Alert triage requested", alerts=names)
+
+    def _http_incidents(self, environ: Dict[str, Any], rest: str) -> Tuple[str, str, bytes]:
+        """
+        GET /incidents?container=&severity=&fingerprint=&since=&until=&limit=
+        GET /incidents/stats?since=&until=
+        GET /incidents/<id> (JSON) and /incidents/<id>.md (markdown report)
+        """
+        store = self._incident_store
+        params = {k: v[-1] for k, v in parse_qs(environ.get("QUERY_STRING", "")).items()}
+        since, until = _query_time(params.get("since")), _query_time(params.get("until"))
+        if not rest:
+            try:
+                limit = int(params.get("limit", 50))
+            except ValueError:
+                raise ValueError("limit must be an integer")
+            incidents = store.query(
+                container=params.get("container"),
+                severity=params.get("severity"),
+                fingerprint=params.get("fingerprint"),
+                since=since,
+                until=until,
+                limit=limit,
+            )
+            return "200 OK", "application/json", _json_body({"incidents": incidents})
+        if rest == "stats":
+            return "200 OK", "application/json", _json_body(store.stats(since=since, until=until))
+        incident_id, markdown = (rest[:-3], True) if rest.endswith(".md") else (rest, False)
+        incident = store.get(int(incident_id)) if incident_id.isdigit() else None
+        if incident is None:
+            return "404 Not Found", "application/json", _json_body({"error": "incident not found"})
+        if markdown:
+            return "200 OK", "text/markdown; charset=utf-8", IncidentStore.render_markdown(incident).encode("utf-8")
+        return "200 OK", "application/json", _json_body(incident)
 
     def run_forever(self) -> None:
         # Start Prometheus metrics HTTP server in background
         metrics_port = _env_int("AI_MONITOR_METRICS_PORT", 8000)
-        Thread(target=start_http_server, args=(metrics_port,), daemon=True).start()
+        self._build_http_server(metrics_port).start()
         _log("info", "Prometheus metrics server started", port=metrics_port)
+        if self._incident_store is not None:
+            self._incident_store.start()
         
         if self.use_claude:
             llm_backend = "claude"
@@ -837,14 +5432,25 @@ class AiMonitor:
             interval_seconds=self.interval_seconds,
             execute=self.execute,
             allowed_containers=sorted(self.allowed_containers),
+            docker_hosts={name: host.url for name, host in self.docker_hosts.items()},
+            mqtt_url=self._mqtt.url if self._mqtt is not None else None,
+            freshness={p.store: sorted(p.databases) for p in self._freshness_probes},
         )
 
-        while True:
-            try:
-                self.run_once()
-            except Exception as e:
-                _log("error", "Run loop error", error=str(e))
-            time.sleep(self.interval_seconds)
+        self._scheduler = self._build_scheduler()
+        _log(
+            "info",
+            "Scheduler configured",
+            tasks={t.name: t.interval_seconds for t in self._scheduler.tasks.values()},
+        )
+        for host in self.docker_hosts.values():
+            if host.table is not None:
+                host.table.start()
+        if self._mqtt is not None:
+            self._mqtt.start()
+        self._triage_worker.start()
+        signal.signal(signal.SIGTERM, self._on_sigterm)
+        self._scheduler.run_forever()
 
 
 if __name__ == "__main__":